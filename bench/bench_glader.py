@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+""" bench_glader.py
+    Times Glader's parsing and code generation for synthetic glade files,
+    and prints results as JSON, so they can be compared between commits.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from docopt import docopt
+
+NAME = 'Glader Benchmark'
+VERSION = '0.0.1'
+VERSIONSTR = f'{NAME} v. {VERSION}'
+SCRIPT = os.path.split(os.path.abspath(sys.argv[0]))[1]
+SCRIPTDIR = os.path.abspath(sys.path[0])
+GLADERDIR = os.path.split(SCRIPTDIR)[0]
+
+if GLADERDIR not in sys.path:
+    sys.path.insert(0, GLADERDIR)
+
+from glade_gen import generate_glade  # noqa
+from glader_core import __version__  # noqa
+from glader_util import GladeFile  # noqa
+
+USAGESTR = f"""{VERSIONSTR}
+    Usage:
+        {SCRIPT} -h | -v
+        {SCRIPT} [-c file] [-o sizes] [-d num] [-s num] [-w num] [-r num]
+                 [-n num] [-j file]
+
+    Options:
+        -c file,--compare file  : Compare results to a JSON file from an
+                                  earlier run.
+        -d num,--depth num      : Nesting depth of objects.
+                                  Default: 3
+        -h,--help               : Show this help message.
+        -j file,--json file     : Write JSON results to a file.
+                                  Default: stdout
+        -n num,--runs num       : Number of runs for each timing.
+                                  The best time is reported.
+                                  Default: 5
+        -o sizes,--objects sizes
+                                : Comma-separated object counts.
+                                  Default: 100,1000,5000
+        -r num,--requires num   : Number of extra <requires> libraries.
+                                  Default: 1
+        -s num,--signals num    : Signals for each object.
+                                  Default: 2
+        -v,--version            : Show version.
+        -w num,--windows num    : Number of top-level windows.
+                                  Default: 2
+"""
+
+# Fixed date for generated code, so every run renders the same content.
+BENCH_DATE = '01-01-2020'
+
+
+def main(argd):
+    """ Main entry point, expects docopt arg dict as argd. """
+    sizes = [
+        parse_int(s)
+        for s in (argd['--objects'] or '100,1000,5000').split(',')
+        if s.strip()
+    ]
+    params = {
+        'depth': parse_int(argd['--depth'], default=3),
+        'signals': parse_int(argd['--signals'], default=2),
+        'windows': parse_int(argd['--windows'], default=2),
+        'requires': parse_int(argd['--requires'], default=1),
+    }
+    runs = parse_int(argd['--runs'], default=5)
+    results = {}
+    with tempfile.TemporaryDirectory() as dirpath:
+        for size in sizes:
+            filepath = os.path.join(dirpath, f'bench_{size}.glade')
+            with open(filepath, 'w') as f:
+                f.write(generate_glade(objects=size, **params))
+            timings = results[str(size)] = bench_file(filepath, runs=runs)
+            print_status(f'{size} objects: ' + ', '.join(
+                f'{name}: {duration * 1000:.2f}ms'
+                for name, duration in timings.items()
+            ))
+
+    report = {
+        'glader_version': __version__,
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'params': dict(params, runs=runs),
+        'results': results,
+    }
+    content = json.dumps(report, indent=4, sort_keys=True)
+    if argd['--json']:
+        with open(argd['--json'], 'w') as f:
+            f.write(content)
+    else:
+        print(content)
+    if argd['--compare']:
+        return compare_results(argd['--compare'], report)
+    return 0
+
+
+def bench_file(filepath, runs=5):
+    """ Time each operation on a glade file, and return a dict of
+        {name: best_seconds}.
+    """
+    gladefile = GladeFile(filepath)
+    gladefile_dynamic = GladeFile(filepath, dynamic_init=True)
+    timings = {
+        'parse': lambda: GladeFile(filepath),
+        'parse_dom': lambda: GladeFile(filepath, streaming=False),
+        'app_window': gladefile.get_app_window,
+        'content_static': lambda: gladefile.get_content(date=BENCH_DATE),
+        'content_dynamic': lambda: gladefile_dynamic.get_content(
+            date=BENCH_DATE,
+        ),
+        'content_lib': lambda: gladefile.get_content(
+            lib_mode=True,
+            date=BENCH_DATE,
+        ),
+        'layout': lambda: repr(gladefile),
+    }
+    return {
+        name: round(best_time(func, runs=runs), 6)
+        for name, func in timings.items()
+    }
+
+
+def best_time(func, runs=5):
+    """ Return the best time for calling a function, in seconds. """
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        duration = time.perf_counter() - start
+        if (best is None) or (duration < best):
+            best = duration
+    return best
+
+
+def compare_results(filepath, report):
+    """ Print the ratio of new/old times for each size and timing.
+        Returns an exit status code.
+    """
+    try:
+        with open(filepath, 'r') as f:
+            old = json.load(f)
+    except (EnvironmentError, ValueError) as ex:
+        print_status(f'\nUnable to load results: {filepath}\n{ex}')
+        return 1
+    print_status(
+        f'\nCompared to {old.get("commit", None) or filepath} '
+        '(new / old, lower is better):'
+    )
+    for size, timings in report['results'].items():
+        oldtimings = old.get('results', {}).get(size, None)
+        if not oldtimings:
+            print_status(f'{size:>8}: no old results.')
+            continue
+        ratios = ', '.join(
+            f'{name}: {duration / oldtimings[name]:.2f}x'
+            for name, duration in timings.items()
+            if oldtimings.get(name, None)
+        )
+        print_status(f'{size:>8}: {ratios}')
+    return 0
+
+
+def git_commit():
+    """ Return the current git commit for Glader, or None. """
+    try:
+        proc = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=GLADERDIR,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        )
+    except EnvironmentError:
+        return None
+    return proc.stdout.strip() or None
+
+
+def parse_int(s, default=None):
+    """ Parse an integer from a command-line argument, or exit. """
+    if s is None:
+        return default
+    try:
+        return int(s)
+    except ValueError:
+        print_status(f'\nInvalid number: {s}')
+        sys.exit(1)
+
+
+def print_status(*args, **kwargs):
+    """ Print progress to stderr, so stdout is only JSON. """
+    kwargs['file'] = kwargs.get('file', sys.stderr)
+    print(*args, **kwargs)
+
+
+if __name__ == '__main__':
+    mainret = main(docopt(USAGESTR, version=VERSIONSTR))
+    sys.exit(mainret)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+""" bench_lazy.py
+    Measures start up time for generated App classes, with static init
+    (every object is taken from the builder in __init__()), lazy init
+    (objects are taken from the builder when first used), and lazy init
+    with lazy windows (sibling windows are created when first used).
+    This needs PyGObject, Gtk 3, and a display (use xvfb-run when there is
+    no display).
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from docopt import docopt
+
+NAME = 'Glader Lazy Init Benchmark'
+VERSION = '0.0.1'
+VERSIONSTR = f'{NAME} v. {VERSION}'
+SCRIPT = os.path.split(os.path.abspath(sys.argv[0]))[1]
+SCRIPTDIR = os.path.abspath(sys.path[0])
+GLADERDIR = os.path.split(SCRIPTDIR)[0]
+
+USAGESTR = f"""{VERSIONSTR}
+    Usage:
+        {SCRIPT} -h | -v
+        {SCRIPT} [-o sizes] [-d num] [-r num] [-w num] [-j]
+
+    Options:
+        -d num,--depth num      : Nesting depth of objects.
+                                  Default: 3
+        -h,--help               : Show this help message.
+        -j,--json               : Print results as JSON.
+        -o sizes,--objects sizes
+                                : Comma-separated object counts.
+                                  Default: 100,600,2000
+        -r num,--repeat num     : Runs for each measurement, the fastest
+                                  run is used.
+                                  Default: 5
+        -v,--version            : Show version.
+        -w num,--windows num    : Number of top-level windows.
+                                  Default: 1
+"""
+
+# Init modes to compare, with their GladeFile() arguments.
+MODES = {
+    'static': {},
+    'lazy': {'lazy_init': True},
+    'lazy_win': {'lazy_init': True, 'lazy_windows': True},
+}
+
+# Runs in a fresh interpreter for each measurement, so nothing is shared
+# between runs. Prints JSON with times in seconds.
+MEASURE_CODE = """
+import importlib, json, sys, time
+sys.path.insert(0, sys.argv[1])
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gtk
+if not Gtk.init_check(sys.argv)[0]:
+    sys.exit('Unable to initialize Gtk, is there a display?')
+start = time.perf_counter()
+module = importlib.import_module(sys.argv[2])
+imported = time.perf_counter()
+app = module.App()
+created = time.perf_counter()
+# Use one object, like a signal handler would.
+getattr(app, sys.argv[3])
+used = time.perf_counter()
+print(json.dumps({
+    'import': imported - start,
+    'init': created - imported,
+    'first_use': used - created,
+}))
+"""
+
+
+def main(argd):
+    """ Main entry point, expects docopt arg dict as argd. """
+    sys.path.insert(0, SCRIPTDIR)
+    sys.path.insert(0, GLADERDIR)
+    from glade_gen import generate_glade
+    from glader_util import GladeFile
+
+    sizes = [
+        int(s)
+        for s in (argd['--objects'] or '100,600,2000').split(',')
+        if s.strip()
+    ]
+    depth = int(argd['--depth'] or 3)
+    repeat = max(int(argd['--repeat'] or 5), 1)
+    windows = max(int(argd['--windows'] or 1), 1)
+    results = {}
+    with tempfile.TemporaryDirectory() as dirpath:
+        for size in sizes:
+            filepath = os.path.join(dirpath, f'bench_{size}.glade')
+            with open(filepath, 'w') as f:
+                f.write(generate_glade(
+                    objects=size,
+                    depth=depth,
+                    signals=1,
+                    windows=windows,
+                ))
+            results[str(size)] = {}
+            for mode, kwargs in MODES.items():
+                modname = f'bench_{mode}_{size}'
+                gladefile = GladeFile(filepath, **kwargs)
+                with open(os.path.join(dirpath, f'{modname}.py'), 'w') as f:
+                    f.write(gladefile.get_content(
+                        lib_mode=True,
+                        date='01-01-2020',
+                    ))
+                results[str(size)][mode] = measure(
+                    dirpath,
+                    modname,
+                    'btn_0_0',
+                    repeat=repeat,
+                )
+    if argd['--json']:
+        print(json.dumps(results, indent=4, sort_keys=True))
+        return 0
+    print(f'{"objects":>8} {"mode":<8} {"import":>10} {"init":>10} '
+          f'{"first use":>10}')
+    for size, modes in results.items():
+        for mode, result in modes.items():
+            print(
+                f'{size:>8} {mode:<8} '
+                f'{result["import"] * 1000:>8.2f}ms '
+                f'{result["init"] * 1000:>8.2f}ms '
+                f'{result["first_use"] * 1000:>8.3f}ms'
+            )
+    return 0
+
+
+def measure(dirpath, modname, objname, repeat=5):
+    """ Import a generated module and create it's App in a fresh
+        interpreter, `repeat` times, and return the fastest times.
+    """
+    best = {}
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, '-c', MEASURE_CODE, dirpath, modname, objname],
+            stdout=subprocess.PIPE,
+            # Gtk warns about windows with more than one child.
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        if proc.returncode != 0:
+            lines = proc.stderr.strip().splitlines() or [modname]
+            raise SystemExit(f'Measurement failed: {lines[-1]}')
+        for key, value in json.loads(proc.stdout).items():
+            best[key] = min(best.get(key, value), value)
+    return best
+
+
+if __name__ == '__main__':
+    mainret = main(docopt(USAGESTR, version=VERSIONSTR))
+    sys.exit(mainret)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+""" bench_memory.py
+    Measures peak memory use (RSS) and pickled size for parsing large
+    synthetic glade files with Glader.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from docopt import docopt
+
+NAME = 'Glader Memory Benchmark'
+VERSION = '0.0.1'
+VERSIONSTR = f'{NAME} v. {VERSION}'
+SCRIPT = os.path.split(os.path.abspath(sys.argv[0]))[1]
+SCRIPTDIR = os.path.abspath(sys.path[0])
+GLADERDIR = os.path.split(SCRIPTDIR)[0]
+
+USAGESTR = f"""{VERSIONSTR}
+    Usage:
+        {SCRIPT} -h | -v
+        {SCRIPT} [-o sizes] [-d num] [-s num] [-j]
+
+    Options:
+        -d num,--depth num      : Nesting depth of objects.
+                                  Default: 3
+        -h,--help               : Show this help message.
+        -j,--json               : Print results as JSON.
+        -o sizes,--objects sizes
+                                : Comma-separated object counts.
+                                  Default: 50000
+        -s num,--signals num    : Signals for each object.
+                                  Default: 2
+        -v,--version            : Show version.
+"""
+
+# Runs in a fresh interpreter for each measurement, so peak RSS is only
+# for that measurement. Prints JSON.
+MEASURE_CODE = """
+import json, pickle, resource, sys
+sys.path.insert(0, sys.argv[1])
+from glader_util import GladeFile
+base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+gladefile = GladeFile(sys.argv[2], streaming=sys.argv[3] == 'streaming')
+# Build every view, like code generation does.
+gladefile.get_content(date='01-01-2020')
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    'base_rss_kb': base,
+    'peak_rss_kb': peak,
+    'model_rss_kb': peak - base,
+    'pickle_kb': len(pickle.dumps(gladefile.nodes, protocol=-1)) // 1024,
+}))
+"""
+
+
+def main(argd):
+    """ Main entry point, expects docopt arg dict as argd. """
+    sys.path.insert(0, SCRIPTDIR)
+    from glade_gen import generate_glade
+
+    sizes = [
+        int(s)
+        for s in (argd['--objects'] or '50000').split(',')
+        if s.strip()
+    ]
+    depth = int(argd['--depth'] or 3)
+    signals = int(argd['--signals'] or 2)
+    results = {}
+    with tempfile.TemporaryDirectory() as dirpath:
+        for size in sizes:
+            filepath = os.path.join(dirpath, f'bench_{size}.glade')
+            with open(filepath, 'w') as f:
+                f.write(generate_glade(
+                    objects=size,
+                    depth=depth,
+                    signals=signals,
+                ))
+            results[str(size)] = {
+                mode: measure(filepath, mode)
+                for mode in ('streaming', 'dom')
+            }
+    if argd['--json']:
+        print(json.dumps(results, indent=4, sort_keys=True))
+        return 0
+    print(f'{"objects":>8} {"mode":<10} {"peak RSS":>12} {"model RSS":>12} '
+          f'{"pickle":>10}')
+    for size, modes in results.items():
+        for mode, result in modes.items():
+            print(
+                f'{size:>8} {mode:<10} '
+                f'{result["peak_rss_kb"] / 1024:>10.1f}MB '
+                f'{result["model_rss_kb"] / 1024:>10.1f}MB '
+                f'{result["pickle_kb"] / 1024:>8.1f}MB'
+            )
+    return 0
+
+
+def measure(filepath, mode):
+    """ Parse a glade file in a fresh interpreter, and return it's memory
+        use.
+    """
+    proc = subprocess.run(
+        [sys.executable, '-c', MEASURE_CODE, GLADERDIR, filepath, mode],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    return json.loads(proc.stdout)
+
+
+if __name__ == '__main__':
+    mainret = main(docopt(USAGESTR, version=VERSIONSTR))
+    sys.exit(mainret)
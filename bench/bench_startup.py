@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+""" bench_startup.py
+    Measures Glader start up time for each command, using
+    `python -X importtime`. With --gui, the time until the GUI's window is
+    shown is measured too (this needs Gtk and a display, or xvfb-run).
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+from docopt import docopt
+
+NAME = 'Glader Startup Benchmark'
+VERSION = '0.0.1'
+VERSIONSTR = f'{NAME} v. {VERSION}'
+SCRIPT = os.path.split(os.path.abspath(sys.argv[0]))[1]
+SCRIPTDIR = os.path.abspath(sys.path[0])
+GLADERDIR = os.path.split(SCRIPTDIR)[0]
+GLADER_PY_FILE = os.path.join(GLADERDIR, 'glader.py')
+GLADER_GLADE_FILE = os.path.join(GLADERDIR, 'glader.glade')
+
+USAGESTR = f"""{VERSIONSTR}
+    Usage:
+        {SCRIPT} -h | -v
+        {SCRIPT} [FILE] [-g] [-j] [-r num]
+
+    Options:
+        FILE                : Glade file to use for commands that need one.
+                              Default: {GLADER_GLADE_FILE}
+        -g,--gui            : Measure GUI start up time too.
+        -h,--help           : Show this help message.
+        -j,--json           : Print results as JSON.
+        -r num,--runs num   : Number of runs for each command.
+                              The best time is reported.
+                              Default: 5
+        -v,--version        : Show version.
+"""
+
+# Modules that only some commands should need.
+HEAVY_MODULES = (
+    'easysettings',
+    'gi.repository.GObject',
+    'gi.repository.Gtk',
+    'gi.repository.GtkSource',
+    'gi.repository.Pango',
+    'glader_ui',
+    'lxml.etree',
+    'pygments',
+)
+
+# Runs in a fresh interpreter for each GUI measurement. Prints JSON with
+# times in seconds, from the start of the import.
+GUI_CODE = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import glader_ui
+from glader_ui import GLib, Gtk
+times = {'import': time.perf_counter() - start}
+
+
+def drawn(widget, cr):
+    if 'shown' not in times:
+        times['shown'] = time.perf_counter() - start
+        # Idle callbacks run in order, so this runs after App.load_deferred.
+        GLib.idle_add(ready)
+    return False
+
+
+def ready():
+    times['ready'] = time.perf_counter() - start
+    Gtk.main_quit()
+    return False
+
+
+app = glader_ui.App(filepath=sys.argv[2])
+times['init'] = time.perf_counter() - start - times['import']
+app.winMain.connect('draw', drawn)
+Gtk.main()
+print(json.dumps(times))
+"""
+
+# Matches `-X importtime` lines: import time: self | cumulative | name
+importtime_pat = re.compile(
+    r'^import time:\s+(?P<self>\d+) \|'
+    r'\s+(?P<cumulative>\d+) \|'
+    r'\s+(?P<name>\S+)'
+)
+
+
+def main(argd):
+    """ Main entry point, expects docopt arg dict as argd. """
+    filepath = argd['FILE'] or GLADER_GLADE_FILE
+    runs = parse_int(argd['--runs'], default=5)
+    commands = (
+        ('version', ['-v']),
+        ('help', ['-h']),
+        ('cmdline', [filepath, '-', '--no-cache']),
+        ('cmdline-cached', [filepath, '-']),
+        ('layout', [filepath, '--layout', '--no-cache']),
+        ('highlight', [filepath, '--highlight', '--no-cache']),
+    )
+    results = {
+        name: bench_command(args, runs=runs)
+        for name, args in commands
+    }
+    gui = bench_gui(filepath, runs=runs) if argd['--gui'] else None
+    if argd['--json']:
+        print(json.dumps(
+            {
+                'python': sys.version.split()[0],
+                'runs': runs,
+                'results': results,
+                'gui': gui,
+            },
+            indent=4,
+            sort_keys=True,
+        ))
+    else:
+        print_results(results)
+        if gui:
+            print_gui_results(gui)
+    return 0
+
+
+def bench_command(args, runs=5):
+    """ Run glader.py with arguments `runs` times, and return the best
+        wall time, import time, and imported modules.
+    """
+    cmd = [sys.executable, '-X', 'importtime', GLADER_PY_FILE]
+    cmd.extend(args)
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        duration = time.perf_counter() - start
+        if (best is None) or (duration < best['wall']):
+            best = {'wall': duration, 'stderr': proc.stderr}
+
+    imports = parse_importtime(best['stderr'])
+    return {
+        'wall_ms': round(best['wall'] * 1000, 2),
+        'import_ms': round(sum(imports.values()) / 1000, 2),
+        'modules': len(imports),
+        'heavy': [m for m in HEAVY_MODULES if m in imports],
+    }
+
+
+def bench_gui(filepath, runs=5):
+    """ Start the GUI `runs` times, and return the best times for importing
+        glader_ui, creating the App, showing the window, and finishing the
+        loading that is done after the window is shown.
+    """
+    best = {}
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, '-c', GUI_CODE, GLADERDIR, filepath],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        if proc.returncode != 0:
+            lines = proc.stderr.strip().splitlines() or ['GUI failed.']
+            raise SystemExit(f'GUI measurement failed: {lines[-1]}')
+        for key, value in json.loads(proc.stdout).items():
+            best[key] = min(best.get(key, value), value)
+    return {f'{key}_ms': round(value * 1000, 2) for key, value in best.items()}
+
+
+def parse_importtime(output):
+    """ Parse `-X importtime` output into a dict of
+        {module_name: self_microseconds}
+    """
+    imports = {}
+    for line in output.splitlines():
+        match = importtime_pat.match(line)
+        if match is None:
+            continue
+        imports[match.group('name')] = int(match.group('self'))
+    return imports
+
+
+def parse_int(s, default=None):
+    """ Parse an integer from a command-line argument, or exit. """
+    if s is None:
+        return default
+    try:
+        return int(s)
+    except ValueError:
+        print(f'\nInvalid number: {s}', file=sys.stderr)
+        sys.exit(1)
+
+
+def print_gui_results(gui):
+    """ Print GUI start up times. """
+    print('\ngui:')
+    for key in ('import_ms', 'init_ms', 'shown_ms', 'ready_ms'):
+        print(f'    {key[:-3]:<12} {gui[key]:>9.2f}ms')
+
+
+def print_results(results):
+    """ Print benchmark results as a table. """
+    print(f'{"command":<16} {"wall ms":>9} {"import ms":>10} {"modules":>8}')
+    for name, result in results.items():
+        print(
+            f'{name:<16} {result["wall_ms"]:>9.2f} '
+            f'{result["import_ms"]:>10.2f} {result["modules"]:>8}'
+        )
+        if result['heavy']:
+            print(f'    {", ".join(result["heavy"])}')
+
+
+if __name__ == '__main__':
+    mainret = main(docopt(USAGESTR, version=VERSIONSTR))
+    sys.exit(mainret)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+""" glade_gen.py
+    Generates synthetic glade files for benchmarking Glader.
+"""
+
+import os
+import sys
+
+from docopt import docopt
+
+NAME = 'Glade Generator'
+VERSION = '0.0.1'
+VERSIONSTR = f'{NAME} v. {VERSION}'
+SCRIPT = os.path.split(os.path.abspath(sys.argv[0]))[1]
+
+USAGESTR = f"""{VERSIONSTR}
+    Usage:
+        {SCRIPT} -h | -v
+        {SCRIPT} [FILE] [-o num] [-d num] [-s num] [-w num] [-r num]
+
+    Options:
+        FILE                    : File to write. Default: stdout
+        -d num,--depth num      : Nesting depth of objects in each window.
+                                  Default: 3
+        -h,--help               : Show this help message.
+        -o num,--objects num    : Number of objects, not including windows.
+                                  Default: 100
+        -r num,--requires num   : Number of extra <requires> libraries.
+                                  Default: 0
+        -s num,--signals num    : Signals for each object.
+                                  Default: 1
+        -v,--version            : Show version.
+        -w num,--windows num    : Number of top-level windows.
+                                  Default: 1
+"""
+
+# Gtk.Widget signals, which every generated object has.
+SIGNAL_NAMES = (
+    'show',
+    'hide',
+    'map',
+    'unmap',
+    'realize',
+    'unrealize',
+    'focus',
+    'grab-focus',
+)
+
+
+def main(argd):
+    """ Main entry point, expects docopt arg dict as argd. """
+    try:
+        content = generate_glade(
+            objects=parse_int(argd['--objects'], default=100),
+            depth=parse_int(argd['--depth'], default=3),
+            signals=parse_int(argd['--signals'], default=1),
+            windows=parse_int(argd['--windows'], default=1),
+            requires=parse_int(argd['--requires'], default=0),
+        )
+    except ValueError as ex:
+        print(f'\n{ex}', file=sys.stderr)
+        return 1
+    if not argd['FILE']:
+        print(content)
+        return 0
+    with open(argd['FILE'], 'w') as f:
+        f.write(content)
+    return 0
+
+
+def generate_glade(objects=100, depth=3, signals=1, windows=1, requires=0):
+    """ Return glade xml with `windows` top-level windows holding
+        `objects` objects (spread evenly between them), nested `depth`
+        levels deep, with `signals` signals for each object.
+        Containers are GtkGrids, and the inner-most objects are GtkButtons.
+        The first window is 'winMain', the others are GtkDialogs.
+    """
+    if (depth < 1) or (windows < 1):
+        raise ValueError('Depth and windows must be at least 1.')
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<interface>',
+        '  <requires lib="gtk+" version="3.20"/>',
+    ]
+    lines.extend(
+        f'  <requires lib="benchlib{i}" version="1.0"/>'
+        for i in range(requires)
+    )
+    counts = [objects // windows] * windows
+    for i in range(objects % windows):
+        counts[i] += 1
+    for win, count in enumerate(counts):
+        if win == 0:
+            winid, winclass = 'winMain', 'GtkWindow'
+        else:
+            winid, winclass = f'dlg{win}', 'GtkDialog'
+        lines.append(f'  <object class="{winclass}" id="{winid}">')
+        lines.extend(signal_lines(winid, signals, indent=4))
+        lines.extend(object_lines(win, count, depth, signals))
+        lines.append('  </object>')
+    lines.append('</interface>')
+    return '\n'.join(lines)
+
+
+def object_lines(win, count, depth, signals):
+    """ Yield xml lines for `count` objects in window number `win`, in
+        chains that are `depth` objects deep.
+    """
+    made = 0
+    chain = 0
+    while made < count:
+        levels = min(depth, count - made)
+        for level in range(levels):
+            indent = 4 + (level * 4)
+            spaces = ' ' * indent
+            if level == (levels - 1):
+                objid, objclass = f'btn_{win}_{chain}', 'GtkButton'
+            else:
+                objid, objclass = f'grid_{win}_{chain}_{level}', 'GtkGrid'
+            yield f'{spaces}<child>'
+            yield f'{spaces}  <object class="{objclass}" id="{objid}">'
+            yield from signal_lines(objid, signals, indent=indent + 4)
+        for level in reversed(range(levels)):
+            spaces = ' ' * (4 + (level * 4))
+            yield f'{spaces}  </object>'
+            yield f'{spaces}</child>'
+        made += levels
+        chain += 1
+
+
+def parse_int(s, default=None):
+    """ Parse a non-negative integer from a command-line argument. """
+    if s is None:
+        return default
+    try:
+        val = int(s)
+        if val < 0:
+            raise ValueError()
+    except ValueError:
+        raise ValueError(f'Invalid number: {s}')
+    return val
+
+
+def signal_lines(objid, count, indent=4):
+    """ Yield xml lines for `count` signals on an object. """
+    spaces = ' ' * indent
+    for i in range(count):
+        signame = SIGNAL_NAMES[i % len(SIGNAL_NAMES)]
+        suffix = '' if i < len(SIGNAL_NAMES) else f'_{i}'
+        handler = f'{objid}_{signame.replace("-", "_")}{suffix}_cb'
+        yield f'{spaces}<signal name="{signame}" handler="{handler}"/>'
+
+
+if __name__ == '__main__':
+    mainret = main(docopt(USAGESTR, version=VERSIONSTR))
+    sys.exit(mainret)
@@ -9,37 +9,25 @@
 import os
 import sys
 import traceback
+from importlib.util import find_spec
+
 from glader_core import (
     VERSIONSTR,
     import_fail,
 )
-from glader_util import GladeFile
-from glader_ui import gui_main
+
+# Other Glader modules are imported by the functions that use them, so
+# each command only pays for what it needs. The GUI (GtkSource, Pango) is
+# never imported for command line use.
 
 try:
     from docopt import docopt
 except ImportError as eximp:
     import_fail(eximp)
 
-try:
-    from pygments import highlight as pyg_highlight
-    from pygments.lexers import get_lexer_by_name
-    from pygments.formatters import Terminal256Formatter
-except ImportError:
-    highlight_warn = 'You must `pip install pygments`.'
-    has_pygments = False
-
-    def highlight_code(code):
-        return code
-else:
-    # For the --highlight option, when pygments is available.
-    pyg_lexer = get_lexer_by_name('python3')
-    pyg_formatter = Terminal256Formatter(bg='dark', style='monokai')
-    highlight_warn = ''
-    has_pygments = True
-
-    def highlight_code(code):
-        return pyg_highlight(code, pyg_lexer, pyg_formatter).rstrip()
+# Pygments is only imported for the --highlight option.
+has_pygments = find_spec('pygments') is not None
+highlight_warn = '' if has_pygments else 'You must `pip install pygments`.'
 
 
 SCRIPT = os.path.split(os.path.abspath(sys.argv[0]))[1]
@@ -48,27 +36,107 @@ SCRIPTDIR = os.path.abspath(sys.path[0])
 USAGESTR = f"""{VERSIONSTR}
     Usage:
         {SCRIPT} -h | -v
-        {SCRIPT} [FILE] [OUTFILE] [-D] [-d] [-g] [-l]
-        {SCRIPT} FILE OUTFILE -o [-D] [-d] [-l]
-        {SCRIPT} FILE [-H | -L] [-D] [-d] [-l]
+        {SCRIPT} -C [-D]
+        {SCRIPT} --build-signature-db [-D]
+        {SCRIPT} --serve [-s path] [-D] [-N]
+        {SCRIPT} -b PATH... [-c] [-j num] [-p pat] [-t date] [-D] [-d] [-l]
+                  [-N] [-o] [-r] [-z] [--lazy-windows] [-T fmt]
+                  [--profile file]
+        {SCRIPT} -w PATH... [-p pat] [-t date] [-D] [-d] [-l] [-N] [-P]
+                  [-z] [--lazy-windows]
+        {SCRIPT} [FILE] [OUTFILE] [-t date] [-D] [-d] [-g] [-l] [-N] [-r]
+                  [-z] [--lazy-windows] [--gladefile path] [-T fmt]
+                  [--profile file]
+        {SCRIPT} FILE OUTFILE (-c | -o) [-t date] [-D] [-d] [-l] [-N] [-r]
+                  [-z] [--lazy-windows] [--gladefile path] [-T fmt]
+                  [--profile file]
+        {SCRIPT} FILE [-H | -L] [-t date] [-D] [-d] [-l] [-N] [-z]
+                  [--lazy-windows] [--gladefile path] [-T fmt]
+                  [--profile file]
 
     Options:
-        FILE            : Glade file to parse.
-        OUTFILE         : File name for output.
-                          If - is given, output will be printed to stdout.
-        -D,--debug      : Show more info on errors.
-        -d,--dynamic    : Use dynamic object initialization method.
-        -g,--gui        : Force use of a GUI, even when an output file is given.
-                          You still have to use the 'Save' button to apply
-                          changes.
-        -H,--highlight  : Syntax highlight the generated code and print to
-                          stdout. {highlight_warn}
-        -h,--help       : Show this help message.
-        -L,--layout     : Show Glader layout for the file.
-        -l,--lib        : Generate a usable Gtk.Window class only, not a
-                          script.
-        -o,--overwrite  : Overwrite existing files without confirmation.
-        -v,--version    : Show version.
+        FILE                    : Glade file to parse.
+                                  If - is given, it is read from stdin.
+        OUTFILE                 : File name for output.
+                                  If - is given, output will be printed to
+                                  stdout.
+        PATH                    : Glade files, directories, or glob patterns
+                                  for --batch or --watch.
+        --build-signature-db    : Introspect all Gtk signal handler
+                                  arguments and save them, so they don't
+                                  need to be looked up for every run.
+        -b,--batch              : Generate code for many glade files, using
+                                  a pool of worker processes.
+        -c,--check              : Don't write anything, exit with a non-zero
+                                  status if any output file is missing or
+                                  out of date. Use a pinned --date or
+                                  $SOURCE_DATE_EPOCH with this.
+        -C,--clear-cache        : Remove all cached glade info and generated
+                                  code.
+        -D,--debug              : Show more info on errors.
+        -d,--dynamic            : Use dynamic object initialization method.
+        -g,--gui                : Force use of a GUI, even when an output
+                                  file is given. You still have to use the
+                                  'Save' button to apply changes.
+        --gladefile path        : Glade file path used by the generated
+                                  code, instead of FILE.
+                                  Default: FILE, or app.glade for stdin
+        -H,--highlight          : Syntax highlight the generated code and
+                                  print to stdout. {highlight_warn}
+        -h,--help               : Show this help message.
+        -j num,--jobs num       : Number of worker processes for --batch.
+                                  Default: number of CPUs
+        -L,--layout             : Show Glader layout for the file.
+        --lazy-windows          : Generate an App class that creates
+                                  sibling windows (dialogs, other
+                                  windows) when they are first used,
+                                  instead of in __init__().
+        -l,--lib                : Generate a usable Gtk.Window class only,
+                                  not a script.
+        -N,--no-cache           : Don't use cached glade info or generated
+                                  code.
+        -o,--overwrite          : Overwrite existing files without
+                                  confirmation. Files are only written
+                                  when their content changes.
+        -P,--poll               : Poll for changes with --watch, instead of
+                                  using inotify.
+        --profile file          : Save cProfile stats for the whole run to
+                                  a file. Read them with:
+                                      python -m pstats <file>
+        -p pat,--pattern pat    : Output file name pattern for --batch or
+                                  --watch.
+                                  {{dir}} is the glade file's directory, and
+                                  {{name}} is it's name without the
+                                  extension.
+                                  Default: {{dir}}/{{name}}.py
+        -r,--gresource          : Bundle the glade file into a GResource
+                                  file next to the output file, with
+                                  glib-compile-resources. The generated
+                                  code memory-maps the bundle and builds
+                                  the UI from it, instead of reading the
+                                  glade file.
+        --serve                 : Generate code for requests from editors
+                                  and build tools, keeping Gtk and parsed
+                                  files loaded between requests. Requests
+                                  are NDJSON on stdin, or on a Unix socket
+                                  with --socket. See README.md.
+        -s path,--socket path   : Unix domain socket to listen on for
+                                  --serve.
+        -T fmt,--timings fmt    : Print the time spent in each phase, and
+                                  counters, to stderr when finished.
+                                  The format can be 'text' or 'json'.
+        -t date,--date date     : Date for generated code (MM-DD-YYYY or
+                                  YYYY-MM-DD), for reproducible output.
+                                  Default: $SOURCE_DATE_EPOCH, or today
+        -v,--version            : Show version.
+        -w,--watch              : Generate code, and generate it again
+                                  whenever a glade file or template
+                                  changes. Existing files are overwritten.
+        -z,--lazy               : Generate classes that only get objects
+                                  from the builder when they are first
+                                  used, instead of all of them in
+                                  __init__(). Can't be used with
+                                  --dynamic.
 
 """
 
@@ -77,23 +145,105 @@ DEBUG = ('-D' in sys.argv) or ('--debug' in sys.argv)
 
 def main(argd):
     """ Main entry point, expects doctopt arg dict as argd """
+    if argd['--timings'] or argd['--profile']:
+        return main_measured(argd)
+    if argd['--clear-cache']:
+        from glader_cache import GladeCache
+        removed = GladeCache().clear()
+        print('Removed {} cache file{}.'.format(
+            removed,
+            '' if removed == 1 else 's',
+        ))
+        return 0
+    if argd['--build-signature-db']:
+        from glader_signatures import build_signature_db
+        return build_signature_db()
+    if argd['--serve']:
+        from glader_serve import do_serve
+        return do_serve(
+            socketpath=argd['--socket'],
+            use_cache=not argd['--no-cache'],
+        )
+    date = parse_date(argd['--date'])
+    if argd['--dynamic'] and argd['--lazy']:
+        print_err('\n--dynamic and --lazy can\'t be used together.')
+        return 1
+    if argd['--batch']:
+        from glader_batch import do_batch
+        return do_batch(
+            argd['PATH'],
+            pattern=argd['--pattern'],
+            jobs=parse_int(argd['--jobs'], name='jobs'),
+            dynamic_init=argd['--dynamic'],
+            lazy_init=argd['--lazy'],
+            lazy_windows=argd['--lazy-windows'],
+            lib_mode=argd['--lib'],
+            overwrite=argd['--overwrite'],
+            use_cache=not argd['--no-cache'],
+            check=argd['--check'],
+            date=date,
+            gresource=argd['--gresource'],
+        )
+    if argd['--watch']:
+        from glader_batch import expand_paths, output_name
+        from glader_watch import do_watch
+        filepaths = expand_paths(argd['PATH'])
+        if not filepaths:
+            print_err('\nNo glade files found.')
+            return 1
+        try:
+            jobs = [
+                (s, output_name(s, argd['--pattern']))
+                for s in filepaths
+            ]
+        except (IndexError, KeyError, ValueError) as ex:
+            print_err(f'\nInvalid output pattern: {argd["--pattern"]}\n{ex!r}')
+            return 1
+        return do_watch(
+            jobs,
+            dynamic_init=argd['--dynamic'],
+            lazy_init=argd['--lazy'],
+            lazy_windows=argd['--lazy-windows'],
+            lib_mode=argd['--lib'],
+            use_cache=not argd['--no-cache'],
+            poll=argd['--poll'],
+            date=date,
+        )
     filepath = argd['FILE']
-    if filepath and (not os.path.exists(filepath)):
+    if filepath and (filepath != '-') and (not os.path.exists(filepath)):
         print('\nFile does not exist: {}'.format(filepath))
         return 1
     cmdline_cmds = argd['--layout'] or argd['--highlight']
     outfile = '-' if cmdline_cmds else argd['OUTFILE']
+    if filepath == '-':
+        if argd['--gui']:
+            print_err('\nThe GUI can\'t read a glade file from stdin.')
+            return 1
+        # Stdin is always for the command line, printing to stdout.
+        outfile = outfile or '-'
     # Automatic command line when outputfile is given, unless --gui is used.
     if (cmdline_cmds or outfile) and not argd['--gui']:
         # Cmdline version.
+        if argd['--no-cache']:
+            cache = None
+        else:
+            from glader_cache import GladeCache
+            cache = GladeCache()
         return do_cmdline(
             filepath,
             outputfile=outfile,
             dynamic_init=argd['--dynamic'],
+            lazy_init=argd['--lazy'],
+            lazy_windows=argd['--lazy-windows'],
             lib_mode=argd['--lib'],
             overwrite=argd['--overwrite'],
             highlight=argd['--highlight'],
             layout=argd['--layout'],
+            cache=cache,
+            check=argd['--check'],
+            date=date,
+            gresource=argd['--gresource'],
+            gladefile=argd['--gladefile'],
         )
 
     # Full gui. Function exits the program when finished.
@@ -108,6 +258,31 @@ def main(argd):
     )
 
 
+def main_measured(argd):
+    """ Run main() with timings and/or profiling, for --timings and
+        --profile.
+    """
+    from glader_timings import profile_call, timings
+    fmt = argd['--timings']
+    if fmt not in (None, 'text', 'json'):
+        print_err(f'\nInvalid timings format, expecting text or json: {fmt}')
+        return 1
+    profilefile = argd['--profile']
+    argd = dict(argd)
+    argd['--timings'] = argd['--profile'] = None
+    timings.reset()
+    with timings.phase('total'):
+        if profilefile:
+            ret = profile_call(profilefile, main, argd)
+        else:
+            ret = main(argd)
+    if profilefile:
+        print_err(f'Profile stats saved: {profilefile}')
+    if fmt:
+        print_err(timings.format(fmt))
+    return ret
+
+
 def confirm(question):
     """ Confirm an action with a yes/no question. """
     ans = input('{} (y/N): '.format(question)).strip().lower()
@@ -116,18 +291,29 @@ def confirm(question):
 
 def do_cmdline(
         filepath, outputfile=None, dynamic_init=False, lib_mode=False,
-        overwrite=False, highlight=False, layout=False):
+        overwrite=False, highlight=False, layout=False, cache=None,
+        check=False, date=None, gresource=False, lazy_init=False,
+        lazy_windows=False, gladefile=None):
     """ Just run the cmdline version. """
     if not filepath:
         print_err('\nNo filepath provided!')
         return 1
-    if outputfile and os.path.exists(outputfile) and (not overwrite):
-        msg = '\nFile exists: {}\n\nOverwrite it?'.format(outputfile)
-        if not confirm(msg):
-            print('\nUser cancelled.\n')
-            return 1
+    if check and outputfile.startswith('-'):
+        print_err('\nAn output file is needed for --check.')
+        return 1
+    if gresource and ((filepath == '-') or gladefile):
+        # The bundle is compiled from the file, and replaces the path.
+        print_err('\n--gresource needs a glade file, without --gladefile.')
+        return 1
 
-    fileinfo = get_gladeinfo(filepath, dynamic_init)
+    fileinfo = get_gladeinfo(
+        filepath,
+        dynamic_init,
+        cache=cache,
+        lazy_init=lazy_init,
+        lazy_windows=lazy_windows,
+        gladefile=gladefile,
+    )
     if not fileinfo:
         print('\nNo usable info was found for this file: {}'.format(filepath))
         return 1
@@ -136,34 +322,91 @@ def do_cmdline(
         print(repr(fileinfo))
         return 0
 
-    content = fileinfo.get_content(lib_mode=lib_mode)
+    from glader_util import content_changed, write_content, write_stream
+    if gresource:
+        from glader_gresource import bundle_is_current, bundle_name
+        bundle = bundle_name(filepath, outputfile)
+    else:
+        bundle = None
+
+    def chunks():
+        # Code is streamed, so large files are never held in memory.
+        return fileinfo.iter_content(
+            lib_mode=lib_mode,
+            date=date,
+            gresource=os.path.basename(bundle) if bundle else None,
+        )
+
+    if check:
+        if content_changed(outputfile, chunks()):
+            print_err(f'File is out of date: {outputfile}')
+            return 1
+        if bundle and not bundle_is_current(filepath, bundle):
+            print_err(f'Bundle is out of date: {bundle}')
+            return 1
+        print(f'File is up to date: {outputfile}')
+        return 0
     if outputfile.startswith('-'):
         # User wants stdout.
-        print(highlight_code(content) if highlight else content)
+        if bundle and not do_gresource(filepath, bundle, file=sys.stderr):
+            return 1
+        if highlight:
+            content = ''.join(chunks())
+            print(highlight_code(content))
+        else:
+            write_stream(sys.stdout, chunks())
+            print()
     else:
+        if (
+                os.path.exists(outputfile) and
+                (not overwrite) and
+                content_changed(outputfile, chunks())):
+            msg = '\nFile exists: {}\n\nOverwrite it?'.format(outputfile)
+            if not confirm(msg):
+                print('\nUser cancelled.\n')
+                return 1
+        if bundle and not do_gresource(filepath, bundle):
+            return 1
         try:
-            with open(outputfile, 'w')as f:
-                f.write(content)
-            print('File was generated: {}'.format(outputfile))
-        except (PermissionError, EnvironmentError) as ex:
+            written = write_content(outputfile, chunks())
+        except EnvironmentError as ex:
             print_err('\nError writing file: {}\n{}'.format(outputfile, ex))
             return 1
-        try:
-            fileinfo.make_executable(outputfile)
+        if written:
+            print('File was generated: {}'.format(outputfile))
             print('Mode +rwx (774) was set to make it executable.')
-        except (PermissionError, EnvironmentError) as experm:
-            print_err('Unable to make it executable:\n  {}'.format(experm))
+        else:
+            print(f'File is unchanged: {outputfile}')
 
     warnings = fileinfo.warning_msgs()
     if warnings:
         print_err(f'\n{warnings}')
 
-    return 0 if content else 1
+    return 0
+
+
+def do_gresource(filepath, bundle, file=None):
+    """ Compile a glade file into a GResource bundle, and print the result
+        to `file` (stdout by default).
+        Returns True on success.
+    """
+    from glader_gresource import compile_gresource
+    try:
+        written = compile_gresource(filepath, bundle)
+    except EnvironmentError as ex:
+        print_err(f'\nError compiling GResource bundle: {bundle}\n{ex}')
+        return False
+    if written:
+        print(f'Bundle was generated: {bundle}', file=file)
+    else:
+        print(f'Bundle is unchanged: {bundle}', file=file)
+    return True
 
 
 def do_gui(
         filepath=None, outputfile=None, dynamic_init=False, lib_mode=False):
     """ Run the full gui. """
+    from glader_ui import gui_main
     # This function will exit the program when finished.
     gui_main(
         filepath=filepath,
@@ -173,13 +416,35 @@ def do_gui(
     )
 
 
-def get_gladeinfo(filepath, dynamic_init=False):
-    """ Retrieve widget/object info from a glade file. """
+def get_gladeinfo(
+        filepath, dynamic_init=False, cache=None, lazy_init=False,
+        lazy_windows=False, gladefile=None):
+    """ Retrieve widget/object info from a glade file, or from stdin when
+        `filepath` is '-'. If `gladefile` is set, it is the glade file's
+        path in generated code.
+    """
+    from glader_util import GladeFile
     try:
-        gladeinfo = GladeFile(
-            filepath,
-            dynamic_init=dynamic_init,
-        )
+        if filepath == '-':
+            gladeinfo = GladeFile(
+                gladefile,
+                dynamic_init=dynamic_init,
+                cache=cache,
+                lazy_init=lazy_init,
+                lazy_windows=lazy_windows,
+                source=sys.stdin.buffer,
+            )
+        else:
+            gladeinfo = GladeFile(
+                filepath,
+                dynamic_init=dynamic_init,
+                cache=cache,
+                lazy_init=lazy_init,
+                lazy_windows=lazy_windows,
+            )
+            if gladefile:
+                # The parsed file is shared, only the path changes.
+                gladeinfo = gladeinfo.copy(filepath=gladefile)
     except Exception as ex:
         print('\nError parsing glade file!: {}\n{}'.format(filepath, ex))
         if DEBUG:
@@ -188,6 +453,48 @@ def get_gladeinfo(filepath, dynamic_init=False):
     return gladeinfo
 
 
+def highlight_code(code):
+    """ Syntax highlight python code for the terminal, if pygments is
+        available.
+    """
+    if not has_pygments:
+        return code
+    from pygments import highlight as pyg_highlight
+    from pygments.lexers import get_lexer_by_name
+    from pygments.formatters import Terminal256Formatter
+    pyg_lexer = get_lexer_by_name('python3')
+    pyg_formatter = Terminal256Formatter(bg='dark', style='monokai')
+    return pyg_highlight(code, pyg_lexer, pyg_formatter).rstrip()
+
+
+def parse_date(s):
+    """ Parse a --date argument, or exit. Returns None if `s` is None. """
+    if s is None:
+        return None
+    from glader_util import parse_date as util_parse_date
+    try:
+        return util_parse_date(s)
+    except ValueError as ex:
+        print_err(f'\nInvalid date: {ex}')
+        sys.exit(1)
+
+
+def parse_int(s, name='number'):
+    """ Parse a positive integer from a command-line argument, or exit.
+        Returns None if `s` is None.
+    """
+    if s is None:
+        return None
+    try:
+        val = int(s)
+        if val < 1:
+            raise ValueError('Must be at least 1.')
+    except ValueError:
+        print_err(f'\nInvalid {name}, expecting a number > 0: {s}')
+        sys.exit(1)
+    return val
+
+
 def print_err(*args, **kwargs):
     kwargs['file'] = kwargs.get('file', sys.stderr)
     print(*args, **kwargs)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+""" Glader - Async
+    An asyncio front-end for generating code for many glade files. Files
+    are read without blocking the event loop, and parsed and rendered in a
+    thread or process pool, with a limit on how many are in flight.
+"""
+import asyncio
+import os
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+
+from glader_core import debug
+
+# Files that generate_many() reads and generates at once, by default.
+ASYNC_CONCURRENCY = 8
+# Default cache for generate_data(), meaning the process pool worker's cache
+# from glader_batch.init_worker(). It's never sent to a worker, so identity
+# checks work.
+WORKER_CACHE = object()
+
+
+class AsyncResult(object):
+    """ Generated code for one glade file, from generate_many(). """
+    __slots__ = ('filepath', 'content', 'error', 'warnings')
+
+    def __init__(self, filepath, content=None, error=None, warnings=None):
+        self.filepath = filepath
+        # Generated code, or None if it failed.
+        self.content = content
+        # Error message, or None if the code was generated.
+        self.error = error
+        # GladeFile.warning_msgs(), if any.
+        self.warnings = warnings
+
+    def __bool__(self):
+        return self.error is None
+
+    def __repr__(self):
+        return ''.join((
+            f'{type(self).__name__}(',
+            f'{self.filepath!r}, error={self.error!r}',
+            ')',
+        ))
+
+
+async def generate_many(
+        paths, *, dynamic_init=False, lib_mode=False, lazy_init=False,
+        lazy_windows=False, date=None, executor=None, concurrency=None,
+        use_cache=True):
+    """ Generate code for glade files, yielding an AsyncResult for each
+        one as it completes (not in the order of `paths`). Failed files
+        are yielded with an error, instead of raising.
+        Cancelling the task, or closing the generator early, cancels the
+        files that haven't started.
+        Arguments:
+            paths         : An iterable of glade file paths. It is only
+                            consumed as files finish.
+            executor      : 'thread' (the default), 'process', or a
+                            concurrent.futures.Executor to parse and
+                            render in. Threads take turns, because Gtk and
+                            Glader's module-level state are shared (see
+                            glader_util.generate_lock), so 'process' is
+                            faster for many large files.
+                            Process pools that are passed in should use
+                            glader_batch.init_worker() as their
+                            initializer, to load Gtk and the cache once.
+            concurrency   : Maximum files being read or generated at once.
+                            Default: ASYNC_CONCURRENCY
+            use_cache     : Whether a GladeCache is used. Thread pools get
+                            a cache created here, process pools that are
+                            passed in use their initializer's cache.
+        See GladeFile() and GladeFile.get_content() for the other
+        arguments.
+    """
+    from glader_batch import init_worker, load_worker
+    concurrency = max(concurrency or ASYNC_CONCURRENCY, 1)
+    loop = asyncio.get_running_loop()
+    owned = not isinstance(executor, Executor)
+    if executor in (None, 'thread'):
+        executor = ThreadPoolExecutor(
+            max_workers=1,
+            initializer=load_worker,
+            thread_name_prefix='glader-async',
+        )
+    elif executor == 'process':
+        executor = ProcessPoolExecutor(
+            max_workers=min(concurrency, os.cpu_count() or 1),
+            initializer=init_worker,
+            initargs=(use_cache, ),
+        )
+    elif owned:
+        raise ValueError(
+            f'Expecting \'thread\', \'process\', or an Executor: {executor!r}'
+        )
+    options = {
+        'dynamic_init': dynamic_init,
+        'lazy_init': lazy_init,
+        'lazy_windows': lazy_windows,
+    }
+    # Process pool workers use their own cache from init_worker().
+    cacheargs = ()
+    if isinstance(executor, ThreadPoolExecutor):
+        # Threads share this process, so they don't touch the process-wide
+        # cache that init_worker() sets up for process pools.
+        from glader_cache import GladeCache
+        cacheargs = (GladeCache() if use_cache else None, )
+
+    async def run(filepath):
+        try:
+            # asyncio has no file I/O, files are read in the loop's default
+            # executor so large files don't block the loop.
+            data = await loop.run_in_executor(None, read_file, filepath)
+            content, warnings = await loop.run_in_executor(
+                executor,
+                generate_data,
+                data,
+                filepath,
+                options,
+                lib_mode,
+                date,
+                *cacheargs
+            )
+        except Exception as ex:
+            return AsyncResult(filepath, error=str(ex))
+        return AsyncResult(filepath, content=content, warnings=warnings)
+
+    filepaths = iter(paths)
+    pending = set()
+    try:
+        while True:
+            for filepath in filepaths:
+                pending.add(asyncio.ensure_future(run(filepath)))
+                if len(pending) >= concurrency:
+                    break
+            if not pending:
+                break
+            done, pending = await asyncio.wait(
+                pending,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in done:
+                yield task.result()
+    finally:
+        if pending:
+            debug(f'Cancelling {len(pending)} unfinished files.')
+        for task in pending:
+            task.cancel()
+        if owned:
+            # Cancelled jobs never start, a running job finishes in the
+            # background.
+            executor.shutdown(wait=False)
+
+
+def generate_data(
+        data, filepath, options, lib_mode=False, date=None,
+        cache=WORKER_CACHE):
+    """ Generate code for glade XML that was read from `filepath`. This
+        runs in an executor's worker, with a GladeCache (or None) from
+        generate_many(), or the process pool worker's cache from
+        init_worker() by default.
+        Returns (content, warnings).
+    """
+    from glader_util import GladeFile, generate_lock
+    if cache is WORKER_CACHE:
+        import glader_batch
+        cache = glader_batch.worker_cache
+    with generate_lock:
+        gladefile = GladeFile(
+            filepath,
+            cache=cache,
+            source=data,
+            **options
+        )
+        content = gladefile.get_content(lib_mode=lib_mode, date=date)
+    return content, gladefile.warning_msgs() or None
+
+
+def read_file(filepath):
+    """ Return the bytes in a file. """
+    with open(filepath, 'rb') as f:
+        return f.read()
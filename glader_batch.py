@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+""" Glader - Batch
+    Generates code for many glade files at once, using a pool of worker
+    processes.
+"""
+import glob
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from glader_core import (
+    DEBUG,
+    debug,
+)
+from glader_cache import GladeCache
+from glader_timings import timings
+
+# Default output file name pattern for --batch.
+OUTPUT_PATTERN = os.path.join('{dir}', '{name}.py')
+
+# Cache used by this process, set by init_worker().
+worker_cache = None
+
+
+class BatchResult(object):
+    """ The outcome of generating code for one glade file. """
+    __slots__ = ('filepath', 'outputfile', 'error', 'warnings', 'changed')
+
+    def __init__(
+            self, filepath, outputfile, error=None, warnings=None,
+            changed=True):
+        self.filepath = filepath
+        self.outputfile = outputfile
+        # Error message, or None if the file was generated.
+        self.error = error
+        # GladeFile.warning_msgs(), if any.
+        self.warnings = warnings
+        # Whether the output file was written (it's content changed).
+        self.changed = changed
+
+    def __bool__(self):
+        return self.error is None
+
+    def __repr__(self):
+        return ''.join((
+            f'{type(self).__name__}(',
+            f'{self.filepath!r}, {self.outputfile!r}, error={self.error!r}',
+            ')',
+        ))
+
+
+def do_batch(
+        paths, pattern=None, jobs=None, dynamic_init=False, lib_mode=False,
+        overwrite=False, use_cache=True, check=False, date=None,
+        gresource=False, lazy_init=False, lazy_windows=False):
+    """ Generate code for all glade files found in `paths`, printing a
+        summary line for each file as it finishes.
+        Files with identical content are only parsed once.
+        Returns an exit status code, 1 if any file failed.
+        Arguments:
+            paths         : Glade files, directories, or glob patterns.
+            pattern       : Output file name pattern (see output_name()).
+            jobs          : Number of worker processes.
+                            Default: os.cpu_count()
+            dynamic_init  : Passed to GladeFile().
+            lib_mode      : Passed to GladeFile.get_content().
+            overwrite     : Whether existing output files are replaced.
+                            If falsey, they are skipped with an error.
+                            Files are only written if their content
+                            changed.
+            use_cache     : Whether workers use a GladeCache.
+            check         : Don't write anything, out of date or missing
+                            output files are failures.
+            date          : Passed to GladeFile.get_content().
+            gresource     : Whether each glade file is compiled into a
+                            GResource bundle next to it's output file,
+                            for the generated code to load.
+            lazy_init     : Passed to GladeFile().
+            lazy_windows  : Passed to GladeFile().
+    """
+    pattern = pattern or OUTPUT_PATTERN
+    filepaths = expand_paths(paths)
+    if not filepaths:
+        print_err('\nNo glade files found.')
+        return 1
+
+    results = []
+    groups = {}
+    outputfiles = set()
+    for filepath in filepaths:
+        try:
+            outputfile = output_name(filepath, pattern)
+        except (IndexError, KeyError, ValueError) as ex:
+            print_err(f'\nInvalid output pattern: {pattern}\n{ex!r}')
+            return 1
+        if outputfile in outputfiles:
+            results.append(BatchResult(
+                filepath,
+                outputfile,
+                error='Output file is used by another glade file.',
+            ))
+            continue
+        outputfiles.add(outputfile)
+        try:
+            with open(filepath, 'rb') as f:
+                contenthash = GladeCache.hash_bytes(f.read())
+        except EnvironmentError as ex:
+            results.append(BatchResult(filepath, outputfile, error=str(ex)))
+            continue
+        groups.setdefault(contenthash, []).append((filepath, outputfile))
+
+    for result in results:
+        print_result(result)
+    jobs = min(jobs or os.cpu_count() or 1, max(len(groups), 1))
+    debug(
+        f'Generating {len(filepaths)} files ({len(groups)} unique) '
+        f'with {jobs} job{"" if jobs == 1 else "s"}.'
+    )
+    args = (
+        dynamic_init,
+        lib_mode,
+        overwrite,
+        check,
+        date,
+        gresource,
+        lazy_init,
+        lazy_windows,
+    )
+    if jobs == 1:
+        # No need for worker processes.
+        try:
+            init_worker(use_cache=use_cache)
+        except Exception as ex:
+            debug(traceback.format_exc())
+            print_err(f'\nUnable to start generating code: {ex}')
+            return 1
+        for group in groups.values():
+            for result in generate_group(group, *args):
+                print_result(result)
+                results.append(result)
+    else:
+        with ProcessPoolExecutor(
+                max_workers=jobs,
+                initializer=init_worker,
+                initargs=(use_cache, )) as executor:
+            futures = [
+                executor.submit(generate_group_worker, group, *args)
+                for group in groups.values()
+            ]
+            try:
+                for future in as_completed(futures):
+                    groupresults, workertimings = future.result()
+                    timings.merge(workertimings)
+                    for result in groupresults:
+                        print_result(result)
+                        results.append(result)
+            except BrokenProcessPool as ex:
+                # A worker died, or init_worker() failed in it.
+                print_err(f'\nA worker process failed: {ex}')
+                return 1
+
+    failed = sum(1 for result in results if not result)
+    unchanged = sum(1 for result in results if result and not result.changed)
+    print('\n{} {} of {} file{} ({} unique), {} unchanged, {} failed.'.format(
+        'Checked' if check else 'Generated',
+        len(results) - failed,
+        len(results),
+        '' if len(results) == 1 else 's',
+        len(groups),
+        unchanged,
+        failed,
+    ))
+    return 1 if failed else 0
+
+
+def expand_paths(paths):
+    """ Return a list of glade file paths from file paths, directories
+        (searched recursively for .glade files), and glob patterns.
+        Duplicate paths are removed.
+    """
+    filepaths = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                filepaths.extend(
+                    os.path.join(dirpath, filename)
+                    for filename in sorted(filenames)
+                    if filename.endswith('.glade')
+                )
+        elif os.path.exists(path):
+            filepaths.append(path)
+        else:
+            matches = sorted(glob.glob(path, recursive=True))
+            if not matches:
+                debug(f'No files found for: {path}')
+            filepaths.extend(m for m in matches if os.path.isfile(m))
+
+    seen = set()
+    unique = []
+    for filepath in filepaths:
+        realpath = os.path.realpath(filepath)
+        if realpath in seen:
+            continue
+        seen.add(realpath)
+        unique.append(filepath)
+    return unique
+
+
+def generate_group(
+        group, dynamic_init=False, lib_mode=False, overwrite=False,
+        check=False, date=None, gresource=False, lazy_init=False,
+        lazy_windows=False):
+    """ Generate code for a group of glade files with identical content,
+        parsing them only once. This runs in a worker process.
+        Returns a list of BatchResults.
+        Arguments:
+            group  : A list of (filepath, outputfile) for each file.
+        See do_batch() for the other arguments.
+    """
+    # Imported here, so the parent process doesn't need the parser.
+    from glader_gresource import (
+        bundle_is_current,
+        bundle_name,
+        compile_gresource,
+    )
+    from glader_util import GladeFile, content_changed, write_content
+    results = []
+    gladefile = None
+    for filepath, outputfile in group:
+        try:
+            if gladefile is None:
+                gladefile = GladeFile(
+                    filepath,
+                    dynamic_init=dynamic_init,
+                    cache=worker_cache,
+                    lazy_init=lazy_init,
+                    lazy_windows=lazy_windows,
+                )
+            else:
+                gladefile = gladefile.copy(filepath)
+            bundle = bundle_name(filepath, outputfile) if gresource else None
+
+            def chunks():
+                # Code is streamed, and compared to the old file as it goes.
+                return gladefile.iter_content(
+                    lib_mode=lib_mode,
+                    date=date,
+                    gresource=os.path.basename(bundle) if bundle else None,
+                )
+
+            if check:
+                if content_changed(outputfile, chunks()):
+                    raise ValueError('Output file is out of date.')
+                if bundle and not bundle_is_current(filepath, bundle):
+                    raise ValueError(f'Bundle is out of date: {bundle}')
+                changed = False
+            elif (
+                    os.path.exists(outputfile) and
+                    (not overwrite) and
+                    content_changed(outputfile, chunks())):
+                raise ValueError(
+                    'Output file exists, use --overwrite to replace it.'
+                )
+            else:
+                # The bundle is always compiled (it's only replaced if it
+                # changed), because the glade file can change without
+                # changing the code. It's built first, so code never refers
+                # to a bundle that failed.
+                changed = bool(bundle) and compile_gresource(filepath, bundle)
+                changed = write_content(outputfile, chunks()) or changed
+        except Exception as ex:
+            msg = traceback.format_exc() if DEBUG else str(ex)
+            results.append(BatchResult(filepath, outputfile, error=msg))
+            continue
+        results.append(BatchResult(
+            filepath,
+            outputfile,
+            warnings=gladefile.warning_msgs() or None,
+            changed=changed,
+        ))
+    return results
+
+
+def generate_group_worker(group, *args):
+    """ Run generate_group() in a worker process, and return
+        (results, timings) so the timings can be merged into the parent's.
+    """
+    results = generate_group(group, *args)
+    return results, timings.pop()
+
+
+def init_worker(use_cache=True):
+    """ Set up a worker process. Modules are imported once here, and reused
+        for every glade file the worker handles.
+        Returns the GladeCache for this process, or None.
+    """
+    global worker_cache
+    load_worker()
+    worker_cache = GladeCache() if use_cache else None
+    return worker_cache
+
+
+def load_worker():
+    """ Import the modules and signature database that generating code
+        needs, without touching `worker_cache`. Thread pools use this as
+        their initializer, and pass their cache to each job instead.
+    """
+    from glader_signatures import get_gtk, signature_db
+    import glader_util  # noqa
+    signature_db.load()
+    if not signature_db.complete:
+        # Introspection will need Gtk, import it up front.
+        get_gtk()
+
+
+def output_name(filepath, pattern=None):
+    """ Return an output file name for a glade file, using a pattern
+        like '{dir}/{name}.py'. Available keys are:
+            dir   : Directory of the glade file.
+            name  : File name of the glade file, without the extension.
+    """
+    dirpath, filename = os.path.split(filepath)
+    return (pattern or OUTPUT_PATTERN).format(
+        dir=dirpath or '.',
+        name=os.path.splitext(filename)[0],
+    )
+
+
+def print_err(*args, **kwargs):
+    kwargs['file'] = kwargs.get('file', sys.stderr)
+    print(*args, **kwargs)
+
+
+def print_result(result):
+    """ Print a summary line for a BatchResult. """
+    if result:
+        print('{}: {} -> {}{}'.format(
+            'Generated' if result.changed else 'Unchanged',
+            result.filepath,
+            result.outputfile,
+            ' (with warnings)' if result.warnings else '',
+        ))
+        if result.warnings:
+            debug(f'\n{result.warnings}\n')
+        return None
+    print_err(f'   Failed: {result.filepath}: {result.error}')
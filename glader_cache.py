@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+""" Glader - Cache
+    A persistent cache for parsed glade files and generated code.
+"""
+import fcntl
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+
+from glader_core import (
+    __version__,
+    CONFIGDIR,
+    debug,
+)
+from glader_timings import timings
+
+CACHEDIR = os.path.join(CONFIGDIR, 'cache')
+# Maximum size for all cache files, in bytes.
+# The least recently used files are removed when this is exceeded.
+CACHE_MAX_SIZE = 64 * 1024 * 1024
+# Temp files older than this (in seconds) were left by a dead process.
+CACHE_TEMP_AGE = 60 * 60
+
+
+class GladeCache(object):
+    """ Stores parsed GladeNodes tables and generated code on disk.
+        There are two tiers:
+            models   : Parsed GladeNodes, keyed by glade file content.
+            content  : Generated code, keyed by glade file content and
+                       everything else that affects the output.
+
+        Files are written to a temp file and renamed into place, so many
+        processes can share the cache safely. A file's mtime is updated when
+        it is used, and the oldest files are removed when the cache grows
+        larger than `max_size`. The cache directory is only scanned once
+        to find its size, writes are added to that until it's too large.
+    """
+    tiers = ('models', 'content')
+
+    def __init__(self, cachedir=None, max_size=None):
+        self.cachedir = cachedir or CACHEDIR
+        self.max_size = CACHE_MAX_SIZE if max_size is None else max_size
+        # Approximate size of all cache files, or None until it is known.
+        # Other processes' writes are only seen when evict() runs.
+        self.size = None
+        self.enabled = self.ensure_dirs()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.cachedir!r})'
+
+    def clear(self):
+        """ Remove all cache files. Returns the number of files removed. """
+        removed = 0
+        for filepath, _, _ in self.iter_files(temp=True):
+            if self.remove(filepath):
+                removed += 1
+        self.size = None
+        return removed
+
+    def ensure_dirs(self):
+        """ Create the cache directories if needed.
+            Returns False if they can't be created.
+        """
+        try:
+            for tier in self.tiers:
+                os.makedirs(os.path.join(self.cachedir, tier), exist_ok=True)
+        except EnvironmentError as ex:
+            debug(f'Unable to create cache dir: {self.cachedir}\n{ex}')
+            return False
+        return True
+
+    def evict(self):
+        """ Remove least recently used files until the cache fits in
+            `self.max_size`. Only one process evicts at a time, others skip
+            it.
+            This scans every cache file, set() only calls it when the cache
+            has grown too large.
+        """
+        lockpath = os.path.join(self.cachedir, '.lock')
+        try:
+            lockfile = open(lockpath, 'w')
+        except EnvironmentError as ex:
+            debug(f'Unable to open cache lock: {lockpath}\n{ex}')
+            return None
+        with lockfile:
+            try:
+                fcntl.flock(lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another process is already evicting.
+                return None
+            files = sorted(self.iter_files(), key=lambda info: info[2])
+            total = sum(info[1] for info in files)
+            for filepath, size, _ in files:
+                if total <= self.max_size:
+                    break
+                if self.remove(filepath):
+                    debug(f'Evicted cache file: {filepath}')
+                    total -= size
+            self.size = total
+
+    def get(self, tier, key):
+        """ Retrieve raw bytes for a cache key, or None if not cached. """
+        if not self.enabled:
+            return None
+        filepath = self.get_path(tier, key)
+        try:
+            with open(filepath, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            timings.count(f'cache_{tier}_misses')
+            return None
+        except EnvironmentError as ex:
+            debug(f'Unable to read cache file: {filepath}\n{ex}')
+            return None
+        try:
+            # Mark it as recently used.
+            os.utime(filepath)
+        except EnvironmentError:
+            # Removed by another process, the data is still good.
+            pass
+        timings.count(f'cache_{tier}_hits')
+        return data
+
+    def get_content(self, key):
+        """ Retrieve cached generated code, or None if not cached. """
+        data = self.get('content', key)
+        return None if data is None else data.decode('utf-8')
+
+    def get_model(self, key):
+        """ Retrieve a cached GladeNodes table, or None if not cached. """
+        data = self.get('models', key)
+        if data is None:
+            return None
+        try:
+            return pickle.loads(data)
+        except Exception as ex:
+            # Truncated, or from an incompatible version.
+            debug(f'Removing bad cache model: {key}\n{ex}')
+            self.remove(self.get_path('models', key))
+        return None
+
+    def get_path(self, tier, key):
+        return os.path.join(self.cachedir, tier, key)
+
+    @staticmethod
+    def hash_bytes(data):
+        """ Return a hex digest for some bytes. """
+        return hashlib.sha256(data).hexdigest()
+
+    @classmethod
+    def hash_key(cls, *parts):
+        """ Return a cache key for some values, including the Glader
+            version.
+        """
+        key = '\0'.join(str(p) for p in (__version__, ) + parts)
+        return cls.hash_bytes(key.encode('utf-8'))
+
+    def iter_files(self, temp=False):
+        """ Yield (filepath, size, mtime) for all cache files.
+            Temp files are only included if `temp` is truthy, or they are
+            stale.
+        """
+        now = time.time()
+        for tier in self.tiers:
+            tierdir = os.path.join(self.cachedir, tier)
+            try:
+                entries = list(os.scandir(tierdir))
+            except EnvironmentError:
+                continue
+            for entry in entries:
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                is_temp = entry.name.startswith('.')
+                if is_temp and not temp:
+                    if (now - st.st_mtime) < CACHE_TEMP_AGE:
+                        continue
+                yield entry.path, st.st_size, st.st_mtime
+
+    @staticmethod
+    def remove(filepath):
+        """ Remove a cache file. Returns True if it was removed. """
+        try:
+            os.remove(filepath)
+        except FileNotFoundError:
+            return False
+        except EnvironmentError as ex:
+            debug(f'Unable to remove cache file: {filepath}\n{ex}')
+            return False
+        return True
+
+    def set(self, tier, key, data):
+        """ Store raw bytes for a cache key. """
+        if not self.enabled:
+            return None
+        tierdir = os.path.join(self.cachedir, tier)
+        temppath = None
+        try:
+            fd, temppath = tempfile.mkstemp(dir=tierdir, prefix='.')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temppath, self.get_path(tier, key))
+        except EnvironmentError as ex:
+            debug(f'Unable to write cache file: {key}\n{ex}')
+            if temppath:
+                self.remove(temppath)
+            return None
+        if self.size is None:
+            self.size = sum(info[1] for info in self.iter_files())
+        else:
+            self.size += len(data)
+        if self.size > self.max_size:
+            self.evict()
+
+    def set_content(self, key, content):
+        """ Store generated code. """
+        self.set('content', key, content.encode('utf-8'))
+
+    def set_model(self, key, nodes):
+        """ Store a GladeNodes table. """
+        try:
+            data = pickle.dumps(nodes, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as ex:
+            debug(f'Unable to cache glade info: {ex}')
+            return None
+        self.set('models', key, data)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+""" Glader - GResource
+    Bundles glade files into GResource files, so generated code can build
+    it's UI from a memory-mapped resource instead of reading the glade file.
+"""
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+from xml.sax.saxutils import escape as xml_escape
+
+from glader_core import debug
+from glader_timings import timings
+
+# GLib's resource compiler, from it's development tools.
+GRESOURCE_COMPILER = 'glib-compile-resources'
+# Resource prefix for a glade file, {name} is it's name without extension.
+GRESOURCE_PREFIX = '/glader/{name}'
+# Resource description for glib-compile-resources.
+GRESOURCE_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<gresources>
+  <gresource prefix="{prefix}">
+    <file>{filename}</file>
+  </gresource>
+</gresources>
+"""
+
+
+def bundle_name(filepath, outputfile=None):
+    """ Return the file path for a glade file's GResource bundle, next to
+        the output file, or next to the glade file when the output is
+        stdout.
+    """
+    if outputfile and not outputfile.startswith('-'):
+        filepath = outputfile
+    return f'{os.path.splitext(filepath)[0]}.gresource'
+
+
+def bundle_is_current(filepath, target):
+    """ Return True if a GResource bundle exists, and matches what the glade
+        file compiles to now. The glade file is compiled again to compare,
+        because checkouts and copies reset mtimes.
+        Raises EnvironmentError if the compiler is missing, or fails.
+    """
+    try:
+        with open(target, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return False
+    return data == build_gresource(filepath)
+
+
+def build_gresource(filepath):
+    """ Compile a glade file into GResource bundle data, using
+        glib-compile-resources, and return the bytes. The output only
+        depends on the glade file's name and content.
+        Raises EnvironmentError if the compiler is missing, or fails.
+    """
+    compiler = shutil.which(GRESOURCE_COMPILER)
+    if compiler is None:
+        raise FileNotFoundError(
+            f'{GRESOURCE_COMPILER} was not found, it is installed with '
+            'GLib\'s development tools.'
+        )
+    sourcedir, filename = os.path.split(os.path.abspath(filepath))
+    with timings.phase('gresource'):
+        with tempfile.TemporaryDirectory(prefix='glader') as tempdir:
+            xmlfile = os.path.join(tempdir, 'bundle.gresource.xml')
+            with open(xmlfile, 'w') as f:
+                f.write(GRESOURCE_XML.format(
+                    prefix=resource_prefix(filepath),
+                    filename=xml_escape(filename),
+                ))
+            temptarget = os.path.join(tempdir, 'bundle.gresource')
+            proc = subprocess.run(
+                [
+                    compiler,
+                    f'--sourcedir={sourcedir}',
+                    f'--target={temptarget}',
+                    xmlfile,
+                ],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                universal_newlines=True,
+            )
+            if proc.returncode != 0:
+                raise OSError(
+                    f'{GRESOURCE_COMPILER} failed for {filepath}:\n'
+                    f'{(proc.stderr or proc.stdout).strip()}'
+                )
+            with open(temptarget, 'rb') as f:
+                return f.read()
+
+
+def content_bundle_name(filepath, dirpath):
+    """ Return a file path in `dirpath` for a glade file's GResource bundle,
+        named with a digest of the glade file's content, like:
+            dirpath/glader-0123456789abcdef.gresource
+        A bundle with this name always matches the glade file, even when
+        the glade file's mtime is older than the bundle's.
+    """
+    with open(filepath, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    return os.path.join(dirpath, f'{name}-{digest}.gresource')
+
+
+def compile_gresource(filepath, target):
+    """ Compile a glade file into a GResource bundle, using
+        glib-compile-resources. The bundle is only replaced if it changed.
+        Returns True if it was written, or False if it was unchanged.
+        Raises EnvironmentError if the compiler is missing, or fails.
+    """
+    data = build_gresource(filepath)
+    try:
+        with open(target, 'rb') as f:
+            if f.read() == data:
+                debug(f'Bundle is unchanged: {target}')
+                return False
+    except FileNotFoundError:
+        pass
+    # Written next to the target, so it can be renamed into place.
+    fd, temppath = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(target)),
+        prefix='.glader',
+    )
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temppath, target)
+    except BaseException:
+        os.remove(temppath)
+        raise
+    timings.count('gresources_compiled')
+    return True
+
+
+def resource_path(filepath):
+    """ Return the resource path for a glade file in it's bundle. """
+    return '/'.join((
+        resource_prefix(filepath),
+        os.path.basename(filepath),
+    ))
+
+
+def resource_prefix(filepath):
+    """ Return the resource prefix for a glade file. """
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    return GRESOURCE_PREFIX.format(name=name)
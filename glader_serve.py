@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+""" Glader - Serve
+    Generates code for clients over a Unix domain socket, or NDJSON on
+    stdin/stdout, so editors and build tools don't pay for Python, Gtk, and
+    template start up on every request. Parsed files stay loaded until they
+    change.
+    The protocol is described in README.md.
+"""
+import json
+import os
+import socket
+import socketserver
+import stat
+import subprocess
+import sys
+import traceback
+from collections import OrderedDict
+
+from glader_core import DEBUG, debug
+
+# Commands handled by GladeServer.
+SERVE_COMMANDS = ('generate', 'layout', 'check')
+# Request options and their defaults, named like do_cmdline()'s arguments.
+# Options with a bool default must be true or false, the others must be
+# strings or null.
+SERVE_OPTIONS = {
+    'outputfile': None,
+    'dynamic_init': False,
+    'lazy_init': False,
+    'lazy_windows': False,
+    'lib_mode': False,
+    'overwrite': False,
+    'date': None,
+    'gresource': False,
+    'gladefile': None,
+}
+# Parsed files kept by a GladeServer, least recently used are dropped.
+SERVE_MODEL_LIMIT = 64
+# glader.py, started by ServeClient when no socket is given.
+GLADER_PY_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    'glader.py',
+)
+
+
+class ServeError(Exception):
+    """ Raised for invalid requests, and by ServeClient when a request
+        fails.
+    """
+    pass
+
+
+class GladeServer(object):
+    """ Handles requests from clients. Gtk, the signature database, and
+        templates are loaded once, and parsed files are kept until their
+        mtime or size changes.
+    """
+    def __init__(self, use_cache=True):
+        from glader_batch import init_worker
+        from glader_util import generate_lock
+        self.cache = init_worker(use_cache=use_cache)
+        # (stamp, GladeFile) by absolute file path, oldest first.
+        self.models = OrderedDict()
+        # Parsing and rendering use Gtk and module-level state, so requests
+        # take turns. Clients are still read from and written to at the
+        # same time.
+        self.lock = generate_lock
+
+    def get_gladefile(
+            self, filepath, dynamic_init=False, lazy_init=False,
+            lazy_windows=False):
+        """ Return a GladeFile for a file path, reusing the parsed file from
+            an earlier request if the file hasn't changed.
+        """
+        from glader_util import GladeFile
+        key = os.path.abspath(filepath)
+        st = os.stat(key)
+        stamp = (st.st_mtime_ns, st.st_size)
+        oldstamp, gladefile = self.models.get(key, (None, None))
+        if (gladefile is not None) and (oldstamp == stamp):
+            debug(f'Reusing parsed file: {filepath}')
+            self.models.move_to_end(key)
+            options = (dynamic_init, lazy_init, lazy_windows)
+            if options == (
+                    gladefile.dynamic_init,
+                    gladefile.lazy_init,
+                    gladefile.lazy_windows):
+                return gladefile
+            return gladefile.copy(
+                dynamic_init=dynamic_init,
+                lazy_init=lazy_init,
+                lazy_windows=lazy_windows,
+            )
+        gladefile = GladeFile(
+            filepath,
+            dynamic_init=dynamic_init,
+            cache=self.cache,
+            lazy_init=lazy_init,
+            lazy_windows=lazy_windows,
+        )
+        self.models[key] = (stamp, gladefile)
+        while len(self.models) > SERVE_MODEL_LIMIT:
+            self.models.popitem(last=False)
+        return gladefile
+
+    def handle(self, request):
+        """ Handle a request dict, and return a response dict.
+            Errors are returned in the response, instead of raised.
+        """
+        reqid = request.get('id', None) if isinstance(request, dict) else None
+        try:
+            result = self.run(request)
+        except Exception as ex:
+            debug(traceback.format_exc())
+            return {
+                'id': reqid,
+                'ok': False,
+                'error': traceback.format_exc() if DEBUG else str(ex),
+            }
+        response = {'id': reqid, 'ok': True}
+        response.update(result)
+        return response
+
+    def handle_line(self, line):
+        """ Handle one line of NDJSON, and return the response line without
+            a line ending.
+        """
+        try:
+            request = json.loads(line)
+        except ValueError as ex:
+            response = {'id': None, 'ok': False, 'error': f'Bad JSON: {ex}'}
+        else:
+            response = self.handle(request)
+        return json.dumps(response)
+
+    def run(self, request):
+        """ Run a request, and return the response dict without `id` and
+            `ok`. Raises an exception if the request fails.
+        """
+        from glader_gresource import (
+            bundle_is_current,
+            bundle_name,
+            compile_gresource,
+        )
+        from glader_util import (
+            content_changed,
+            parse_date,
+            write_content,
+        )
+        if not isinstance(request, dict):
+            raise ServeError('Expecting a JSON object.')
+        command = request.get('command', None)
+        if command not in SERVE_COMMANDS:
+            raise ServeError(f'Unknown command: {command!r}')
+        filepath = request.get('filepath', None)
+        if not filepath:
+            raise ServeError('No filepath provided.')
+        if not isinstance(filepath, str):
+            raise ServeError(f'Expecting a string for filepath: {filepath!r}')
+        unknown = set(request).difference(
+            SERVE_OPTIONS,
+            ('id', 'command', 'filepath'),
+        )
+        if unknown:
+            raise ServeError(f'Unknown options: {", ".join(sorted(unknown))}')
+        opts = {k: request.get(k, v) for k, v in SERVE_OPTIONS.items()}
+        for name, value in opts.items():
+            # JSON has no way to stop "false" from being sent for false.
+            if isinstance(SERVE_OPTIONS[name], bool):
+                if not isinstance(value, bool):
+                    raise ServeError(
+                        f'Expecting true or false for {name}: {value!r}'
+                    )
+            elif (value is not None) and not isinstance(value, str):
+                raise ServeError(f'Expecting a string for {name}: {value!r}')
+        outputfile = opts['outputfile']
+        if outputfile == '-':
+            outputfile = None
+        if (command == 'check') and not outputfile:
+            raise ServeError('An output file is needed for check.')
+        date = parse_date(opts['date']) if opts['date'] else None
+        if opts['gresource'] and opts['gladefile']:
+            # The bundle is compiled from the file, and replaces the path.
+            raise ServeError('gresource can\'t be used with gladefile.')
+
+        with self.lock:
+            gladefile = self.get_gladefile(
+                filepath,
+                dynamic_init=opts['dynamic_init'],
+                lazy_init=opts['lazy_init'],
+                lazy_windows=opts['lazy_windows'],
+            )
+            if opts['gladefile']:
+                # The parsed file is shared, only the path changes.
+                gladefile = gladefile.copy(filepath=opts['gladefile'])
+            response = {'warnings': gladefile.warning_msgs() or None}
+            if command == 'layout':
+                response['layout'] = repr(gladefile)
+                return response
+            bundle = (
+                bundle_name(filepath, outputfile)
+                if opts['gresource'] else None
+            )
+
+            def chunks():
+                return gladefile.iter_content(
+                    lib_mode=opts['lib_mode'],
+                    date=date,
+                    gresource=os.path.basename(bundle) if bundle else None,
+                )
+
+            if command == 'check':
+                response['changed'] = (
+                    content_changed(outputfile, chunks()) or
+                    (bool(bundle) and not bundle_is_current(filepath, bundle))
+                )
+                return response
+            if not outputfile:
+                if bundle:
+                    compile_gresource(filepath, bundle)
+                response['code'] = ''.join(chunks())
+                return response
+            if (
+                    os.path.exists(outputfile) and
+                    (not opts['overwrite']) and
+                    content_changed(outputfile, chunks())):
+                raise ServeError(
+                    f'File exists, use overwrite to replace it: {outputfile}'
+                )
+            # The bundle is built first, so code never refers to a bundle
+            # that failed.
+            changed = bool(bundle) and compile_gresource(filepath, bundle)
+            changed = write_content(outputfile, chunks()) or changed
+            response['changed'] = changed
+        return response
+
+
+class ServeClient(object):
+    """ A small client for `glader --serve`, for tests and scripts.
+        It connects to a server's Unix socket, or starts `glader --serve`
+        and speaks NDJSON on it's stdin/stdout when no socket is given.
+    """
+    def __init__(self, socketpath=None, args=None):
+        self.reqid = 0
+        self.sock = None
+        self.proc = None
+        if socketpath:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(socketpath)
+            self.reader = self.sock.makefile('rb')
+            self.writer = self.sock.makefile('wb')
+        else:
+            self.proc = subprocess.Popen(
+                [sys.executable, GLADER_PY_FILE, '--serve', *(args or ())],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+            )
+            self.reader = self.proc.stdout
+            self.writer = self.proc.stdin
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, excvalue, tb):
+        self.close()
+        return False
+
+    def close(self):
+        """ Close the connection, and wait for a started server to exit. """
+        self.writer.close()
+        self.reader.close()
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        if self.proc is not None:
+            self.proc.wait()
+            self.proc = None
+
+    def check(self, filepath, outputfile, **options):
+        """ Return True if `outputfile` is missing or out of date. """
+        return self.request(
+            'check',
+            filepath,
+            outputfile=outputfile,
+            **options
+        )['changed']
+
+    def generate(self, filepath, **options):
+        """ Return generated code for a glade file, or True/False for
+            whether `outputfile` was written when it is given.
+        """
+        response = self.request('generate', filepath, **options)
+        return response.get('code', response.get('changed', None))
+
+    def layout(self, filepath, **options):
+        """ Return Glader's layout for a glade file. """
+        return self.request('layout', filepath, **options)['layout']
+
+    def request(self, command, filepath, **options):
+        """ Send a request, and return the response dict.
+            Raises ServeError if the request failed.
+        """
+        self.reqid += 1
+        request = {'id': self.reqid, 'command': command, 'filepath': filepath}
+        request.update(options)
+        self.writer.write(json.dumps(request).encode('utf-8') + b'\n')
+        self.writer.flush()
+        line = self.reader.readline()
+        if not line:
+            raise ServeError('The server closed the connection.')
+        response = json.loads(line)
+        if not response.get('ok', False):
+            raise ServeError(response.get('error', 'Request failed.'))
+        return response
+
+
+class ServeHandler(socketserver.StreamRequestHandler):
+    """ Handles requests from one socket client, until it disconnects. """
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = self.server.glader.handle_line(line)
+            self.wfile.write(response.encode('utf-8') + b'\n')
+
+
+class ServeSocketServer(socketserver.ThreadingUnixStreamServer):
+    """ A Unix socket server with a thread for each client, sharing one
+        GladeServer.
+    """
+    daemon_threads = True
+
+    def __init__(self, socketpath, glader):
+        self.glader = glader
+        super().__init__(socketpath, ServeHandler)
+
+    def server_bind(self):
+        """ Create the socket file, readable and writable by this user only.
+            Only this user can send requests that write files. The socket is
+            created with these permissions, instead of changing them after
+            another user could have connected.
+        """
+        oldmask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(oldmask)
+
+
+def do_serve(socketpath=None, use_cache=True):
+    """ Serve requests on a Unix socket, or on stdin/stdout when no
+        `socketpath` is given, until interrupted (or stdin is closed).
+    """
+    try:
+        glader = GladeServer(use_cache=use_cache)
+    except Exception as ex:
+        print_err(f'\nUnable to start the server: {ex}')
+        return 1
+    if not socketpath:
+        return serve_stdio(glader)
+    return serve_socket(glader, socketpath)
+
+
+def print_err(*args, **kwargs):
+    kwargs['file'] = kwargs.get('file', sys.stderr)
+    print(*args, **kwargs)
+
+
+def serve_socket(glader, socketpath):
+    """ Serve requests from clients on a Unix socket, until interrupted.
+        A stale socket that refuses connections is replaced, but not one
+        that a server is listening on, or a path that isn't a socket.
+    """
+    try:
+        st = os.lstat(socketpath)
+    except FileNotFoundError:
+        st = None
+    if st is not None:
+        if not stat.S_ISSOCK(st.st_mode):
+            # A mistyped path must never delete the user's files.
+            print_err(f'\nNot a socket, refusing to replace: {socketpath}')
+            return 1
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socketpath)
+        except ConnectionRefusedError:
+            debug(f'Removing stale socket: {socketpath}')
+            os.remove(socketpath)
+        except OSError as ex:
+            print_err(f'\nUnable to check socket: {socketpath}\n{ex}')
+            return 1
+        else:
+            print_err(f'\nA server is already listening on: {socketpath}')
+            return 1
+        finally:
+            probe.close()
+    try:
+        server = ServeSocketServer(socketpath, glader)
+    except OSError as ex:
+        print_err(f'\nUnable to listen on: {socketpath}\n{ex}')
+        return 1
+    print_err(f'Serving on {socketpath}, press Ctrl + C to stop.')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print_err('\nStopped serving.')
+    finally:
+        server.server_close()
+        os.remove(socketpath)
+    return 0
+
+
+def serve_stdio(glader, stdin=None, stdout=None):
+    """ Serve NDJSON requests from stdin, writing responses to stdout,
+        until stdin is closed. Anything else printed while handling
+        requests goes to stderr, so it doesn't break the responses.
+    """
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    realstdout, sys.stdout = sys.stdout, sys.stderr
+    try:
+        for line in stdin:
+            if not line.strip():
+                continue
+            stdout.write(glader.handle_line(line) + '\n')
+            stdout.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sys.stdout = realstdout
+    return 0
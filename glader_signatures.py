@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+""" Glader - Signatures
+    A database of signal handler arguments for Gtk widgets, so they don't
+    need to be introspected for every signal.
+"""
+import glob
+import json
+import os
+import sys
+import tempfile
+
+from glader_core import (
+    __version__,
+    CONFIGDIR,
+    debug,
+    import_fail,
+)
+from glader_timings import timings
+
+# Signature database, built with --build-signature-db.
+SIGNATUREFILE = os.path.join(CONFIGDIR, 'signatures.json')
+# Directories to search for Gtk's typelib, after $GI_TYPELIB_PATH.
+TYPELIBDIRS = (
+    '/usr/lib/*/girepository-1.0',
+    '/usr/lib64/girepository-1.0',
+    '/usr/lib/girepository-1.0',
+    '/usr/local/lib/girepository-1.0',
+)
+
+
+def get_gtk():
+    """ Import and return the Gtk module. """
+    try:
+        from gi import require_version as gi_require_version
+        gi_require_version('Gtk', '3.0')
+        from gi.repository import Gtk
+    except ImportError as eximp:
+        import_fail(eximp)
+    return Gtk
+
+
+def gtk_id():
+    """ Return a string that identifies the installed Gtk.
+        This is the typelib fingerprint when it can be found, so Gtk is not
+        imported. Otherwise it is the Gtk version.
+    """
+    return gtk_typelib() or gtk_version()
+
+
+def gtk_typelib():
+    """ Return a fingerprint for the installed Gtk typelib file, like:
+            '/usr/lib/girepository-1.0/Gtk-3.0.typelib:123:456'
+        This changes when Gtk is upgraded, and is found without importing
+        Gtk. Returns None if the typelib can't be found.
+    """
+    typelibdirs = [
+        s
+        for s in os.environ.get('GI_TYPELIB_PATH', '').split(os.pathsep)
+        if s
+    ]
+    for pattern in TYPELIBDIRS:
+        typelibdirs.extend(sorted(glob.glob(pattern)))
+    for typelibdir in typelibdirs:
+        filepath = os.path.join(typelibdir, 'Gtk-3.0.typelib')
+        try:
+            st = os.stat(filepath)
+        except EnvironmentError:
+            continue
+        return f'{filepath}:{st.st_size}:{st.st_mtime_ns}'
+    return None
+
+
+def gtk_version():
+    """ Return the Gtk version as a string, like: '3.24.20' """
+    Gtk = get_gtk()
+    return '.'.join(
+        str(getversion())
+        for getversion in (
+            Gtk.get_major_version,
+            Gtk.get_minor_version,
+            Gtk.get_micro_version,
+        )
+    )
+
+
+class SignatureDB(object):
+    """ Holds known signal handler arguments, keyed by widget class and
+        event name, like: {'Button.do_clicked': []}
+        Also holds the Gtk window classes, which generate class defs.
+
+        Lookups are memoized. A database file built for the installed Gtk
+        covers every Gtk widget, so when one is loaded Gtk is never
+        touched. Otherwise, misses are introspected using Gtk, and the
+        window classes are saved to a partial database file, so later runs
+        that only need them (like cached runs) don't import Gtk.
+    """
+    # Gtk class names ending with these are window classes.
+    win_suffixes = ('Window', 'Dialog', 'Assistant')
+    # Bump this when the file layout changes, so old files are not used.
+    file_version = 2
+
+    def __init__(self, filepath=None):
+        self.filepath = filepath or SIGNATUREFILE
+        # Memoized arguments, or None for unknown widgets/events.
+        self.signatures = {}
+        # Window class names (GtkWindow, GtkDialog), or None until needed.
+        self.win_classes = None
+        # Whether self.signatures has every Gtk widget/event.
+        self.complete = False
+        # Whether the database file has been loaded (or tried).
+        self.loaded = False
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def build(self):
+        """ Introspect every Gtk widget/event, and mark this database as
+            complete. Returns the number of signatures found.
+        """
+        Gtk = get_gtk()
+        signatures = {}
+        self.win_classes = self.introspect_win_classes()
+        for gtkname in dir(Gtk):
+            widget = getattr(Gtk, gtkname, None)
+            if not isinstance(widget, type):
+                continue
+            for event in dir(widget):
+                if not event.startswith('do_'):
+                    continue
+                args = self.introspect(gtkname, event, widget=widget)
+                if args is not None:
+                    signatures[self.key(gtkname, event)] = args
+        self.signatures = signatures
+        self.complete = True
+        self.loaded = True
+        return len(signatures)
+
+    def get_args(self, gtkname, event):
+        """ Return known argument names for a widget class/event, or None
+            if they are not known.
+            Arguments:
+                gtkname  : Gtk class name, without 'Gtk' (Button).
+                event    : Gtk event function name (do_clicked).
+        """
+        if not self.loaded:
+            with timings.phase('signature_db'):
+                self.load()
+        timings.count('signature_lookups')
+        key = self.key(gtkname, event)
+        try:
+            return self.signatures[key]
+        except KeyError:
+            pass
+        if self.complete:
+            # The database has everything that Gtk has.
+            return None
+        with timings.phase('gtk_introspect'):
+            args = self.signatures[key] = self.introspect(gtkname, event)
+        timings.count('gtk_lookups')
+        return args
+
+    @staticmethod
+    def introspect(gtkname, event, widget=None):
+        """ Look up argument names for a widget class/event using Gtk.
+            Returns None if they can't be found.
+        """
+        if widget is None:
+            # Find the widget class in Gtk.
+            widget = getattr(get_gtk(), gtkname, None)
+        if widget is None:
+            debug(f'No widget named: {gtkname}')
+        # Find the event handler function info for the widget.
+        # 'move-cursor' becomes Gtk.WidgetThing.do_move_cursor
+        widgetevent = getattr(widget, event, None)
+        if widget and (widgetevent is None):
+            debug(f'No event function found for: {gtkname}:{event}')
+        # Get argument info.
+        if hasattr(widgetevent, 'get_arguments'):
+            return [ai.get_name() for ai in widgetevent.get_arguments()]
+
+        # No argument info for this widget/event.
+        if widget and widgetevent:
+            debug(f'Unable to get_arguments() for: {gtkname}:{widgetevent}')
+        return None
+
+    @classmethod
+    def introspect_win_classes(cls):
+        """ Return a set of window class names from Gtk, like 'GtkWindow'.
+        """
+        return {
+            f'Gtk{name}'
+            for name in dir(get_gtk())
+            if name.endswith(cls.win_suffixes)
+        }
+
+    def is_win_class(self, widget):
+        """ Returns True if a widget class (like 'GtkDialog') is a Gtk window
+            class, that can be promoted to ObjectClass.
+        """
+        if not self.loaded:
+            with timings.phase('signature_db'):
+                self.load()
+        if self.win_classes is None:
+            self.win_classes = self.introspect_win_classes()
+            self.save_partial()
+        return widget in self.win_classes
+
+    @staticmethod
+    def key(gtkname, event):
+        return f'{gtkname}.{event}'
+
+    def load(self):
+        """ Load the database file, if it was built for the installed Gtk.
+            Returns True if it was loaded.
+        """
+        self.loaded = True
+        try:
+            with open(self.filepath, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (EnvironmentError, ValueError) as ex:
+            debug(f'Unable to load signature db: {self.filepath}\n{ex}')
+            return False
+
+        if data.get('file_version', None) != self.file_version:
+            debug(f'Signature db is from an older Glader: {self.filepath}')
+            return False
+        typelib = gtk_typelib()
+        if typelib:
+            usable = data.get('typelib', None) == typelib
+        else:
+            usable = data.get('gtk_version', None) == gtk_version()
+        if not usable:
+            debug(f'Signature db is for another Gtk: {self.filepath}')
+            return False
+        # Memoized lookups take precedence over the file.
+        signatures = data.get('signatures', {})
+        signatures.update(self.signatures)
+        self.signatures = signatures
+        self.win_classes = set(data.get('win_classes', ()))
+        # Partial files only have the window classes, and the signatures
+        # that were introspected before they were saved.
+        self.complete = data.get('complete', True)
+        debug(f'Loaded {len(signatures)} signatures from: {self.filepath}')
+        return True
+
+    def save(self, filepath=None):
+        """ Write this database to disk, replacing any old file. """
+        filepath = filepath or self.filepath
+        data = {
+            'file_version': self.file_version,
+            'complete': self.complete,
+            'glader_version': __version__,
+            'gtk_version': gtk_version(),
+            'typelib': gtk_typelib(),
+            'signatures': self.signatures,
+            'win_classes': sorted(
+                self.win_classes or self.introspect_win_classes()
+            ),
+        }
+        dirpath = os.path.dirname(os.path.abspath(filepath))
+        os.makedirs(dirpath, exist_ok=True)
+        fd, temppath = tempfile.mkstemp(dir=dirpath, prefix='.signatures')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=0, sort_keys=True)
+            os.replace(temppath, filepath)
+        except BaseException:
+            os.remove(temppath)
+            raise
+        return filepath
+
+    def save_partial(self):
+        """ Save introspected window classes to the database file, when no
+            usable file was loaded. Signatures are still introspected as
+            they are needed, until a full database is built.
+            Returns the file path, or None if it wasn't saved.
+        """
+        if self.complete or (self.filepath == os.devnull):
+            return None
+        try:
+            with timings.phase('signature_db'):
+                filepath = self.save()
+        except EnvironmentError as ex:
+            debug(f'Unable to write signature db: {self.filepath}\n{ex}')
+            return None
+        debug(f'Saved window classes to: {filepath}')
+        return filepath
+
+
+def build_signature_db(filepath=None):
+    """ Build and save a signature database for the installed Gtk.
+        Returns an exit status code.
+    """
+    db = SignatureDB(filepath=filepath)
+    count = db.build()
+    try:
+        filepath = db.save()
+    except EnvironmentError as ex:
+        print(
+            f'\nUnable to write signature db: {db.filepath}\n{ex}',
+            file=sys.stderr,
+        )
+        return 1
+    print(f'Saved {count} signatures for Gtk {gtk_version()}: {filepath}')
+    return 0
+
+
+# Shared database used by SignalHandler.get_args().
+signature_db = SignatureDB()
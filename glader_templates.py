@@ -1,19 +1,229 @@
 #!/usr/bin/env python3
 """ Glader - Templates
     Helpers for retrieving Glader template files/content.
+    Templates are compiled once into segments, and rendered in a single
+    pass. Compiled templates are kept in memory, and saved next to the
+    template files (like Python's bytecode), until the files change.
     -Christopher Welborn 03-14-20
 """
+import hashlib
+import marshal
 import os.path
 import sys
-SCRIPT = os.path.split(os.path.abspath(sys.argv[0]))[1]
-SCRIPTDIR = os.path.abspath(sys.path[0])
-TEMPLATEDIR = os.path.join(SCRIPTDIR, 'templates')
-# A dict of {name: full_path}, like: {'body': './templates/body.py'}
-TEMPLATE_FILES = {
-    os.path.splitext(s)[0]: os.path.join(TEMPLATEDIR, s)
-    for s in os.listdir(TEMPLATEDIR)
-    if s.endswith('.py')
-}
+import tempfile
+from string import Formatter
+
+from glader_core import CONFIGDIR, debug
+
+# Built-in templates.
+TEMPLATEDIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    'templates',
+)
+# Templates in this directory override the built-in templates.
+USER_TEMPLATEDIR = (
+    os.environ.get('GLADER_TEMPLATE_DIR', None) or
+    os.path.join(CONFIGDIR, 'templates')
+)
+# Template names, a template file is named like: body.py
+TEMPLATE_NAMES = (
+    'body',
+    'cls',
+    'cls_resource',
+    'cls_sub',
+    'cls_sub_resource',
+    'header',
+    'lazy_getattr',
+    'lazy_window',
+    'resource',
+    'set_object',
+)
+# Bump this when compiled segments change, so saved templates are not used.
+TEMPLATE_VERSION = 1
+
+# Compiled Templates, by (name, indent, strip).
+_templates = {}
+# Digest of all loaded templates, set by get_templates_hash().
+_templates_hash = None
+
+
+class Template(object):
+    """ A template compiled into segments, which are rendered in a single
+        pass, without str.format().
+        Segments are (text, field, prefix, suffix) tuples. The text is
+        always used, and non-empty field values are used with their prefix
+        and suffix. A placeholder that is alone on it's line is removed
+        with it's line break when it's value is empty, so templates do not
+        leave blank or whitespace-only lines behind.
+    """
+    __slots__ = ('name', 'filepath', 'stamp', 'segments')
+
+    def __init__(self, segments, name=None, filepath=None, stamp=None):
+        self.segments = segments
+        self.name = name
+        self.filepath = filepath
+        # (mtime, size) for the template file when it was compiled.
+        self.stamp = stamp
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.name!r}, {self.filepath!r})'
+
+    @classmethod
+    def compile(cls, content, indent=0, strip=False, name=None):
+        """ Compile template content into a Template.
+            Arguments:
+                content  : Template content, or an iterable of lines.
+                indent   : Spaces to add before each line.
+                strip    : Whether to remove trailing whitespace.
+                name     : Template name, for error messages.
+        """
+        if isinstance(content, str):
+            content = content.splitlines(True)
+        content = ''.join(parse_template(content, indent=indent))
+        if strip:
+            content = content.rstrip()
+        formatter = Formatter()
+        segments = []
+        text = []
+        skip_break = False
+        for i, line in enumerate(content.split('\n')):
+            if i and not skip_break:
+                text.append('\n')
+            skip_break = False
+            stripped = line.strip()
+            fieldname = stripped[1:-1]
+            if (
+                    stripped.startswith('{') and
+                    stripped.endswith('}') and
+                    fieldname.isidentifier()):
+                # Placeholder on it's own line.
+                spaces = line[:line.index('{')]
+                if text:
+                    # The line break before this line belongs to it.
+                    text.pop()
+                    prefix, suffix = f'\n{spaces}', ''
+                else:
+                    prefix, suffix = spaces, '\n'
+                    skip_break = True
+                segments.append((''.join(text), fieldname, prefix, suffix))
+                text = []
+                continue
+            try:
+                parsed = list(formatter.parse(line))
+            except ValueError as ex:
+                raise ValueError(
+                    f'Invalid template {name or ""}, line {i + 1}: {ex}'
+                )
+            for literal, fieldname, spec, conversion in parsed:
+                text.append(literal)
+                if fieldname is None:
+                    continue
+                if spec or conversion or not fieldname.isidentifier():
+                    raise ValueError(
+                        f'Unsupported placeholder in template {name or ""},'
+                        f' line {i + 1}: {{{fieldname}}}'
+                    )
+                segments.append((''.join(text), fieldname, '', ''))
+                text = []
+        if text:
+            segments.append((''.join(text), None, '', ''))
+        return cls(tuple(segments), name=name)
+
+    @classmethod
+    def from_file(cls, filepath, indent=0, strip=False, name=None):
+        """ Compile a template file, or load it's saved segments if the
+            file has not changed since they were saved.
+        """
+        st = os.stat(filepath)
+        stamp = (st.st_mtime_ns, st.st_size)
+        compiledpath = compiled_path(filepath, indent=indent, strip=strip)
+        try:
+            with open(compiledpath, 'rb') as f:
+                savedstamp, segments = marshal.load(f)
+            if tuple(savedstamp) == stamp:
+                debug(f'Using compiled template: {compiledpath}')
+                return cls(
+                    segments,
+                    name=name,
+                    filepath=filepath,
+                    stamp=stamp,
+                )
+        except FileNotFoundError:
+            pass
+        except (EnvironmentError, EOFError, TypeError, ValueError) as ex:
+            debug(f'Unable to load compiled template: {compiledpath}\n{ex}')
+
+        with open(filepath, 'r') as f:
+            template = cls.compile(f, indent=indent, strip=strip, name=name)
+        template.filepath = filepath
+        template.stamp = stamp
+        if not sys.dont_write_bytecode:
+            template.save(compiledpath)
+        return template
+
+    def iter_render(self, **values):
+        """ Render this template, yielding chunks of content as they are
+            produced. Values may be iterables of str chunks (like other
+            iter_render() calls), which are not joined. An iterable that
+            yields nothing is an empty value.
+            Like str.format(), other values are converted with str(), and
+            missing values raise KeyError.
+        """
+        for text, field, prefix, suffix in self.segments:
+            if text:
+                yield text
+            if field is None:
+                continue
+            value = values[field]
+            if not isinstance(value, str):
+                if hasattr(value, '__iter__'):
+                    yield from iter_value(value, prefix, suffix)
+                    continue
+                value = str(value)
+            if value:
+                yield prefix
+                yield value
+                yield suffix
+
+    def render(self, **values):
+        """ Render this template with values for it's placeholders, and
+            return the content. See iter_render().
+        """
+        return ''.join(self.iter_render(**values))
+
+    def save(self, filepath):
+        """ Save compiled segments, for the next run. Errors are ignored,
+            the template is just compiled again next time.
+        """
+        dirpath = os.path.dirname(filepath)
+        try:
+            os.makedirs(dirpath, exist_ok=True)
+            fd, temppath = tempfile.mkstemp(dir=dirpath, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    marshal.dump((self.stamp, self.segments), f)
+                os.replace(temppath, filepath)
+            except BaseException:
+                os.remove(temppath)
+                raise
+        except EnvironmentError as ex:
+            debug(f'Unable to save compiled template: {filepath}\n{ex}')
+            return False
+        return True
+
+
+def compiled_path(filepath, indent=0, strip=False):
+    """ Return the path for a compiled template, in the __pycache__
+        directory next to the template file.
+    """
+    dirpath, filename = os.path.split(filepath)
+    name = os.path.splitext(filename)[0]
+    flags = f'{indent}s' if strip else str(indent)
+    return os.path.join(
+        dirpath,
+        '__pycache__',
+        f'{name}.glader-{TEMPLATE_VERSION}-{flags}.tpl',
+    )
 
 
 def fatal_err(*args, **kwargs):
@@ -22,20 +232,80 @@ def fatal_err(*args, **kwargs):
     sys.exit(1)
 
 
-def get_template(name, indent=0):
-    """ Retrieve template content by name ('body', 'cls', ...) """
-    filepath = TEMPLATE_FILES.get(name, None)
-    if filepath is None:
-        print_err(f'\nUnknown template name: {name!r}')
-        sys.exit(1)
+def get_template(name, indent=0, strip=False):
+    """ Retrieve a compiled Template by name ('body', 'cls', ...).
+        A template file in USER_TEMPLATEDIR is used instead of the built-in
+        template with the same name. Templates are only compiled again when
+        their file changes.
+    """
+    global _templates_hash
+    if name not in TEMPLATE_NAMES:
+        fatal_err(f'\nUnknown template name: {name!r}')
+    for filepath in template_paths(name):
+        try:
+            st = os.stat(filepath)
+        except FileNotFoundError:
+            continue
+        except EnvironmentError as ex:
+            fatal_err(f'Unable to read template file: {filepath}\n{ex}')
+        break
+    else:
+        fatal_err(f'Missing template file for {name!r}: {filepath}')
+
+    key = (name, indent, strip)
+    template = _templates.get(key, None)
+    if (
+            (template is not None) and
+            (template.filepath == filepath) and
+            (template.stamp == (st.st_mtime_ns, st.st_size))):
+        return template
     try:
-        with open(filepath, 'r') as f:
-            content = ''.join(parse_template(f, indent=indent))
+        template = Template.from_file(
+            filepath,
+            indent=indent,
+            strip=strip,
+            name=name,
+        )
     except FileNotFoundError:
         fatal_err(f'File was deleted before it was read!: {filepath}')
     except EnvironmentError as ex:
         fatal_err(f'Unable to read template file: {filepath}\n{ex}')
-    return content
+    except ValueError as ex:
+        fatal_err(f'\n{ex}')
+    debug(f'Loaded template: {filepath}')
+    _templates[key] = template
+    _templates_hash = None
+    return template
+
+
+def get_templates_hash(reload=False):
+    """ Return a hex digest for all loaded templates.
+        This is only computed once for each set of loaded templates, unless
+        `reload` is truthy.
+    """
+    global _templates_hash
+    if (_templates_hash is not None) and not reload:
+        return _templates_hash
+    h = hashlib.sha256()
+    for key in sorted(_templates):
+        h.update(repr(key).encode('utf-8'))
+        h.update(marshal.dumps(_templates[key].segments))
+    _templates_hash = h.hexdigest()
+    return _templates_hash
+
+
+def iter_value(chunks, prefix='', suffix=''):
+    """ Yield chunks from an iterable value, with a prefix and suffix if
+        any of them are non-empty.
+    """
+    chunks = iter(chunks)
+    for chunk in chunks:
+        if chunk:
+            yield prefix
+            yield chunk
+            yield from chunks
+            yield suffix
+            return
 
 
 def parse_template(lines, indent=0):
@@ -53,7 +323,7 @@ def parse_template(lines, indent=0):
         if not (yielded or stripped):
             # Only blank lines so far (from ignoring lines).
             continue
-        yield f'{spaces}{line}'
+        yield f'{spaces}{line}' if stripped else line
         yielded += 1
 
 
@@ -62,10 +332,14 @@ def print_err(*args, **kwargs):
     print(*args, **kwargs)
 
 
-if not os.path.exists(TEMPLATEDIR):
-    fatal_err(f'\nMissing ./templates directory for Glader in: {SCRIPTDIR}')
-
-# Ensure all template files are present.
-for name, path in TEMPLATE_FILES.items():
-    if not os.path.exists(path):
-        fatal_err(f'Missing template file for {name!r}: {path}')
+def template_paths(name=None):
+    """ Return all file paths that a template may be loaded from, user
+        templates first. With no `name`, paths for all templates are
+        returned.
+    """
+    names = TEMPLATE_NAMES if name is None else (name, )
+    return [
+        os.path.join(dirpath, f'{s}.py')
+        for s in names
+        for dirpath in (USER_TEMPLATEDIR, TEMPLATEDIR)
+    ]
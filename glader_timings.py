@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+""" Glader - Timings
+    Wall time for each phase of a run, counters, and profiling.
+"""
+import json
+import time
+from contextlib import contextmanager
+
+
+class Timings(object):
+    """ Collects wall time for each phase of a run (parse, render, ...),
+        and counters (objects, signals, cache hits, ...).
+        Phases may be nested, each phase's time includes the phases inside
+        of it.
+
+        Glader modules record into the shared `timings` instance, which can
+        be used from the Python API:
+            timings.reset()
+            GladeFile(filepath).get_content()
+            print(timings.format())
+    """
+    def __init__(self):
+        # Seconds spent in each phase, in the order they were first seen.
+        self.phases = {}
+        self.counters = {}
+
+    def __bool__(self):
+        return bool(self.phases or self.counters)
+
+    def as_dict(self):
+        """ Return a JSON-friendly dict of phases and counters. """
+        return {
+            'phases': {k: round(v, 6) for k, v in self.phases.items()},
+            'counters': dict(self.counters),
+        }
+
+    def count(self, name, amount=1):
+        """ Add to a counter. """
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def format(self, fmt='text'):
+        """ Return timings as a 'text' table, or 'json'. """
+        if fmt == 'json':
+            return json.dumps(self.as_dict(), indent=4)
+        lines = ['Timings:']
+        lines.extend(
+            f'    {name:<24} {seconds * 1000:>10.2f}ms'
+            for name, seconds in self.phases.items()
+        )
+        lines.append('Counters:')
+        lines.extend(
+            f'    {name:<24} {value:>12}'
+            for name, value in sorted(self.counters.items())
+        )
+        return '\n'.join(lines)
+
+    def merge(self, data):
+        """ Add phases and counters from another Timings.as_dict(), like
+            the timings from a worker process.
+        """
+        for name, seconds in data.get('phases', {}).items():
+            self.phases[name] = self.phases.get(name, 0) + seconds
+        for name, value in data.get('counters', {}).items():
+            self.count(name, value)
+
+    @contextmanager
+    def phase(self, name):
+        """ Time a phase of the run:
+                with timings.phase('parse'):
+                    ...
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = (
+                self.phases.get(name, 0) + (time.perf_counter() - start)
+            )
+
+    def pop(self):
+        """ Return Timings.as_dict(), and reset the timings. """
+        data = self.as_dict()
+        self.reset()
+        return data
+
+    def reset(self):
+        """ Remove all phases and counters. """
+        self.phases = {}
+        self.counters = {}
+
+
+def profile_call(filepath, func, *args, **kwargs):
+    """ Call a function with cProfile, and save the stats to `filepath`.
+        The stats can be read with `python -m pstats <filepath>`.
+        Returns the function's result.
+    """
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        profiler.dump_stats(filepath)
+
+
+# Shared timings, recorded by Glader modules.
+timings = Timings()
@@ -4,26 +4,58 @@
     -Christopher Welborn 09-15-2014
 """
 
+import glob
 import os
 import sys
+import threading
 from glader_core import (
+    __version__,
+    CONFIGDIR,
+    CONFIGFILE,
     NAME,
     VERSIONSTR,
+    debug,
+    ensure_config_dir,
     import_fail,
 )
-from glader_util import (
-    settings,
-    GladeFile,
+from glader_gresource import (
+    compile_gresource,
+    content_bundle_name,
+    resource_path,
 )
+from glader_worker import GenerateWorker, split_hunks
 
 try:
+    from easysettings import EasySettings
     from gi import require_version as gi_require_version
     gi_require_version('Gtk', '3.0')
     gi_require_version('GtkSource', '3.0')
-    from gi.repository import Gtk, GtkSource, GObject, Pango
+    from gi.repository import Gio, GLib, Gtk, GtkSource, GObject, Pango
 except ImportError as eximp:
     import_fail(eximp)
 
+# EasySettings, loaded by get_settings() after the window is shown.
+settings = None
+
+# Seconds to wait before generating code, so that quick clicks and option
+# changes only generate it once.
+GENERATE_DELAY = 0.15
+# Generated code with more lines than this is shown read-only, without
+# syntax highlighting.
+LARGE_OUTPUT_LINES = 20000
+# Changed lines applied to the output buffer in each idle call.
+UPDATE_LINES = 2000
+# Glader's own glade file. It's compiled into a GResource bundle in
+# CONFIGDIR, named for it's content (see content_bundle_name()).
+GLADER_GLADE_FILE = os.path.join(
+    os.path.abspath(sys.path[0]),
+    'glader.glade'
+)
+# Number of UI bundles kept in CONFIGDIR, see compile_ui_bundle().
+UI_BUNDLE_LIMIT = 4
+# Preferred themes, used when no theme has been saved.
+THEME_PREFS = ('oblivion', 'tomorrownighteighties', 'twilight', 'kate')
+
 
 class App(Gtk.Window):
 
@@ -38,14 +70,20 @@ class App(Gtk.Window):
         GObject.type_register(GtkSource.View)
 
         try:
-            scriptdir = os.path.abspath(sys.path[0])
-            gladefile = os.path.join(scriptdir, 'glader.glade')
-            self.builder.add_from_file(gladefile)
+            build_ui(self.builder)
         except Exception as ex:
             print('\nError building main window!\n{}'.format(ex))
             sys.exit(1)
-        # A GladeFile() instance set by generate_code().
+        # A GladeFile() instance set by generate_code_done().
         self.glade = None
+        # Code is generated in a background thread, and handed back to
+        # generate_code_done() on the main thread. The parsed file is kept
+        # until it changes, so changing options only renders it again.
+        self.worker = GenerateWorker(
+            self.generate_code_done,
+            schedule=GLib.idle_add,
+            delay=GENERATE_DELAY,
+        )
 
         # Warnings issued already in generate_code().
         # If a file needs a warning, the warning will be issued
@@ -55,24 +93,10 @@ class App(Gtk.Window):
 
         # Get gui objects
         self.btnFileOpen = self.builder.get_object('btnFileOpen')
-        if filepath:
-            # This will automatically trigger code generation
-            # because of btnFileOpen_selection_changed_cb()
-            self.btnFileOpen.set_filename(filepath)
-
         self.btnGenerate = self.builder.get_object('btnGenerate')
         self.btnSave = self.builder.get_object('btnSave')
         self.chkDynamic = self.builder.get_object('chkDynamic')
-        if not dynamic_init:
-            # Load from settings if not set already.
-            dynamic_init = settings.get_bool('dynamic_init', default=False)
-        self.chkDynamic.set_active(dynamic_init)
-
         self.chkLibMode = self.builder.get_object('chkLibMode')
-        if not lib_mode:
-            # Load from settings if not set already.
-            lib_mode = settings.get_bool('lib_mode', default=False)
-        self.chkLibMode.set_active(lib_mode)
 
         self.comboTheme = self.builder.get_object('comboTheme')
         # Initialize the cell renderer for the theme list.
@@ -85,42 +109,44 @@ class App(Gtk.Window):
         self.lblFileOpen = self.builder.get_object('lblFileOpen')
 
         self.lblOutput = self.builder.get_object('lblOutput')
+        self.lblOutputText = self.lblOutput.get_text()
         self.scrollOutput = self.builder.get_object('scrollOutput')
-        # Build the SourceView and SourceBuffer with Python highlighting
+        # Build the SourceView and SourceBuffer. Python highlighting is
+        # set by load_deferred(), after the window is shown.
         self.bufferOutput = GtkSource.Buffer()
-        self.langManager = GtkSource.LanguageManager()
-        self.bufferLang = self.langManager.get_language('python3')
-        self.bufferOutput.set_language(self.bufferLang)
         self.bufferOutput.set_highlight_syntax(True)
         self.bufferOutput.set_highlight_matching_brackets(True)
-        # Set theme.
+        # Counts changes made by the user, to know when a diff is stale.
+        self.buffer_version = 0
+        # buffer_version when the newest job was submitted.
+        self.submitted_version = 0
+        # Whether update_step() is changing the buffer.
+        self.updating = False
+        # (filepath, code) for the code in the buffer, before the user's
+        # changes, so new code can be merged without overwriting them.
+        self.generated = None
+        # (filepath, code) being applied by update_step().
+        self.update_code = None
+        # GLib source id for update_step(), while an update is running.
+        self.update_source = None
+        # Whether the output is too large to edit/highlight.
+        self.large_output = False
+        self.bufferOutput.connect('changed', self.bufferOutput_changed_cb)
         self.themeManager = GtkSource.StyleSchemeManager()
-        # Map from theme id to StyleScheme.
-        self.themes = {
-            tid: self.themeManager.get_scheme(tid)
-            for tid in self.themeManager.get_scheme_ids()
-        }
+        # Map from theme id to StyleScheme, set by load_themes() when the
+        # theme list is first opened.
+        self.themes = None
         # Holds the currently selected theme info.
         self.theme = None
-        # Load theme from config if available.
-        if not self.set_theme_config():
-            # Use first preferred theme if available.
-            themeprefs = (
-                'oblivion', 'tomorrownighteighties', 'twilight', 'kate'
-            )
-            for themeid in themeprefs:
-                theme = self.themes.get(themeid, None)
-                if theme:
-                    self.set_theme(theme)
-                    break
-
-        # Load theme names and select the chosen theme.
-        self.build_theme_list()
+        # Whether listTheme has every theme, see build_theme_list().
+        self.theme_list_built = False
 
         # Build actual view for the code.
         self.srcviewOutput = self.builder.get_object('srcviewOutput')
         self.srcviewOutput.set_buffer(self.bufferOutput)
         self.srcviewOutput.modify_font(Pango.FontDescription('monospace'))
+        # Spins while code is being generated.
+        self.spinGenerate = self.builder.get_object('spinGenerate')
         # This window.
         self.winMain = self.builder.get_object('winMain')
 
@@ -139,6 +165,14 @@ class App(Gtk.Window):
         self.winMain.set_title(VERSIONSTR)
         # Show the main window.
         self.winMain.show_all()
+        # Settings, highlighting, and the theme are loaded after the window
+        # is drawn.
+        GLib.idle_add(self.load_deferred, filepath, dynamic_init, lib_mode)
+
+    def bufferOutput_changed_cb(self, widget, user_data=None):
+        """ Handler for bufferOutput.changed. """
+        if not self.updating:
+            self.buffer_version += 1
 
     def btnFileOpen_selection_changed_cb(self, widget, user_data=None):
         """ Handler for btnFileOpen.selection-changed. """
@@ -166,6 +200,14 @@ class App(Gtk.Window):
         """ Handler for btnSave.activate. """
         return self.write_file()
 
+    def chkDynamic_toggled_cb(self, widget, user_data=None):
+        """ Handler for chkDynamic.toggled. """
+        self.options_changed()
+
+    def chkLibMode_toggled_cb(self, widget, user_data=None):
+        """ Handler for chkLibMode.toggled. """
+        self.options_changed()
+
     def comboTheme_changed_cb(self, widget, user_data=None):
         """ Handler for comboTheme.changed
             Sets the current theme for srcviewOutput.
@@ -176,14 +218,26 @@ class App(Gtk.Window):
             return None
         # Value for column 0 (the theme name)
         themename = self.listTheme.get_value(selitr, 0)
+        if (self.theme is not None) and (themename == self.theme.get_name()):
+            # Already set, the theme list doesn't need to be loaded.
+            return None
         self.set_theme(themename)
 
+    def comboTheme_notify_popup_shown_cb(
+            self, widget, param, user_data=None):
+        """ Handler for comboTheme.notify::popup-shown.
+            Builds the full theme list the first time it's opened.
+        """
+        if widget.get_property('popup-shown') and not self.theme_list_built:
+            self.build_theme_list()
+
     def winMain_destroy_cb(self, widget, user_data=None):
         """ Handler for winMain.destroy. """
         # Try saving some preferences.
         # Setting dynamic_init as a string is not needed with EasySettings,
         # but I am doing it for human-friendly editing reasons.
         # Pickle strings are ugly, and EasySettings.get_bool() will parse it.
+        settings = get_settings()
         settings.set(
             'dynamic_init',
             str(self.chkDynamic.get_active()).lower()
@@ -192,8 +246,11 @@ class App(Gtk.Window):
             'lib_mode',
             str(self.chkLibMode.get_active()).lower()
         )
-        settings.set('theme_id', self.theme.get_id())
+        if self.theme is not None:
+            settings.set('theme_id', self.theme.get_id())
         settings.save()
+        # Don't wait for a large file to finish parsing.
+        self.worker.stop(timeout=0)
         Gtk.main_quit()
 
     # Helper functions -----------------------------------------------------
@@ -201,13 +258,16 @@ class App(Gtk.Window):
         """ Build the content for self.listTheme based on self.themes.
             Sorts the names first.
         """
+        self.load_themes()
+        self.theme_list_built = True
+        self.listTheme.clear()
         selected = -1
         themeids = sorted(
             self.themes,
             key=lambda k: self.themes[k].get_name()
         )
         themenames = sorted((self.themes[k].get_name() for k in themeids))
-        selthemename = self.theme.get_name()
+        selthemename = self.theme.get_name() if self.theme else None
         for i, themename in enumerate(themenames):
             newrow = self.listTheme.append((themename, ))
             self.listTheme.set_value(newrow, 0, themename)
@@ -218,46 +278,199 @@ class App(Gtk.Window):
             self.comboTheme.set_active(selected)
 
     def generate_code(self):
-        """ Does the actual glade parsing/code generation. """
+        """ Start glade parsing/code generation in the background.
+            Any generation that is already running is cancelled, and
+            generate_code_done() is called with the result.
+        """
         filepath = self.btnFileOpen.get_filename()
         if not filepath:
             self.msgs.warn('Please select an input file.')
             return None
         elif not os.path.exists(filepath):
+            self.worker.cancel()
+            self.stop_update()
+            self.set_generating(False)
             self.glade = None
+            self.generated = None
             self.bufferOutput.set_text('')
             self.msgs.warn('Glade file does not exist: {}'.format(filepath))
             return None
 
-        dynamic = self.chkDynamic.get_active()
-        try:
-            gladefile = GladeFile(filepath=filepath, dynamic_init=dynamic)
-        except Exception as ex:
+        # The new code is compared to the last code, and the changes are
+        # merged into the buffer, so only the changed lines are replaced
+        # and the user's edits are kept. Edits aren't kept for another
+        # file.
+        self.stop_update()
+        self.submitted_version = self.buffer_version
+        text = self.get_output_text()
+        if (self.generated is None) or (self.generated[0] != filepath):
+            base, edited = text, None
+        else:
+            base, edited = self.generated[1], text
+        self.worker.submit(
+            filepath,
+            dynamic_init=self.chkDynamic.get_active(),
+            lib_mode=self.chkLibMode.get_active(),
+            base=base,
+            edited=edited,
+        )
+        self.set_generating(True)
+
+    def generate_code_done(self, job):
+        """ Show the result of a GenerateJob from generate_code().
+            This is called on the main thread, and only for the newest job.
+        """
+        if job.error is not None:
+            self.set_generating(False)
             errfmt = 'Error parsing glade file:\n   {}\n\n{}'
-            self.msgs.error(errfmt.format(filepath, ex))
+            self.msgs.error(errfmt.format(job.filepath, job.error))
             self.glade = None
             return None
-
-        lib_mode = self.chkLibMode.get_active()
-        content = gladefile.get_content(lib_mode=lib_mode)
-        self.bufferOutput.set_text(content)
-        self.glade = gladefile
-        warnings = gladefile.warning_msgs()
+        if self.buffer_version != self.submitted_version:
+            # The buffer was edited while the code was generated, so the
+            # changes are stale. The parsed file is reused for this.
+            return self.generate_code()
+
+        self.glade = job.gladefile
+        self.set_large_output(job.content.count('\n') > LARGE_OUTPUT_LINES)
+        self.update_code = (job.filepath, job.content)
+        self.start_update(job.hunks)
+        warnings = job.gladefile.warning_msgs()
+        filepath = job.filepath
         if warnings and (self.warned_files.get(filepath, None) != warnings):
             self.warned_files[filepath] = warnings
             self.msgs.warn(warnings)
 
+    def finish_update(self):
+        """ Turn highlighting back on after an update, highlighting the
+            visible lines first. GtkSource highlights the rest when idle.
+        """
+        self.set_generating(False)
+        highlight = not self.large_output
+        if self.bufferOutput.get_highlight_syntax() == highlight:
+            return None
+        self.bufferOutput.set_highlight_syntax(highlight)
+        if highlight:
+            rect = self.srcviewOutput.get_visible_rect()
+            self.bufferOutput.ensure_highlight(
+                self.get_view_iter(rect.x, rect.y),
+                self.get_view_iter(
+                    rect.x + rect.width,
+                    rect.y + rect.height,
+                ),
+            )
+
+    def get_line_iter(self, line):
+        """ Return a TextIter for the start of a line in the output buffer,
+            or the end of the buffer if there is no such line.
+        """
+        if line >= self.bufferOutput.get_line_count():
+            return self.bufferOutput.get_end_iter()
+        return self.bufferOutput.get_iter_at_line(line)
+
+    def get_output_text(self):
+        """ Return all text in the output buffer. """
+        return self.bufferOutput.get_text(
+            self.bufferOutput.get_start_iter(),
+            self.bufferOutput.get_end_iter(),
+            True,
+        )
+
     def get_theme_by_name(self, name):
         """ Retrieves a StyleScheme from self.themes by it's proper name.
             Like: Kate, or Oblivion.
             Returns None if the theme can't be found.
         """
+        self.load_themes()
         for themeid, stylescheme in self.themes.items():
             themename = stylescheme.get_name()
             if name == themename:
                 return stylescheme
         return None
 
+    def get_view_iter(self, x, y):
+        """ Return a TextIter for a buffer location in srcviewOutput. """
+        found = self.srcviewOutput.get_iter_at_location(x, y)
+        # Gtk 3.20+ returns (found, iter).
+        return found[1] if isinstance(found, tuple) else found
+
+    def load_deferred(self, filepath=None, dynamic_init=False, lib_mode=False):
+        """ Finish loading after the window is shown. Loads settings,
+            Python highlighting, and the theme, and opens the input file.
+            This is called once by GLib.idle_add(), so it returns False.
+        """
+        settings = get_settings()
+        if not dynamic_init:
+            # Load from settings if not set already.
+            dynamic_init = settings.get_bool('dynamic_init', default=False)
+        self.chkDynamic.set_active(dynamic_init)
+        if not lib_mode:
+            # Load from settings if not set already.
+            lib_mode = settings.get_bool('lib_mode', default=False)
+        self.chkLibMode.set_active(lib_mode)
+
+        self.langManager = GtkSource.LanguageManager()
+        self.bufferLang = self.langManager.get_language('python3')
+        self.bufferOutput.set_language(self.bufferLang)
+
+        # Load theme from config if available. Only the chosen theme is
+        # loaded here, the rest are loaded when the theme list is opened.
+        if not self.set_theme_config():
+            # Use first preferred theme if available, or GtkSource's
+            # default theme.
+            for themeid in (*THEME_PREFS, 'classic'):
+                theme = self.themeManager.get_scheme(themeid)
+                if theme is not None:
+                    self.set_theme(theme)
+                    break
+        self.show_theme()
+
+        if filepath:
+            # This will automatically trigger code generation
+            # because of btnFileOpen_selection_changed_cb()
+            self.btnFileOpen.set_filename(filepath)
+        return False
+
+    def load_themes(self):
+        """ Load every StyleScheme into self.themes, if they haven't been
+            loaded yet.
+        """
+        if self.themes is not None:
+            return None
+        self.themes = {
+            tid: self.themeManager.get_scheme(tid)
+            for tid in self.themeManager.get_scheme_ids()
+        }
+
+    def options_changed(self):
+        """ Generate code again when the options change, if a file has been
+            selected.
+        """
+        if self.btnFileOpen.get_filename():
+            self.generate_code()
+
+    def set_generating(self, generating):
+        """ Show or hide the busy state while code is being generated. """
+        if generating:
+            self.spinGenerate.start()
+            self.lblOutput.set_text('Generating code...')
+            return None
+        self.spinGenerate.stop()
+        if self.large_output:
+            self.lblOutput.set_text(
+                'Generated code (read-only, too large to highlight):'
+            )
+        else:
+            self.lblOutput.set_text(self.lblOutputText)
+
+    def set_large_output(self, large):
+        """ Switch srcviewOutput to a fast read-only view for very large
+            code, or back to the normal view.
+        """
+        self.large_output = large
+        self.srcviewOutput.set_editable(not large)
+        self.srcviewOutput.set_highlight_current_line(not large)
+
     def set_theme(self, scheme_identifier):
         """ Sets the current highlight theme by id, name, or StyleScheme.
             or by prefetched StyleScheme.
@@ -265,7 +478,7 @@ class App(Gtk.Window):
         """
         if isinstance(scheme_identifier, str):
             # Id or name?
-            theme = self.themes.get(scheme_identifier, None)
+            theme = self.themeManager.get_scheme(scheme_identifier)
             if theme is None:
                 # Name.
                 theme = self.get_theme_by_name(scheme_identifier)
@@ -287,17 +500,87 @@ class App(Gtk.Window):
         """ Try loading a theme from config.
             Return True if a theme was set, otherwise False.
         """
-        themeid = settings.get('theme_id', None)
+        themeid = get_settings().get('theme_id', None)
         if themeid:
             return self.set_theme(themeid)
 
+    def show_theme(self):
+        """ Show the current theme in comboTheme, without loading the
+            theme list.
+        """
+        if self.theme_list_built or (self.theme is None):
+            return None
+        self.listTheme.clear()
+        self.comboTheme.set_active_iter(
+            self.listTheme.append((self.theme.get_name(), ))
+        )
+
+    def start_update(self, hunks):
+        """ Apply changed lines from line_hunks() to the output buffer,
+            a few at a time when the main loop is idle.
+            Highlighting is turned off for large updates, until they are
+            finished.
+        """
+        self.stop_update()
+        if not hunks:
+            self.generated = self.update_code
+            self.finish_update()
+            return None
+        changed = sum(
+            max(end - start, len(lines))
+            for start, end, lines in hunks
+        )
+        if (changed > UPDATE_LINES) or self.large_output:
+            self.bufferOutput.set_highlight_syntax(False)
+        self.update_source = GLib.idle_add(
+            self.update_step,
+            split_hunks(hunks, UPDATE_LINES),
+        )
+
+    def stop_update(self):
+        """ Stop an update that is running, leaving the buffer as it is. """
+        if self.update_source is None:
+            return None
+        GLib.source_remove(self.update_source)
+        self.update_source = None
+        self.finish_update()
+
+    def update_step(self, hunks):
+        """ Apply hunks to the output buffer until UPDATE_LINES lines have
+            changed. Returns True while there are hunks left, so GLib calls
+            it again.
+        """
+        if self.buffer_version != self.submitted_version:
+            # The user edited the buffer, the hunks don't fit anymore.
+            self.update_source = None
+            self.finish_update()
+            self.generate_code()
+            return False
+        buf = self.bufferOutput
+        changed = 0
+        self.updating = True
+        buf.begin_not_undoable_action()
+        try:
+            for start, end, lines in hunks:
+                buf.delete(self.get_line_iter(start), self.get_line_iter(end))
+                buf.insert(self.get_line_iter(start), ''.join(lines))
+                changed += max(end - start, len(lines))
+                if changed >= UPDATE_LINES:
+                    return True
+        finally:
+            buf.end_not_undoable_action()
+            self.updating = False
+        # Only finished updates are merged with, the lines from an
+        # unfinished update look like the user's edits.
+        self.generated = self.update_code
+        self.update_source = None
+        self.finish_update()
+        return False
+
     def write_file(self):
         """ Write the generated code to a file. """
         # Get generated code content.
-        content = self.bufferOutput.get_text(
-            self.bufferOutput.get_start_iter(),
-            self.bufferOutput.get_end_iter(),
-            True)
+        content = self.get_output_text()
 
         if not content:
             self.msgs.error('There is nothing to save.')
@@ -441,6 +724,64 @@ class MessageBoxes(object):
         return True if response == Gtk.ResponseType.YES else False
 
 
+def build_ui(builder):
+    """ Build Glader's UI with a Gtk.Builder. It's built from a memory-mapped
+        GResource bundle when there is one for this glade file's content, so
+        glader.glade isn't parsed as a file at start up. Otherwise it's
+        built from the glade file, and the bundle is compiled in the
+        background for the next start.
+    """
+    bundle = content_bundle_name(GLADER_GLADE_FILE, CONFIGDIR)
+    if os.path.exists(bundle):
+        try:
+            resource = Gio.Resource.load(bundle)
+            resource._register()
+            builder.add_from_resource(resource_path(GLADER_GLADE_FILE))
+            return None
+        except GLib.Error as ex:
+            debug(f'Unable to load the UI bundle: {ex}')
+    builder.add_from_file(GLADER_GLADE_FILE)
+    threading.Thread(
+        target=compile_ui_bundle,
+        args=(bundle, ),
+        name='glader-bundle',
+        daemon=True,
+    ).start()
+
+
+def compile_ui_bundle(bundle):
+    """ Compile glader.glade into a bundle for build_ui(), and remove old
+        bundles for other versions of it.
+        This runs in a background thread. Errors are only printed in debug
+        mode, the glade file is used until the bundle can be compiled.
+    """
+    try:
+        ensure_config_dir()
+        compile_gresource(GLADER_GLADE_FILE, bundle)
+        # Installed and development copies of Glader share CONFIGDIR, so
+        # a few of the newest bundles are kept.
+        bundles = sorted(
+            glob.glob(os.path.join(CONFIGDIR, 'glader*.gresource')),
+            key=os.path.getmtime,
+            reverse=True,
+        )
+        for oldbundle in bundles[UI_BUNDLE_LIMIT:]:
+            os.remove(oldbundle)
+    except EnvironmentError as ex:
+        debug(f'Unable to compile the UI bundle: {ex}')
+
+
+def get_settings():
+    """ Return Glader's EasySettings, loading them the first time. """
+    global settings
+    if settings is None:
+        ensure_config_dir()
+        settings = EasySettings(CONFIGFILE)
+        settings.name = NAME
+        settings.version = __version__
+    return settings
+
+
 def inspect_object(o):
     """ Prints a repr() and dir() for an object for debugging. """
     print('{!r}:'.format(o))
@@ -3,53 +3,75 @@
     Helper classes for parsing glade files and generating skeleton code.
     -Christopher Welborn 09-14-14
 """
+import io
 import os.path
 import stat
-from datetime import datetime
+import sys
+import tempfile
+import threading
+from array import array
+from datetime import datetime, timezone
 
 from glader_core import (
-    __version__,
-    CONFIGFILE,
-    NAME,
     debug,
-    ensure_config_dir,
     import_fail,
 )
-from glader_templates import get_template
-
-
-try:
-    from easysettings import EasySettings
-    from gi import require_version as gi_require_version
-    gi_require_version('Gtk', '3.0')
-    from gi.repository import Gtk
-    from lxml import etree
-    from lxml.cssselect import CSSSelector
-except ImportError as eximp:
-    import_fail(eximp)
-
-ensure_config_dir()
-settings = EasySettings(CONFIGFILE)
-settings.name = NAME
-settings.version = __version__
-
+from glader_cache import GladeCache
+from glader_signatures import gtk_id, signature_db
+from glader_templates import get_template, get_templates_hash
+from glader_timings import timings
+
+# Gtk is not imported here. It is only needed for introspection, which
+# glader_signatures handles (and avoids when it can).
+# lxml is imported by get_etree(), when a file is actually parsed.
+
+# Format for the date in generated code.
+DATE_FORMAT = '%m-%d-%Y'
+# Mode for generated files (chmod 774), so scripts are executable.
+MODE_EXECUTABLE = stat.S_IRWXU | stat.S_IRWXG | stat.S_IROTH
+# Streamed code larger than this (in characters) is not cached, so
+# GladeFile.iter_content() never holds a whole large file in memory.
+STREAM_CACHE_LIMIT = 1024 * 1024
+
+# Parsing and rendering use Gtk introspection, the signature database, the
+# templates, and timings, which are all module-level state. Threads that
+# generate code at the same time take turns with this lock.
+generate_lock = threading.RLock()
+
+# Glade file path for generated code, when XML is parsed from memory or a
+# stream and no path is given.
+SOURCE_FILEPATH = 'app.glade'
+
+# Init code for dynamic init, which sets every object in the class's
+# `builder_names` from the builder.
+DYNAMIC_INIT = '\n'.join((
+    'for objname in self.builder_names:',
+    '            self.set_object(objname)',
+))
+
+# Init code for lazy init, when no objects are set in __init__().
+LAZY_INIT = '# Objects are taken from the builder when first used.'
+
+# Compiled templates, set by load_templates().
 # Template for shebang/imports.
-template_header = get_template('header').rstrip()
+template_header = None
 # Template for the executable section.
-template_body = get_template('body')
+template_body = None
 # Class def for top level classes.
-template_cls = get_template('cls').rstrip()
+template_cls = None
 # Class def for sibling window classes.
-template_cls_sub = get_template('cls_sub').rstrip()
-# Function definition for set_object() when dynamic init is used.
-template_set_object = get_template('set_object', indent=4).rstrip()
-
-# Xpath to find all <object> elements in a glade file.
-xpath_object = CSSSelector('object').path
-# Xpath to find all <requires> elements.
-xpath_requires = CSSSelector('requires').path
-# Xpath to find all <signal> elements.
-xpath_signal = CSSSelector('signal').path
+template_cls_sub = None
+# Class defs that build their UI from a GResource bundle.
+template_cls_resource = None
+template_cls_sub_resource = None
+# Loader for a GResource bundle.
+template_resource = None
+# Function definition for set_object() when dynamic init is used (a str).
+template_set_object = None
+# Function definition for __getattr__() when lazy init is used (a str).
+template_lazy_getattr = None
+# Property definition for a sibling window when lazy windows are used.
+template_lazy_window = None
 
 
 class GladeFile(object):
@@ -63,30 +85,71 @@ class GladeFile(object):
     """
     no_main_marker = '?MainWindow?'
 
-    def __init__(self, filepath=None, dynamic_init=False):
+    def __init__(
+            self, filepath=None, dynamic_init=False, streaming=True,
+            cache=None, lazy_init=False, lazy_windows=False, source=None):
         """ Create a GladeFile to generate code from.
             Arguments:
-                filepath      : File to parse.
+                filepath      : File to parse. When `source` is given,
+                                this is only the glade file's path in
+                                generated code.
                 dynamic_init  : If true, generated code will dynamically
                                 create objects:
-                                    objects = ('obj1', 'obj2')
-                                    for objname in objects:
+                                    builder_names = ('obj1', 'obj2')
+                                    for objname in self.builder_names:
                                         self.set_object(objname)
 
                                 Otherwise, the normal method will be used:
                                     self.obj = self.builder.get_object('obj')
 
                                 Both achieve the same end result.
+                streaming     : If true, the file is parsed in a single pass
+                                with a GladeTarget, and no element tree is
+                                built. Otherwise the full element tree is
+                                parsed first, and then walked.
+                                Both produce the same output.
+                cache         : A GladeCache to load/store parsed info and
+                                generated code. Nothing is cached if this is
+                                None.
+                lazy_init     : If true, generated classes only get objects
+                                from the builder when they are first used,
+                                with a __getattr__() method and a table of
+                                object names:
+                                    builder_names = frozenset(('obj1', ))
+
+                                Sibling window classes are still created
+                                in __init__(). This can't be used with
+                                `dynamic_init`.
+                lazy_windows  : If true, sibling window classes are created
+                                by properties when they are first used,
+                                instead of in the App's __init__():
+                                    @property
+                                    def dlgAbout(self):
+                                        ...
+                source        : Glade XML to parse instead of a file, as
+                                bytes, a str, or a file object.
+                                See read_source().
         """
+        if dynamic_init and lazy_init:
+            raise ValueError('dynamic_init and lazy_init can\'t be combined.')
         self.filepath = filepath
         self.dynamic_init = dynamic_init
+        self.lazy_init = lazy_init
+        self.lazy_windows = lazy_windows
+        self.streaming = streaming
+        self.cache = cache
+        # Digest of the glade file's content, when a cache is used.
+        self.content_hash = None
 
         self.tree = None
         self.top_levels = []
         self.objects = []
         self.requires = []
         self.app_win = None
-        self.parse_file(filepath)
+        if source is None:
+            self.parse_file(filepath)
+        else:
+            self.parse_source(source, filepath=filepath)
 
     def __bool__(self):
         """ bool(GladeFile) is based on object count.
@@ -111,44 +174,242 @@ class GladeFile(object):
             )
         )
 
+    def copy(
+            self, filepath=None, dynamic_init=None, lazy_init=None,
+            lazy_windows=None):
+        """ Return a new GladeFile for another file with identical content,
+            sharing this one's parsed nodes instead of parsing it again.
+            With no `filepath`, this GladeFile's path is used.
+            Options that are not None replace this GladeFile's options, so
+            code can be generated another way without parsing the file
+            again.
+        """
+        gladefile = type(self)(
+            dynamic_init=(
+                self.dynamic_init if dynamic_init is None else dynamic_init
+            ),
+            streaming=self.streaming,
+            cache=self.cache,
+            lazy_init=self.lazy_init if lazy_init is None else lazy_init,
+            lazy_windows=(
+                self.lazy_windows if lazy_windows is None else lazy_windows
+            ),
+        )
+        gladefile.filepath = filepath or self.filepath
+        gladefile.content_hash = self.content_hash
+        gladefile.nodes = self.nodes
+        gladefile.init_objects()
+        return gladefile
+
     def extra_requires(self):
         """ Returns any extra Requires (not Gtk, and not empty). """
         return [r for r in self.requires if r.lib and (r.lib != 'gtk+')]
 
-    def get_content(self, lib_mode=False):
+    def get_content(self, lib_mode=False, date=None, gresource=None):
         """ Renders the main template with current GladeFile info.
             Returns a string that can be written to file.
+            When a cache is used, previously generated code is returned if
+            nothing that affects the output has changed.
+            See get_date() for the `date` argument.
+            If `gresource` is set, it is the file name of a GResource bundle
+            (see glader_gresource), in the generated code's directory, that
+            the UI is loaded from instead of the glade file.
         """
-        class_defs = '\n\n\n'.join((
-            self.app_win.get_class_content(
-                dynamic_init=self.dynamic_init,
-            ),
-            self.app_win.get_classes_content(
+        date = get_date(date)
+        key = self.content_key(
+            lib_mode=lib_mode,
+            date=date,
+            gresource=gresource,
+        )
+        if key is None:
+            with timings.phase('render'):
+                return self.render_content(
+                    lib_mode=lib_mode,
+                    date=date,
+                    gresource=gresource,
+                )
+
+        content = self.cache.get_content(key)
+        if content is None:
+            with timings.phase('render'):
+                content = self.render_content(
+                    lib_mode=lib_mode,
+                    date=date,
+                    gresource=gresource,
+                )
+            self.cache.set_content(key, content)
+        else:
+            debug(f'Using cached content for: {self.filepath}')
+        return content
+
+    def content_key(self, lib_mode=False, date=None, gresource=None):
+        """ Return the cache key for generated code, or None if no cache is
+            used.
+        """
+        if (self.cache is None) or (self.content_hash is None):
+            return None
+        return GladeCache.hash_key(
+            self.content_hash,
+            get_templates_hash(),
+            gtk_id(),
+            self.filepath,
+            self.dynamic_init,
+            self.lazy_init,
+            self.lazy_windows,
+            lib_mode,
+            get_date(date),
+            gresource,
+        )
+
+    def iter_class_content(self, gresource=None):
+        """ Yield the class definition for the App class, and then each
+            sibling window class.
+        """
+        if gresource:
+            from glader_gresource import resource_path
+            respath = resource_path(self.filepath)
+        else:
+            respath = None
+        yield self.app_win.get_class_content(
+            dynamic_init=self.dynamic_init,
+            resource_path=respath,
+            lazy_init=self.lazy_init,
+            lazy_windows=self.lazy_windows,
+        )
+        for obj in self.app_win.get_classes():
+            yield obj.get_class_content(
                 dynamic_init=self.dynamic_init,
-            ),
-        ))
+                resource_path=respath,
+                lazy_init=self.lazy_init,
+            )
+
+    def iter_content(self, lib_mode=False, date=None, gresource=None):
+        """ Like get_content(), but yields the generated code in chunks, one
+            class at a time, so the whole file is never held in memory.
+            Cached code is used if available, and code is only added to the
+            cache if it is smaller than STREAM_CACHE_LIMIT.
+            The chunks can be written with write_content() or write_stream().
+        """
+        date = get_date(date)
+        key = self.content_key(
+            lib_mode=lib_mode,
+            date=date,
+            gresource=gresource,
+        )
+        if key is not None:
+            content = self.cache.get_content(key)
+            if content is not None:
+                debug(f'Using cached content for: {self.filepath}')
+                yield content
+                return
+        # Chunks to cache, or None if the content is too big.
+        cached = None if key is None else []
+        size = 0
+        chunks = self.render_chunks(
+            lib_mode=lib_mode,
+            date=date,
+            gresource=gresource,
+        )
+        while True:
+            with timings.phase('render'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            if cached is not None:
+                size += len(chunk)
+                if size > STREAM_CACHE_LIMIT:
+                    cached = None
+                else:
+                    cached.append(chunk)
+            yield chunk
+        if cached is not None:
+            self.cache.set_content(key, ''.join(cached))
+
+    def render_chunks(self, lib_mode=False, date=None, gresource=None):
+        """ Renders the main template with current GladeFile info, without
+            using the cache, yielding chunks of code. Only one class
+            definition is rendered at a time.
+        """
+        date = get_date(date)
+        yield template_header.render(
+            requires=self.init_requires(),
+            date=date,
+        )
+        if gresource:
+            yield '\n'
+            yield template_resource.render(resource_file=gresource)
+            yield '\n\n\n'
+        else:
+            yield '\n\n'
+        class_defs = join_chunks(
+            '\n\n\n',
+            self.iter_class_content(gresource=gresource),
+        )
         if lib_mode:
-            return '\n\n'.join((
-                template_header.format(
-                    requires=self.init_requires(),
-                    date=datetime.today().strftime('%m-%d-%Y')
-                ),
-                class_defs,
-            ))
-        return '\n\n'.join((
-            template_header.format(
-                requires=self.init_requires(),
-                date=datetime.today().strftime('%m-%d-%Y')
-            ),
-            template_body.format(class_def=class_defs),
-        )).replace('\n\n\n\n', '\n\n')
+            yield from class_defs
+            yield '\n'
+            return
+        yield from template_body.iter_render(class_def=class_defs)
+
+    def render_content(self, lib_mode=False, date=None, gresource=None):
+        """ Renders the main template with current GladeFile info, without
+            using the cache.
+        """
+        return ''.join(self.render_chunks(
+            lib_mode=lib_mode,
+            date=date,
+            gresource=gresource,
+        ))
+
+    def get_ancestors(self, name):
+        """ Return ObjectInfos for all objects that hold an object, from
+            nearest to outer-most.
+        """
+        if self.nodes is None:
+            return []
+        index = self.nodes.ids.get(name, None)
+        if index is None:
+            return []
+        return self.nodes.views(self.nodes.ancestors(index))
+
+    def get_descendants(self, name):
+        """ Return ObjectInfos for all objects inside an object, without
+            any hierarchy.
+        """
+        objinfo = self.get_object(name)
+        return [] if objinfo is None else objinfo.objects_all()
 
     def get_object(self, name, default=None):
         """ Retrieve an ObjectInfo by object name. """
-        for o in self.objects:
-            if o.name == name:
-                return o
-        return default
+        if self.nodes is None:
+            return default
+        index = self.nodes.ids.get(name, None)
+        if index is None:
+            return default
+        return self.nodes.view(index)
+
+    def get_objects_by_widget(self, widget):
+        """ Retrieve all ObjectInfos for a widget class, in document order.
+            The 'Gtk' prefix is optional: 'GtkTreeView' or 'TreeView'.
+        """
+        if self.nodes is None:
+            return []
+        indexes = self.nodes.classes.get(widget, None)
+        if (indexes is None) and not widget.startswith('Gtk'):
+            indexes = self.nodes.classes.get(f'Gtk{widget}', None)
+        return self.nodes.views(indexes or [])
+
+    def get_signal(self, handler, default=None):
+        """ Retrieve the first SignalHandler for a handler name. """
+        signals = self.get_signals(handler)
+        return signals[0] if signals else default
+
+    def get_signals(self, handler):
+        """ Retrieve all SignalHandlers for a handler name. """
+        if self.nodes is None:
+            return []
+        signals = self.nodes.signals
+        return [signals[i] for i in self.nodes.handlers.get(handler, [])]
 
     def get_app_window(self):
         """ Inspect all objects, return the name for the first one that
@@ -156,11 +417,9 @@ class GladeFile(object):
             Returns '?MainWindow?' on failure, so any generated code
             will immediately raise an exception when ran.
         """
-        windows = [
-            o
-            for o in self.objects
-            if ('win' in o.name.lower()) or ('Window' in o.widget)
-        ]
+        windows = [] if self.nodes is None else (
+            self.nodes.views(self.nodes.windows)
+        )
         if not windows:
             return ObjectApp(name=self.no_main_marker)
 
@@ -176,6 +435,18 @@ class GladeFile(object):
         # Can't find a 'main' window. Return the first one.
         return ObjectApp.from_object_info(windows[0], self.filepath)
 
+    def init_objects(self):
+        """ Build objects, requires, and the app window from self.nodes. """
+        with timings.phase('objects'):
+            self.top_levels = self.objects_top_level()
+            self.objects = self.objects_all()
+            self.requires = self.objects_requires()
+        with timings.phase('app_window'):
+            self.app_win = self.get_app_window()
+        timings.count('objects', len(self.objects))
+        if self.nodes is not None:
+            timings.count('signals', len(self.nodes.signals))
+
     def init_requires(self):
         """ Returns init code for all extra Requires. """
         return '\n'.join(r.init_code() for r in self.extra_requires())
@@ -183,9 +454,7 @@ class GladeFile(object):
     def make_executable(self, filepath=None):
         """ Make a file executable, by setting mode 774. """
         filepath = filepath or self.filepath
-        # chmod 774
-        mode774 = stat.S_IRWXU | stat.S_IRWXG | stat.S_IROTH
-        os.chmod(filepath, mode774)
+        os.chmod(filepath, MODE_EXECUTABLE)
 
     def msg_extra_requires(self):
         """ Returns a warning message about extra Requires if any are found,
@@ -211,99 +480,498 @@ class GladeFile(object):
             'Glader will not work without at least one top-level window.',
         ))
 
+    def is_ancestor(self, ancestor, name):
+        """ Returns True if the object named `ancestor` holds the object
+            named `name`, at any depth.
+        """
+        if self.nodes is None:
+            return False
+        ancestor_index = self.nodes.ids.get(ancestor, None)
+        index = self.nodes.ids.get(name, None)
+        if (ancestor_index is None) or (index is None):
+            return False
+        return self.nodes.is_ancestor(ancestor_index, index)
+
     def names(self):
         """ Return a list of all object names. """
-        return sorted([o.name for o in self.objects])
+        if self.nodes is None:
+            return []
+        return list(self.nodes.sorted_names())
+
+    def parse_data(self, data):
+        """ Set self.nodes from glade XML bytes, using the cache if there is
+            one.
+        """
+        if self.cache is None:
+            with timings.phase('parse'):
+                self.nodes = self.parse_nodes(io.BytesIO(data))
+            return None
+        with timings.phase('read'):
+            self.content_hash = GladeCache.hash_bytes(data)
+            modelkey = GladeCache.hash_key(
+                self.content_hash,
+                GladeNodes.model_version,
+            )
+            self.nodes = self.cache.get_model(modelkey)
+        if self.nodes is None:
+            with timings.phase('parse'):
+                self.nodes = self.parse_nodes(io.BytesIO(data))
+            self.cache.set_model(modelkey, self.nodes)
+        else:
+            debug(f'Using cached glade info for: {self.filepath}')
 
     def parse_file(self, filepath=None):
         self.filepath = filepath
         self.tree = None
-        if filepath:
-            self.tree = etree.parse(filepath)
-            self.top_levels = self.objects_top_level()
-            self.objects = self.objects_all()
-            self.requires = self.objects_requires()
-            self.app_win = self.get_app_window()
+        self.nodes = None
+        self.content_hash = None
+        if not filepath:
+            return None
+        if self.cache is None:
+            with timings.phase('parse'):
+                self.nodes = self.parse_nodes(filepath)
+        else:
+            with timings.phase('read'):
+                with open(filepath, 'rb') as f:
+                    data = f.read()
+            self.parse_data(data)
+        self.init_objects()
+
+    def parse_source(self, source, filepath=None):
+        """ Parse glade XML from bytes, a str, or a file object, instead of
+            a file path. `filepath` is only used as the glade file's path in
+            generated code (SOURCE_FILEPATH by default).
+        """
+        self.filepath = filepath or SOURCE_FILEPATH
+        self.tree = None
+        self.nodes = None
+        self.content_hash = None
+        with timings.phase('read'):
+            data = read_source(source)
+        self.parse_data(data)
+        self.init_objects()
+
+    def parse_nodes(self, source):
+        """ Parse a file path or file object, and return a GladeNodes table.
+        """
+        etree = get_etree()
+        if self.streaming:
+            return etree.parse(
+                source,
+                etree.XMLParser(target=GladeTarget()),
+            )
+        self.tree = etree.parse(source)
+        return GladeTarget.walk(self.tree)
 
     def objects_all(self):
         """ This will return ALL objects, without any hierarchy. """
-        if self.tree is None:
+        if self.nodes is None:
             return []
-        objectelems = self.tree.xpath(xpath_object)
-        if not objectelems:
+        if not self.nodes.names:
             raise ValueError('No objects found.')
 
-        # Remove separator/ignored objects.
-        return ObjectInfo.map_elements(objectelems)
+        # Separator/ignored objects have no view.
+        return self.nodes.views(range(len(self.nodes.names)))
 
     def objects_requires(self):
-        """ Returns all Require()s found in the tree. """
-        if self.tree is None:
-            return []
-        requireselems = self.tree.xpath(xpath_requires)
-        if not requireselems:
+        """ Returns all Require()s found in the file. """
+        if self.nodes is None:
             return []
-        return [Requires.from_element(e) for e in requireselems]
+        return list(self.nodes.requires)
 
     def objects_top_level(self):
         """ Returns only top-level ObjectInfo()s. """
-        if self.tree is None:
+        if self.nodes is None:
             return []
-        objectelems = self.tree.findall('object')
-        objects = [ObjectInfo.from_element(e) for e in objectelems]
-        # Remove separator objects.
-        return [o for o in objects if o and not o.is_ignored()]
+        return self.nodes.views(self.nodes.top_levels)
 
     def warning_msgs(self):
         """ Return warning message strings, or '' if there are none. """
         msgs = [self.msg_extra_requires(), self.msg_no_app_win()]
         return '\n\n'.join(s for s in msgs if s)
 
-    def write_file(self, filepath=None):
-        """ Write parsed info to a file. """
+    def write_file(
+            self, filepath=None, lib_mode=False, date=None, gresource=None):
+        """ Write generated code to a file, if it has changed.
+            See write_content().
+        """
         filepath = filepath or self.filepath
-        content = self.get_content()
-        with open(filepath, 'w') as f:
-            f.write(content)
-
-        self.make_executable(filepath)
+        write_content(
+            filepath,
+            self.iter_content(
+                lib_mode=lib_mode,
+                date=date,
+                gresource=gresource,
+            ),
+        )
         return filepath
 
+    def write_stream(
+            self, stream, lib_mode=False, date=None, gresource=None):
+        """ Write generated code to an open file, stdout, or a socket,
+            one chunk at a time. See write_stream().
+        """
+        return write_stream(
+            stream,
+            self.iter_content(
+                lib_mode=lib_mode,
+                date=date,
+                gresource=gresource,
+            ),
+        )
+
+
+class GladeNodes(object):
+    """ A table of every <object> and <signal> in a glade file, built once
+        per file by a GladeTarget.
+        Objects refer to their parent, children, and signals by index, so
+        an ObjectInfo is just a cheap view of one row in this table.
+
+        Descendant objects and signals are contiguous in document order,
+        so an object's descendants are the nodes after it, up to
+        `ends[index]`, and it's signals are
+        `signals[signal_starts[index]:signal_ends[index]]`.
+
+        Integer columns are arrays, and widget classes and signal names are
+        interned, to keep large files small in memory and when pickled.
+    """
+    # Widget classes that are not used when generating code.
+    ignored_classes = ('GtkBox', )
+    # Bump this when the table layout changes, so cached tables are not used.
+    model_version = 2
+
+    def __init__(self):
+        # Object columns, one row per <object> element, in document order.
+        self.names = []
+        self.widgets = []
+        # Whether a node is named, and not a separator/ignored class.
+        self.usable = bytearray()
+        # Index of the enclosing <object>, or -1 for top-level objects.
+        self.parents = array('l')
+        # Index (into self.peers) of the element that holds this <object>.
+        self.containers = array('l')
+        # Usable object indexes found in this object's <child> elements.
+        # Objects without children share an empty tuple.
+        self.children = []
+        # Index after this object's last descendant.
+        self.ends = array('l')
+        # This object's range in self.signals, including descendants.
+        self.signal_starts = array('l')
+        self.signal_ends = array('l')
+
+        # Usable SignalHandlers, in document order.
+        self.signals = []
+        # Node index for each signal's <object>, or -1.
+        self.signal_owners = array('l')
+        # Usable object indexes, grouped by the element that holds them.
+        self.peers = []
+        # Usable object indexes whose parent is the root element.
+        self.top_levels = []
+        self.requires = []
+
+        # Indexes, built while parsing.
+        # Usable object index by id. The first object wins.
+        self.ids = {}
+        # Usable object indexes by widget class.
+        self.classes = {}
+        # Signal indexes by handler name, built on demand by self.handlers.
+        self._handlers = None
+        # Usable object indexes that look like windows, for
+        # GladeFile.get_app_window().
+        self.windows = []
+
+        # Sorted object names, built on demand by self.sorted_names().
+        self._sorted_names = None
+        # Cached ObjectInfo views, built on demand by self.view().
+        self._views = {}
+
+    def __getstate__(self):
+        """ Views and the handler index are not pickled, they are rebuilt
+            when needed.
+        """
+        state = self.__dict__.copy()
+        state['_handlers'] = None
+        state['_views'] = {}
+        return state
+
+    def __len__(self):
+        return len(self.names)
+
+    def add_object(self, name, widget, parent=-1, container=-1):
+        """ Add a row for an <object>, and return it's index. """
+        index = len(self.names)
+        if widget:
+            widget = sys.intern(widget)
+        usable = bool(name) and not (
+            name.startswith('<') or
+            (widget in self.ignored_classes)
+        )
+        self.names.append(name)
+        self.widgets.append(widget)
+        self.usable.append(usable)
+        self.parents.append(parent)
+        self.containers.append(container)
+        self.children.append(())
+        self.ends.append(index + 1)
+        self.signal_starts.append(len(self.signals))
+        self.signal_ends.append(len(self.signals))
+        if not usable:
+            return index
+        if container > -1:
+            peers = self.peers[container]
+            if peers:
+                peers.append(index)
+            else:
+                self.peers[container] = [index]
+        self.ids.setdefault(name, index)
+        self.classes.setdefault(widget, []).append(index)
+        if ('win' in name.lower()) or ('Window' in (widget or '')):
+            self.windows.append(index)
+        return index
+
+    def add_signal(self, handler, owner=-1):
+        """ Add a SignalHandler for the <object> at index `owner`. """
+        if self._handlers is not None:
+            self._handlers.setdefault(handler.handler, []).append(
+                len(self.signals)
+            )
+        self.signals.append(handler)
+        self.signal_owners.append(owner)
+
+    def add_child(self, index, child):
+        """ Add a child object (from a <child> element) to an object. """
+        children = self.children[index]
+        if children:
+            children.append(child)
+        else:
+            self.children[index] = [child]
+
+    def add_container(self):
+        """ Add a group of peers for an element that holds <object>s,
+            and return it's index.
+        """
+        self.peers.append(())
+        return len(self.peers) - 1
+
+    def ancestors(self, index):
+        """ Yield indexes for all <object>s holding a node, from nearest to
+            outer-most.
+        """
+        parent = self.parents[index]
+        while parent > -1:
+            yield parent
+            parent = self.parents[parent]
+
+    def end_object(self, index):
+        """ Close the row for an <object>, after all of it's descendants
+            have been added.
+        """
+        self.ends[index] = len(self.names)
+        self.signal_ends[index] = len(self.signals)
+
+    @property
+    def handlers(self):
+        """ Signal indexes by handler name. This is only built when it's
+            used, most runs never look up handlers by name.
+        """
+        if self._handlers is None:
+            handlers = {}
+            for i, signal in enumerate(self.signals):
+                handlers.setdefault(signal.handler, []).append(i)
+            self._handlers = handlers
+        return self._handlers
+
+    def is_ancestor(self, ancestor, index):
+        """ Returns True if node `ancestor` holds node `index`. """
+        return ancestor < index < self.ends[ancestor]
+
+    def sorted_names(self):
+        """ Return a sorted tuple of all usable object names. """
+        if self._sorted_names is None:
+            self._sorted_names = tuple(sorted(
+                name
+                for name, usable in zip(self.names, self.usable)
+                if usable
+            ))
+        return self._sorted_names
+
+    def view(self, index, cls=None):
+        """ Return a cached ObjectInfo for a node index, or None if the
+            node is not usable.
+        """
+        if not self.usable[index]:
+            return None
+        objinfo = self._views.get(index, None)
+        if objinfo is None:
+            objinfo = (cls or ObjectInfo)(nodes=self, index=index)
+            self._views[index] = objinfo
+        return objinfo
+
+    def views(self, indexes):
+        """ Return ObjectInfo views for all usable nodes in `indexes`. """
+        usable = self.usable
+        return [self.view(i) for i in indexes if usable[i]]
+
+
+class GladeTarget(object):
+    """ An lxml parser target that builds a GladeNodes table in a single pass
+        over a glade file, without building an element tree:
+            etree.parse(filepath, etree.XMLParser(target=GladeTarget()))
+
+        Elements are tracked with a stack of open frames.
+    """
+    def __init__(self):
+        # Open elements, as GladeTarget.Frame()s.
+        self.stack = []
+        self.nodes = GladeNodes()
+
+    class Frame(object):
+        """ Parse state for a single open element. """
+        __slots__ = ('tag', 'attrib', 'node', 'owner', 'top_id', 'container')
+
+        def __init__(self, tag, attrib, owner=-1, top_id=None):
+            self.tag = tag
+            self.attrib = attrib
+            # Node index for <object> elements.
+            self.node = -1
+            # Node index for the nearest <object>, this one or an ancestor.
+            self.owner = owner
+            # Outer-most id in this element's ancestry (including itself).
+            self.top_id = top_id
+            # Peer group index, once an <object> is found in this element.
+            self.container = -1
+
+    def close(self):
+        return self.nodes
+
+    def end(self, tag):
+        frame = self.stack.pop()
+        if frame.node > -1:
+            self.nodes.end_object(frame.node)
+
+    def start(self, tag, attrib):
+        stack = self.stack
+        parent = stack[-1] if stack else None
+        elemid = attrib.get('id', None)
+        top_id = (parent.top_id if parent else None) or elemid
+        frame = GladeTarget.Frame(
+            tag,
+            attrib,
+            owner=parent.owner if parent else -1,
+            top_id=top_id,
+        )
+        if tag == 'object':
+            frame.node = frame.owner = self.start_object(attrib)
+        elif tag == 'signal':
+            handler = SignalHandler.from_attrib(
+                attrib,
+                parent.attrib if parent else {},
+                top_id=top_id,
+            )
+            if handler is not None:
+                self.nodes.add_signal(handler, owner=frame.owner)
+        elif tag == 'requires':
+            self.nodes.requires.append(Requires.from_attrib(attrib))
+        stack.append(frame)
+
+    def start_object(self, attrib):
+        """ Add a node for an <object> element, linking it to it's parent
+            and peers. Returns the new node index.
+        """
+        nodes = self.nodes
+        stack = self.stack
+        container = -1
+        parentnode = -1
+        if stack:
+            holder = stack[-1]
+            if holder.container < 0:
+                holder.container = nodes.add_container()
+            container = holder.container
+            parentnode = holder.owner
+        index = nodes.add_object(
+            attrib.get('id', None),
+            attrib.get('class', None),
+            parent=parentnode,
+            container=container,
+        )
+        if not nodes.usable[index]:
+            return index
+        if len(stack) == 1:
+            nodes.top_levels.append(index)
+        elif (
+                (len(stack) > 1) and
+                (stack[-1].tag == 'child') and
+                (stack[-2].node > -1)):
+            # <object><child><object/></child></object>
+            nodes.add_child(stack[-2].node, index)
+        return index
+
+    @classmethod
+    def walk(cls, tree):
+        """ Build a GladeNodes table from an existing lxml tree or element,
+            using the same rules as the parser target.
+        """
+        target = cls()
+        events = ('start', 'end')
+        for event, element in get_etree().iterwalk(tree, events=events):
+            if not isinstance(element.tag, str):
+                # Comments/processing instructions.
+                continue
+            if event == 'start':
+                target.start(element.tag, element.attrib)
+            else:
+                target.end(element.tag)
+        return target.close()
+
 
 class ObjectInfo(object):
     """ Holds information about a widget/object and it's signals, with helper
         methods.
+        When built from a GladeNodes table, children and signals are looked
+        up from the table on first use.
+        There may be one of these for every object in a file, so they use
+        __slots__.
     """
+    __slots__ = (
+        'nodes',
+        'index',
+        'name',
+        'is_separator',
+        'widget',
+        '_signals',
+        '_objects',
+        'siblings',
+    )
     init_args = (
         'name',
         'widget',
         'objects',
         'signals',
         'siblings',
-        'tree',
+        'nodes',
+        'index',
     )
-    # Classes that can be promoted to ObjectClass, to generate class defs.
-    win_classes = [
-        f'Gtk{name}'
-        for name in dir(Gtk)
-        if name.endswith(('Window', 'Dialog', 'Assistant'))
-    ]
 
     def __init__(
             self, name=None, widget=None, objects=None, signals=None,
-            siblings=None, tree=None):
+            siblings=None, nodes=None, index=-1):
+        # GladeNodes table and row that this object was built from.
+        self.nodes = nodes
+        self.index = index
+        if nodes is not None:
+            name = name or nodes.names[index]
+            widget = widget or nodes.widgets[index]
         self.name = name
         self.is_separator = self.name and self.name.startswith('<')
         self.widget = widget
-        self.signals = signals or []
-        self.tree = None if tree is None else tree
-        # Child objects.
-        self.objects = objects or []
+        # Signals, and child objects. Built from self.nodes if not set.
+        self._signals = signals
+        self._objects = objects
         # Sibling objects.
         self.siblings = siblings or []
 
     def __hash__(self):
-        return hash(f'{self.widget}{self.name}{self.tree}')
+        return hash(f'{self.widget}{self.name}{self.index}')
 
     def __repr__(self):
         """ Return a repr() for this object and it's signal handlers. """
@@ -313,40 +981,59 @@ class ObjectInfo(object):
         return self.name
 
     @classmethod
-    def from_element(cls, element):
-        objinfo = cls()
-        return objinfo.parse_element(element)
+    def from_attrib(cls, attrib):
+        """ Builds a childless ObjectInfo from an <object>'s attributes.
+            Returns None if an id/name can't be found.
+        """
+        objname = attrib.get('id', None)
+        if not objname:
+            return None
+        return cls(name=objname, widget=attrib.get('class', None))
 
-    def parse_element(self, element):
+    @classmethod
+    def from_element(cls, element):
         """ Builds an ObjectInfo from an object's lxml element.
             Returns None if an id/name can't be found.
         """
-        # User's name for the widget.
-        objname = element.get('id', None)
-        if not objname:
+        if not element.get('id', None):
             # Element has no id, we don't need it to generate code.
             return None
-        # Widget type.
-        widget = element.get('class', None)
-
-        # Children.
-        children_objs = []
-        for childelem in element.findall('child'):
-            children_objs.extend(
-                ObjectInfo.map_elements(childelem.findall('object'))
-            )
-
-        # Signal handlers.
-        signalelems = element.xpath(xpath_signal)
-        signals = list(SignalHandler.map_elements(signalelems))
-
-        self.name = objname
-        self.widget = widget
-        self.objects = children_objs
-        self.signals = signals
-        self.tree = element
-
-        return self
+        nodes = GladeTarget.walk(element)
+        return cls(nodes=nodes, index=0)
+
+    @property
+    def objects(self):
+        """ Child objects (from <child> elements). """
+        if self._objects is None:
+            if self.nodes is None:
+                self._objects = []
+            else:
+                self._objects = self.nodes.views(
+                    self.nodes.children[self.index]
+                )
+        return self._objects
+
+    @objects.setter
+    def objects(self, value):
+        self._objects = value
+
+    @property
+    def signals(self):
+        """ Signal handlers for this object and all of it's descendants. """
+        if self._signals is None:
+            if self.nodes is None:
+                self._signals = []
+            else:
+                nodes = self.nodes
+                self._signals = nodes.signals[
+                    nodes.signal_starts[self.index]:
+                    nodes.signal_ends[self.index]
+                ]
+        return self._signals
+
+    @signals.setter
+    def signals(self, value):
+        self._signals = value
 
     def init_code(self, indent=0, self_init=False):
         """ Return string to initialize this object.
@@ -371,26 +1058,14 @@ class ObjectInfo(object):
         """ Returns True if this object should be ignored when generating
             init code, for Separators and GtkBoxes.
         """
-        ignored_classes = ('GtkBox', )
         return (
             self.name.startswith('<') or
-            (self.widget in ignored_classes)
+            (self.widget in GladeNodes.ignored_classes)
         )
 
     def kwargs(self):
         return {k: getattr(self, k) for k in self.init_args}
 
-    @classmethod
-    def map_elements(cls, elements, ignore=None):
-        ignore_hashes = set(hash(o) for o in (ignore or []))
-        for elem in elements:
-            o = cls.from_element(elem)
-            if (not o) or o.is_ignored():
-                continue
-            if hash(o) in ignore_hashes:
-                continue
-            yield o
-
     def names(self, all_objects=False):
         """ Return a list of all object names. """
         return sorted([
@@ -400,13 +1075,22 @@ class ObjectInfo(object):
 
     def objects_all(self):
         """ This will return ALL objects, without any hierarchy. """
-        if self.tree is None:
-            return []
-        objectelems = self.tree.xpath(xpath_object)
-        if not objectelems:
+        if self.nodes is None:
             return []
+        return self.nodes.views(
+            range(self.index + 1, self.nodes.ends[self.index])
+        )
 
-        return list(ObjectInfo.map_elements(objectelems, ignore=(self,)))
+    def peers(self):
+        """ Return all objects held by this object's parent element,
+            including this one.
+        """
+        if self.nodes is None:
+            return []
+        container = self.nodes.containers[self.index]
+        if container < 0:
+            return [self]
+        return self.nodes.views(self.nodes.peers[container])
 
     def repr_fmt(self, indent=0):
         return '\n'.join(self.repr_lines(indent=indent))
@@ -454,6 +1138,7 @@ class ObjectClass(ObjectInfo):
     """ Holds information about an ObjectInfo that should generate a separate
         class definition.
     """
+    __slots__ = ('filepath', )
     use_class_name = None
     init_args = (
         'filepath',
@@ -462,19 +1147,21 @@ class ObjectClass(ObjectInfo):
         'objects',
         'signals',
         'siblings',
-        'tree',
+        'nodes',
+        'index',
     )
 
     def __init__(
             self, filepath=None, name=None, widget=None, objects=None,
-            signals=None, siblings=None, tree=None):
+            signals=None, siblings=None, nodes=None, index=-1):
         super().__init__(
             name=name,
             widget=widget,
             objects=objects,
             signals=signals,
             siblings=siblings,
-            tree=tree,
+            nodes=nodes,
+            index=index,
         )
         self.filepath = filepath or None
 
@@ -486,6 +1173,24 @@ class ObjectClass(ObjectInfo):
             for n in sorted(names)
         ))
 
+    def format_builder_names(self, names, lazy=False):
+        """ Format the `builder_names` class attribute, with the names of
+            objects that are taken from the builder. This is a tuple for
+            dynamic init, or a frozenset for lazy init.
+        """
+        if lazy:
+            comment = 'taken from the builder when first used.'
+            start, end = 'frozenset((', '))'
+        else:
+            comment = 'set from the builder in __init__().'
+            start, end = '(', ')'
+        return '\n'.join(filter(None, (
+            f'# Objects that are {comment}',
+            f'    builder_names = {start}',
+            self.format_tuple_names(names, indent=8),
+            f'    {end}',
+        )))
+
     @classmethod
     def from_object_info(cls, objinfo, filepath):
         """ Promote an ObjectInfo to a ObjectApp.
@@ -497,26 +1202,31 @@ class ObjectClass(ObjectInfo):
         return cls(**kwargs)
 
     def get_class_content(
-            self, dynamic_init=False, objects=None, extra_classes=None):
+            self, dynamic_init=False, objects=None, extra_classes=None,
+            resource_path=None, lazy_init=False):
         """ Renders the class template with current GladeFile info.
             Returns a string that can be written to file.
+            If `resource_path` is set, the UI is built from that path in a
+            registered GResource bundle, instead of the glade file.
         """
         if not objects:
             objects = [self]
             objects.extend(self.objects_all())
 
+        class_attrs = ''
         if dynamic_init:
-            template = """
-        for obj in self.builder.get_objects():
-            self.set_object(Gtk.Buildable.get_name(obj))"""
-            object_inits = template.format(
-                self.format_tuple_names(
-                    (o.name for o in objects),
-                    indent=12
-                )
+            class_attrs = self.format_builder_names(
+                o.name for o in objects if not self.is_class(o)
             )
-
-            setobj_def = f'\n{template_set_object}\n'
+            object_inits = DYNAMIC_INIT
+            setobj_def = f'\n{template_set_object}'
+        elif lazy_init:
+            class_attrs = self.format_builder_names(
+                (o.name for o in objects if not self.is_class(o)),
+                lazy=True,
+            )
+            object_inits = LAZY_INIT
+            setobj_def = f'\n{template_lazy_getattr}'
         else:
             # Regular init.
             object_inits = self.init_codes(
@@ -526,9 +1236,16 @@ class ObjectClass(ObjectInfo):
             setobj_def = ''
 
         clsname = ''.join((self.name[0].upper(), self.name[1:]))
-        return template_cls_sub.format(
+        signal_defs = self.signal_defs(indent=4)
+        if resource_path:
+            use_template = template_cls_sub_resource
+        else:
+            use_template = template_cls_sub
+        return use_template.render(
+            class_attrs=class_attrs,
             classname=self.use_class_name or clsname,
             filepath=self.filepath,
+            resource_path=resource_path,
             widget=(self.widget or '<Unknown Widget>').replace('Gtk', ''),
             objnames=self.format_tuple_names(
                 (o.name for o in objects if not self.is_class(o)),
@@ -537,12 +1254,22 @@ class ObjectClass(ObjectInfo):
             objects=object_inits,
             init_end='',
             set_object_def=setobj_def,
-            signal_defs=self.signal_defs(indent=4).rstrip(),
-        ).replace('\n        \n', '\n')
+            signal_defs=f'\n{signal_defs}' if signal_defs else '',
+        )
 
     def get_classes(self):
         return [o for o in self.siblings if isinstance(o, ObjectClass)]
 
+    def lazy_window_def(self):
+        """ Return a property definition that creates this window when it's
+            first used, for lazy windows.
+            Example: def winTest(self): ... WinTest()
+        """
+        return template_lazy_window.render(
+            attrname=''.join((self.name[0].lower(), self.name[1:])),
+            classname=''.join((self.name[0].upper(), self.name[1:])),
+        )
+
     def init_code(self, indent=0, self_init=False):
         """ Return string to initialize this object.
             Example: self.winTest = WinTest()
@@ -559,6 +1286,7 @@ class ObjectApp(ObjectClass):
     """ Holds information about the main App class, which in turn contains
         possible children with separate classes.
     """
+    __slots__ = ()
     use_class_name = 'App'
 
     @classmethod
@@ -569,21 +1297,23 @@ class ObjectApp(ObjectClass):
         # Get siblings.
 
         # Siblings
-        sibling_elems = [
-            e
-            for e in objinfo.tree.getparent().findall('object')
-            if e.get('id', None) != app.name
-        ]
-        app.siblings = list(ObjectInfo.map_elements(sibling_elems))
+        app.siblings = [o for o in objinfo.peers() if o.name != app.name]
         # Promote siblings to ObjectClass where needed.
         for i, sibling in enumerate(app.siblings[:]):
-            if sibling.widget in cls.win_classes:
+            if signature_db.is_win_class(sibling.widget):
                 siblingargs = sibling.kwargs()
                 siblingargs['filepath'] = filepath
                 app.siblings[i] = ObjectClass(**siblingargs)
         return app
 
-    def get_class_content(self, dynamic_init=False, objects=None):
+    def get_class_content(
+            self, dynamic_init=False, objects=None, resource_path=None,
+            lazy_init=False, lazy_windows=False):
+        """ Renders the class template for the App class. See
+            ObjectClass.get_class_content().
+            If `lazy_windows` is truthy, sibling windows are created by
+            properties when they are first used, instead of in __init__().
+        """
         if not objects:
             # Use object_all() and siblings for the App class.
             objects = [self]
@@ -593,33 +1323,59 @@ class ObjectApp(ObjectClass):
             # Also, the classes need to be generated.
             objects.extend(self.siblings)
 
+        if lazy_windows:
+            # Sibling windows are created by properties, not __init__().
+            classes = []
+            window_defs = [o.lazy_window_def() for o in self.get_classes()]
+        else:
+            classes = self.get_classes()
+            window_defs = []
+        class_attrs = ''
         if dynamic_init:
-            template = """
-        for obj in self.builder.get_objects():
-            self.set_object(Gtk.Buildable.get_name(obj))"""
-            object_inits = '\n\n'.join((
-                template.format(
-                    self.format_tuple_names(
-                        (o.name for o in objects),
-                        indent=12
-                    )
-                ),
-                self.init_codes(indent=8, objects=self.get_classes()),
-            ))
-            setobj_def = f'\n{template_set_object}\n'
+            class_attrs = self.format_builder_names(
+                o.name for o in objects if not self.is_class(o)
+            )
+            object_inits = '\n\n'.join(filter(None, (
+                DYNAMIC_INIT,
+                self.init_codes(indent=8, objects=classes),
+            )))
+            setobj_def = template_set_object
+        elif lazy_init:
+            class_attrs = self.format_builder_names(
+                (o.name for o in objects if not self.is_class(o)),
+                lazy=True,
+            )
+            object_inits = self.init_codes(
+                indent=8,
+                objects=classes,
+            ).lstrip() or LAZY_INIT
+            setobj_def = template_lazy_getattr
         else:
             # Regular init.
             object_inits = self.init_codes(
                 indent=8,
-                objects=objects,
+                objects=[
+                    o for o in objects
+                    if not (lazy_windows and self.is_class(o))
+                ],
             ).lstrip()
             setobj_def = ''
+        method_defs = '\n\n'.join(filter(None, (setobj_def, *window_defs)))
 
         clsname = ''.join((self.name[0].upper(), self.name[1:]))
-        use_template = template_cls_sub if self.siblings else template_cls
-        return use_template.format(
+        if resource_path:
+            use_template = (
+                template_cls_sub_resource if self.siblings
+                else template_cls_resource
+            )
+        else:
+            use_template = template_cls_sub if self.siblings else template_cls
+        signal_defs = self.signal_defs(indent=4)
+        return use_template.render(
+            class_attrs=class_attrs,
             classname=self.use_class_name or clsname,
             filepath=self.filepath,
+            resource_path=resource_path,
             widget=(self.widget or '<Unknown Widget>').replace('Gtk', ''),
             objnames=self.format_tuple_names(
                 (o.name for o in objects if not self.is_class(o)),
@@ -627,13 +1383,16 @@ class ObjectApp(ObjectClass):
             ),
             objects=object_inits,
             init_end=f'self.{self.name}.show_all()',
-            set_object_def=setobj_def,
-            signal_defs=self.signal_defs(indent=4).rstrip(),
-        ).replace('\n        \n', '\n')
+            set_object_def=f'\n{method_defs}' if method_defs else '',
+            signal_defs=f'\n{signal_defs}' if signal_defs else '',
+        )
 
-    def get_classes_content(self, dynamic_init=False):
+    def get_classes_content(self, dynamic_init=False, lazy_init=False):
         return '\n\n\n'.join(
-            o.get_class_content(dynamic_init=dynamic_init)
+            o.get_class_content(
+                dynamic_init=dynamic_init,
+                lazy_init=lazy_init,
+            )
             for o in self.get_classes()
         )
 
@@ -656,6 +1415,8 @@ class ObjectApp(ObjectClass):
 
 class Requires(object):
     """ Holds ifnormation and helper methods for a <requires> element. """
+    __slots__ = ('lib', 'version')
+
     def __init__(self, lib=None, version=None):
         self.lib = lib or ''
         self.version = version or ''
@@ -667,14 +1428,18 @@ class Requires(object):
         return f'{type(self).__name__}: {self.lib!r} v. {self.version!r}'
 
     @classmethod
-    def from_element(cls, element):
-        lib = element.get('lib', None)
-        ver = element.get('version', None)
+    def from_attrib(cls, attrib):
+        lib = attrib.get('lib', None)
+        ver = attrib.get('version', None)
         libmap = {
             'gtksourceview': 'GtkSource',
         }
         return cls(lib=libmap.get(lib, lib), version=ver)
 
+    @classmethod
+    def from_element(cls, element):
+        return cls.from_attrib(element.attrib)
+
     def init_code(self):
         if (not self.lib) or self.lib.startswith('gtk+'):
             return None
@@ -682,30 +1447,66 @@ class Requires(object):
 
 
 class SignalHandler(object):
-    """ Holds information and helper methods for a single signal handler. """
+    """ Holds information and helper methods for a single signal handler.
+        Signal handlers do not keep their lxml element, so a parsed file
+        does not keep it's element tree alive. Signal names, widget types,
+        and event names are interned, they repeat a lot in large files.
+    """
+    __slots__ = (
+        'name',
+        'handler',
+        'widget',
+        'widgettype',
+        'event',
+        'top_widget',
+    )
 
     def __init__(
             self, name=None, handler=None, widget=None, widgettype=None,
-            element=None):
+            top_widget=None):
         # The signal name (pressed, clicked, move-cursor)
-        self.name = name
+        self.name = sys.intern(name)
         # The handler's name (mybutton_clicked_cb)
         self.handler = handler
         # This is a computed widget name. (would be mybutton, from above.)
         self.widget = widget
         # This is a Gtk widget type (GtkButton, or just Button)
-        self.widgettype = widgettype
+        self.widgettype = sys.intern(widgettype) if widgettype else widgettype
         # This is the event name for Gtk events.
-        self.event = ''.join((
+        self.event = sys.intern(''.join((
             'do_',
             self.name.replace('-', '_')
-        ))
-        self.element = element
+        )))
+        # Outer-most widget id in the signal's ancestry.
+        self.top_widget = top_widget
 
     def __repr__(self):
         """ Return a repr() for this signal handler. """
         return self.repr_fmt()
 
+    @classmethod
+    def from_attrib(cls, attrib, parent_attrib, top_id=None):
+        """ Build a SignalHandler from a <signal>'s attributes, without an
+            lxml element.
+            Arguments:
+                attrib         : Attributes for the <signal>.
+                parent_attrib  : Attributes for the <signal>'s parent.
+                top_id         : Outer-most id in the <signal>'s ancestry.
+        """
+        eventname = attrib.get('name', None)
+        handlername = attrib.get('handler', '')
+        if handlername.lower().startswith('gtk'):
+            debug(f'Ignoring GTK signal handler: {handlername}')
+            return None
+        widgetid = parent_attrib.get('id', None)
+        return cls(
+            name=eventname,
+            handler=handlername,
+            widget=widgetid or handlername.split('_')[0],
+            widgettype=parent_attrib.get('class', None),
+            top_widget=top_id,
+        )
+
     @classmethod
     def from_element(cls, element, widgettype=None):
         """ Build a SignalHandler from an lxml element.
@@ -723,37 +1524,26 @@ class SignalHandler(object):
             debug('Ignoring GTK signal handler for: {!r}'.format(element))
             return None
 
+        top_widget = None
+        for ancestor in element.iterancestors():
+            top_widget = ancestor.get('id', None) or top_widget
         return cls(
             name=eventname,
             handler=handlername,
             widget=widgetid or handlername.split('_')[0],
             widgettype=widgettype,
-            element=element,
+            top_widget=top_widget,
         )
 
     def full_widget(self):
-        if self.element is None:
-            return self.widget
-
-        e = self.element
-        wid = e.get('id', None)
-        ids = [wid] if wid else []
-        while True:
-            try:
-                e = e.getparent()
-                if not e:
-                    break
-            except AttributeError:
-                # End of the line.
-                break
-            wid = e.get('id', None)
-            if wid:
-                ids.append(wid)
-        return ids[-1]
+        """ Return the outer-most widget id for this signal. """
+        return self.top_widget or self.widget
 
     def get_args(self):
         """ Get known arguments for an object/widget and this signal.
             Returns an tuple of default args if none are found.
+            Arguments are looked up in the signature database, and only
+            introspected with Gtk when they are missing.
         """
         defaultargs = ('self', 'widget', 'user_data=None')
         if not self.widgettype:
@@ -765,29 +1555,11 @@ class SignalHandler(object):
         else:
             gtkname = self.widgettype
 
-        # Find the widget class in Gtk.
-        widget = getattr(Gtk, gtkname, None)
-        if widget is None:
-            debug(f'No widget named: {gtkname}')
-        # Find the event handler function info for the widget.
-        # 'move-cursor' becomes Gtk.WidgetThing.do_move_cursor
-        widgetevent = getattr(widget, self.event, None)
-        if widget and (widgetevent is None):
-            debug(f'No event function found for: {gtkname}:{self.name}')
-        # Get argument info.
-        if hasattr(widgetevent, 'get_arguments'):
-            # Return default and known args.
-            knownargs = (ai.get_name() for ai in widgetevent.get_arguments())
-            formattedargs = ['self', 'widget']
-            if knownargs:
-                formattedargs.extend(knownargs)
-            formattedargs.append('user_data=None')
-            return tuple(formattedargs)
-
-        # No argument info for this widget/event.
-        if widget and widgetevent:
-            debug(f'Unable to get_arguments() for: {gtkname}:{widgetevent}')
-        return defaultargs
+        knownargs = signature_db.get_args(gtkname, self.event)
+        if knownargs is None:
+            return defaultargs
+        # Return default and known args.
+        return ('self', 'widget', *knownargs, 'user_data=None')
 
     def is_dupe(self, other):
         if not isinstance(other, SignalHandler):
@@ -848,3 +1620,228 @@ class SignalHandler(object):
             docs=docs,
             eventargs=eventargs,
             content=content)
+
+
+def content_changed(filepath, content):
+    """ Returns True if a file does not exist, or it's content does not
+        match `content`, which may be a str or an iterable of str chunks.
+        Chunks are compared as they are produced, and stop being consumed
+        at the first difference.
+    """
+    if isinstance(content, str):
+        content = (content, )
+    try:
+        with open(filepath, 'rb') as f:
+            for chunk in content:
+                data = chunk.encode('utf-8')
+                if f.read(len(data)) != data:
+                    return True
+            return bool(f.read(1))
+    except FileNotFoundError:
+        return True
+
+
+def generate(
+        source, *, dynamic_init=False, lib_mode=False, lazy_init=False,
+        lazy_windows=False, gladefile=None, date=None, sink=None,
+        cache=None):
+    """ Generate code from glade XML in memory, without touching the disk.
+        Returns the code as a str, or writes it to `sink` (see
+        write_stream()) one class at a time and returns None.
+        Arguments:
+            source        : Glade XML as bytes, a str, or a file object.
+                            A str is XML, not a file path.
+            gladefile     : The glade file's path in generated code.
+                            Default: SOURCE_FILEPATH
+            sink          : A text stream, binary stream, or socket to
+                            write the code to.
+            cache         : A GladeCache for parsed info and code.
+        See GladeFile() and GladeFile.get_content() for the other
+        arguments.
+        This is safe to call from several threads (see generate_lock).
+    """
+    with generate_lock:
+        parsed = GladeFile(
+            filepath=gladefile,
+            dynamic_init=dynamic_init,
+            cache=cache,
+            lazy_init=lazy_init,
+            lazy_windows=lazy_windows,
+            source=source,
+        )
+        if sink is None:
+            return parsed.get_content(lib_mode=lib_mode, date=date)
+        parsed.write_stream(sink, lib_mode=lib_mode, date=date)
+    return None
+
+
+def get_date(date=None):
+    """ Return the date for generated code, as a DATE_FORMAT string.
+        This is `date` if it is set, or $SOURCE_DATE_EPOCH if it is set
+        (for reproducible builds), otherwise today.
+    """
+    if date:
+        return date
+    epoch = os.environ.get('SOURCE_DATE_EPOCH', None)
+    if epoch:
+        try:
+            return datetime.fromtimestamp(
+                int(epoch),
+                tz=timezone.utc,
+            ).strftime(DATE_FORMAT)
+        except (OverflowError, OSError, ValueError) as ex:
+            debug(f'Invalid SOURCE_DATE_EPOCH: {epoch!r}\n{ex}')
+    return datetime.today().strftime(DATE_FORMAT)
+
+
+def get_etree():
+    """ Import and return lxml.etree. """
+    try:
+        with timings.phase('import_lxml'):
+            from lxml import etree
+    except ImportError as eximp:
+        import_fail(eximp)
+    return etree
+
+
+def join_chunks(sep, chunks):
+    """ Like str.join(), but yields the separator and each non-empty chunk
+        instead of building a new string.
+    """
+    first = True
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if not first:
+            yield sep
+        first = False
+        yield chunk
+
+
+def load_templates():
+    """ Load (or reload) the templates. Templates are only compiled again
+        when their files have changed.
+    """
+    global template_header, template_body, template_cls, template_cls_sub
+    global template_cls_resource, template_cls_sub_resource
+    global template_resource, template_set_object, template_lazy_getattr
+    global template_lazy_window
+    template_header = get_template('header', strip=True)
+    template_body = get_template('body')
+    template_cls = get_template('cls', strip=True)
+    template_cls_sub = get_template('cls_sub', strip=True)
+    template_cls_resource = get_template('cls_resource', strip=True)
+    template_cls_sub_resource = get_template('cls_sub_resource', strip=True)
+    template_resource = get_template('resource', strip=True)
+    template_set_object = get_template(
+        'set_object',
+        indent=4,
+        strip=True,
+    ).render()
+    template_lazy_getattr = get_template(
+        'lazy_getattr',
+        indent=4,
+        strip=True,
+    ).render()
+    template_lazy_window = get_template('lazy_window', indent=4, strip=True)
+
+
+def parse_date(s):
+    """ Parse a date string in DATE_FORMAT (MM-DD-YYYY) or ISO format
+        (YYYY-MM-DD), and return it in DATE_FORMAT.
+        Raises ValueError for invalid dates.
+    """
+    for fmt in (DATE_FORMAT, '%Y-%m-%d'):
+        try:
+            return datetime.strptime(s, fmt).strftime(DATE_FORMAT)
+        except ValueError:
+            pass
+    raise ValueError(f'Expecting MM-DD-YYYY or YYYY-MM-DD, got: {s!r}')
+
+
+def read_source(source):
+    """ Return glade XML bytes from bytes, a str, or a binary or text file
+        object. A str is XML, not a file path, and is encoded as UTF-8.
+    """
+    if hasattr(source, 'read'):
+        source = source.read()
+    if isinstance(source, str):
+        return source.encode('utf-8')
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    raise TypeError(
+        'Expecting bytes, a str, or a file object, got: '
+        f'{type(source).__name__}'
+    )
+
+
+def write_content(filepath, content):
+    """ Write generated code to a file, and make it executable, only if the
+        content has changed. The code is written to a temp file and renamed
+        into place, so a partial file is never seen.
+        `content` may be a str, or an iterable of str chunks (like
+        GladeFile.iter_content()), which are written and compared to the
+        old file as they are produced.
+        Returns True if the file was written, or False if it was unchanged.
+    """
+    with timings.phase('write'):
+        if isinstance(content, str):
+            if not content_changed(filepath, content):
+                debug(f'File is unchanged: {filepath}')
+                return False
+            content = (content, )
+        dirpath = os.path.dirname(os.path.abspath(filepath))
+        fd, temppath = tempfile.mkstemp(dir=dirpath, prefix='.glader')
+        try:
+            try:
+                oldfile = open(filepath, 'rb')
+            except FileNotFoundError:
+                oldfile = None
+            changed = oldfile is None
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    for chunk in content:
+                        data = chunk.encode('utf-8')
+                        f.write(data)
+                        if not changed:
+                            changed = oldfile.read(len(data)) != data
+                if not changed:
+                    changed = bool(oldfile.read(1))
+            finally:
+                if oldfile is not None:
+                    oldfile.close()
+            if not changed:
+                debug(f'File is unchanged: {filepath}')
+                os.remove(temppath)
+                return False
+            os.chmod(temppath, MODE_EXECUTABLE)
+            os.replace(temppath, filepath)
+        except BaseException:
+            os.remove(temppath)
+            raise
+    timings.count('files_written')
+    return True
+
+
+def write_stream(stream, content):
+    """ Write generated code to a text stream (like sys.stdout), a binary
+        stream, or a socket. `content` may be a str, or an iterable of str
+        chunks, which are written as they are produced.
+    """
+    if isinstance(content, str):
+        content = (content, )
+    if hasattr(stream, 'sendall'):
+        write = stream.sendall
+        content = (chunk.encode('utf-8') for chunk in content)
+    elif isinstance(stream, io.TextIOBase):
+        write = stream.write
+    else:
+        write = stream.write
+        content = (chunk.encode('utf-8') for chunk in content)
+    for chunk in content:
+        write(chunk)
+    if hasattr(stream, 'flush'):
+        stream.flush()
+
+
+load_templates()
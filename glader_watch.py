@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+""" Glader - Watch
+    Regenerates code when glade files or templates change.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+from glader_core import debug
+
+# Seconds to wait for more changes before regenerating, so a burst of
+# writes from one save only regenerates once.
+WATCH_DEBOUNCE = 0.1
+# Seconds between checks when polling.
+WATCH_POLL_INTERVAL = 0.5
+
+# inotify event flags, from <sys/inotify.h>.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_EVENTS = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+# Header for each struct inotify_event: wd, mask, cookie, len.
+IN_EVENT_HEADER = struct.Struct('iIII')
+
+
+class Watcher(object):
+    """ Watches files for changes. Subclasses implement wait().
+        Files are watched through their directories, so editors that save
+        by replacing the file are still noticed.
+    """
+    def __init__(self, filepaths, debounce=None):
+        self.filepaths = {os.path.abspath(s) for s in filepaths}
+        self.dirpaths = {os.path.dirname(s) for s in self.filepaths}
+        self.debounce = WATCH_DEBOUNCE if debounce is None else debounce
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, excvalue, tb):
+        self.close()
+        return False
+
+    def changes(self):
+        """ Yield a set of changed file paths for each burst of changes. """
+        while True:
+            changed = self.wait()
+            # Keep collecting until the files are quiet.
+            while changed:
+                more = self.wait(timeout=self.debounce)
+                if not more:
+                    break
+                changed.update(more)
+            if changed:
+                yield changed
+
+    def close(self):
+        """ Release any resources used by this watcher. """
+        return None
+
+    def wait(self, timeout=None):
+        """ Wait for changes, and return a set of changed file paths.
+            Returns an empty set if `timeout` seconds pass with no changes.
+        """
+        raise NotImplementedError('Watcher subclasses must implement wait()')
+
+
+class InotifyWatcher(Watcher):
+    """ Watches files using Linux's inotify, through libc. """
+    def __init__(self, filepaths, debounce=None):
+        super().__init__(filepaths, debounce=debounce)
+        self.libc = self.get_libc()
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed.')
+        # Watched directory by watch descriptor.
+        self.watches = {}
+        try:
+            for dirpath in self.dirpaths:
+                wd = self.libc.inotify_add_watch(
+                    self.fd,
+                    os.fsencode(dirpath),
+                    IN_EVENTS,
+                )
+                if wd < 0:
+                    errno = ctypes.get_errno()
+                    raise OSError(errno, os.strerror(errno), dirpath)
+                self.watches[wd] = dirpath
+        except OSError:
+            self.close()
+            raise
+
+    def close(self):
+        if self.fd > -1:
+            os.close(self.fd)
+            self.fd = -1
+
+    @staticmethod
+    def get_libc():
+        """ Return libc with the inotify functions, or raise OSError. """
+        libname = ctypes.util.find_library('c')
+        if not libname:
+            raise OSError('Unable to find libc.')
+        libc = ctypes.CDLL(libname, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('No inotify support in libc.')
+        return libc
+
+    def wait(self, timeout=None):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        data = os.read(self.fd, 64 * 1024)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = IN_EVENT_HEADER.unpack_from(
+                data,
+                offset,
+            )
+            offset += IN_EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            dirpath = self.watches.get(wd, None)
+            if (dirpath is None) or (not name):
+                continue
+            filepath = os.path.join(dirpath, os.fsdecode(name))
+            if filepath in self.filepaths:
+                changed.add(filepath)
+        return changed
+
+
+class PollWatcher(Watcher):
+    """ Watches files by checking their modification time and size. """
+    def __init__(self, filepaths, debounce=None, interval=None):
+        super().__init__(filepaths, debounce=debounce)
+        self.interval = WATCH_POLL_INTERVAL if interval is None else interval
+        self.stats = {s: self.stat(s) for s in self.filepaths}
+
+    @staticmethod
+    def stat(filepath):
+        """ Return (mtime, size) for a file, or None if it doesn't exist. """
+        try:
+            st = os.stat(filepath)
+        except EnvironmentError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def wait(self, timeout=None):
+        start = time.monotonic()
+        while True:
+            changed = set()
+            for filepath, oldstat in self.stats.items():
+                newstat = self.stat(filepath)
+                if newstat != oldstat:
+                    self.stats[filepath] = newstat
+                    changed.add(filepath)
+            if changed:
+                return changed
+            if timeout is None:
+                delay = self.interval
+            else:
+                remaining = timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    return changed
+                delay = min(self.interval, remaining)
+            time.sleep(delay)
+
+
+def do_watch(
+        jobs, dynamic_init=False, lib_mode=False, use_cache=True,
+        poll=False, date=None, lazy_init=False, lazy_windows=False):
+    """ Generate code for glade files, and regenerate it whenever a glade
+        file or template changes, until interrupted.
+        Parsed files, templates, and Gtk are kept in memory between runs,
+        so only changed files are parsed again.
+        Arguments:
+            jobs          : A list of (filepath, outputfile) to generate.
+            dynamic_init  : Passed to GladeFile().
+            lib_mode      : Passed to GladeFile.get_content().
+            use_cache     : Whether a GladeCache is used.
+            poll          : Whether to poll for changes, instead of using
+                            inotify.
+            date          : Passed to GladeFile.get_content().
+            lazy_init     : Passed to GladeFile().
+            lazy_windows  : Passed to GladeFile().
+    """
+    from glader_batch import init_worker
+    from glader_templates import template_paths
+    # Load everything that is reused between runs.
+    cache = init_worker(use_cache=use_cache)
+    outputs = {os.path.abspath(s): o for s, o in jobs}
+    # User templates may be added later, if their directory exists.
+    templatefiles = {
+        os.path.abspath(s)
+        for s in template_paths()
+        if os.path.isdir(os.path.dirname(s))
+    }
+    gladefiles = {}
+    for filepath in outputs:
+        gladefiles[filepath] = watch_generate(
+            filepath,
+            outputs[filepath],
+            dynamic_init=dynamic_init,
+            lib_mode=lib_mode,
+            cache=cache,
+            date=date,
+            lazy_init=lazy_init,
+            lazy_windows=lazy_windows,
+        )
+
+    watcher = get_watcher(set(outputs) | templatefiles, poll=poll)
+    print('\nWatching {} file{} with {}, press Ctrl + C to stop.'.format(
+        len(outputs),
+        '' if len(outputs) == 1 else 's',
+        type(watcher).__name__,
+    ))
+    with watcher:
+        try:
+            for changed in watcher.changes():
+                regenerate = changed.intersection(outputs)
+                if changed & templatefiles:
+                    watch_reload_templates()
+                    # Every file uses the templates.
+                    regenerate = outputs
+                for filepath in sorted(regenerate):
+                    gladefiles[filepath] = watch_generate(
+                        filepath,
+                        outputs[filepath],
+                        dynamic_init=dynamic_init,
+                        lib_mode=lib_mode,
+                        cache=cache,
+                        date=date,
+                        lazy_init=lazy_init,
+                        lazy_windows=lazy_windows,
+                        gladefile=gladefiles[filepath],
+                        reparse=filepath in changed,
+                    )
+        except KeyboardInterrupt:
+            print('\nStopped watching.')
+    return 0
+
+
+def get_watcher(filepaths, poll=False, debounce=None):
+    """ Return an InotifyWatcher for file paths if inotify is available,
+        otherwise a PollWatcher.
+    """
+    if not poll:
+        try:
+            return InotifyWatcher(filepaths, debounce=debounce)
+        except (AttributeError, OSError) as ex:
+            debug(f'Unable to use inotify, polling instead: {ex}')
+    return PollWatcher(filepaths, debounce=debounce)
+
+
+def print_err(*args, **kwargs):
+    kwargs['file'] = kwargs.get('file', sys.stderr)
+    print(*args, **kwargs)
+
+
+def watch_generate(
+        filepath, outputfile, dynamic_init=False, lib_mode=False,
+        cache=None, date=None, gladefile=None, reparse=True,
+        lazy_init=False, lazy_windows=False):
+    """ Generate code for a glade file, and write it to `outputfile` if it
+        changed. The file is only parsed if `reparse` is truthy, or
+        `gladefile` is None. Returns the GladeFile, or the old `gladefile`
+        on errors.
+    """
+    from glader_util import GladeFile, write_content
+    start = time.perf_counter()
+    try:
+        if reparse or (gladefile is None):
+            newfile = GladeFile(
+                filepath,
+                dynamic_init=dynamic_init,
+                cache=cache,
+                lazy_init=lazy_init,
+                lazy_windows=lazy_windows,
+            )
+        else:
+            newfile = gladefile
+        changed = write_content(
+            outputfile,
+            newfile.iter_content(lib_mode=lib_mode, date=date),
+        )
+    except Exception as ex:
+        print_err(f'   Failed: {filepath}: {ex}')
+        return gladefile
+    duration = (time.perf_counter() - start) * 1000
+    print('{}: {} -> {} ({:.1f}ms)'.format(
+        'Generated' if changed else 'Unchanged',
+        filepath,
+        outputfile,
+        duration,
+    ))
+    warnings = newfile.warning_msgs()
+    if warnings:
+        debug(f'\n{warnings}\n')
+    return newfile
+
+
+def watch_reload_templates():
+    """ Reload templates after a template file changes. """
+    from glader_templates import get_templates_hash
+    from glader_util import load_templates
+    try:
+        load_templates()
+    except SystemExit:
+        # get_template() exits on errors, the old templates are kept.
+        print_err('Unable to reload templates, using the old ones.')
+        return False
+    get_templates_hash(reload=True)
+    print('Reloaded templates.')
+    return True
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+""" Glader - Worker
+    Generates code in a background thread, so the GUI stays responsive
+    while large glade files are parsed. A new request supersedes the one
+    before it, and results are handed back on the main thread.
+    The parsed file is reused until it changes, when only the code
+    generation options change.
+"""
+import difflib
+import os
+import threading
+import time
+
+from glader_core import debug
+
+
+class Cancelled(Exception):
+    """ Raised in the worker thread when a job has been superseded. """
+    pass
+
+
+class GenerateJob(object):
+    """ A request to generate code for a glade file, and it's result.
+        After run(), either `gladefile` and `content` are set, or `error`
+        is set. When a `base` text is given, `hunks` are the changes from
+        `base` to `content` (see line_hunks()). When `edited` text is also
+        given, the hunks apply those changes to `edited` instead, without
+        touching lines that differ from `base` (see merge_hunks()).
+    """
+    __slots__ = (
+        'jobid',
+        'filepath',
+        'dynamic_init',
+        'lib_mode',
+        'gladefile',
+        'content',
+        'error',
+        'due',
+        'base',
+        'edited',
+        'hunks',
+        'stamp',
+        'reused',
+        '_cancelled',
+    )
+
+    def __init__(
+            self, jobid, filepath, dynamic_init=False, lib_mode=False,
+            due=0, base=None, edited=None):
+        self.jobid = jobid
+        self.filepath = filepath
+        self.dynamic_init = dynamic_init
+        self.lib_mode = lib_mode
+        # time.monotonic() value for when the job may start.
+        self.due = due
+        # Text that the new content is compared to, like the last content.
+        self.base = base
+        # `base` with the user's changes, like an editor's text.
+        self.edited = edited
+        self.hunks = None
+        # (mtime, size) for the glade file when it was parsed.
+        self.stamp = None
+        # Whether the parsed file from an earlier job was used.
+        self.reused = False
+        self.gladefile = None
+        self.content = None
+        self.error = None
+        self._cancelled = threading.Event()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.jobid!r}, {self.filepath!r})'
+
+    def cancel(self):
+        """ Mark this job as cancelled. If it is running, it stops at the
+            next check, and it's result is never delivered.
+        """
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def check(self):
+        """ Raise Cancelled if this job has been cancelled. """
+        if self._cancelled.is_set():
+            raise Cancelled(f'Job was cancelled: {self!r}')
+
+    def run(self, previous=None):
+        """ Parse the glade file and render it's code, in the current
+            thread. Cancellation is checked between each step, and between
+            each generated class. Errors are saved in `error`.
+            If `previous` is a finished GenerateJob for the same file, and
+            the file's mtime and size have not changed, it's parsed file is
+            used instead of parsing it again.
+            Raises Cancelled if the job is cancelled before it finishes.
+        """
+        from glader_util import GladeFile
+        self.check()
+        try:
+            st = os.stat(self.filepath)
+            self.stamp = (st.st_mtime_ns, st.st_size)
+            if (
+                    (previous is not None) and
+                    (previous.gladefile is not None) and
+                    (previous.filepath == self.filepath) and
+                    (previous.stamp == self.stamp)):
+                gladefile = previous.gladefile
+                if gladefile.dynamic_init != self.dynamic_init:
+                    gladefile = gladefile.copy(dynamic_init=self.dynamic_init)
+                self.reused = True
+            else:
+                gladefile = GladeFile(
+                    filepath=self.filepath,
+                    dynamic_init=self.dynamic_init,
+                )
+            chunks = []
+            for chunk in gladefile.iter_content(lib_mode=self.lib_mode):
+                self.check()
+                chunks.append(chunk)
+        except Cancelled:
+            raise
+        except Exception as ex:
+            self.error = ex
+            return None
+        self.check()
+        content = ''.join(chunks)
+        if self.base is not None:
+            if self.edited is None:
+                self.hunks = line_hunks(self.base, content)
+            else:
+                self.hunks = merge_hunks(self.base, content, self.edited)
+            # The old texts are not needed anymore.
+            self.base = self.edited = None
+        self.gladefile = gladefile
+        self.content = content
+        return None
+
+
+class GenerateWorker(object):
+    """ Runs GenerateJobs in a single background thread.
+        Submitting a job cancels the job before it, so only the newest
+        request is ever delivered, and requests that pile up while a file
+        is being parsed are skipped.
+    """
+    def __init__(self, callback, schedule=None, delay=0):
+        """ Create a worker (the thread is started by the first submit()).
+            Arguments:
+                callback  : Called with each finished GenerateJob that was
+                            not superseded.
+                schedule  : A function like GLib.idle_add, to call
+                            `schedule(func, job)` on the main thread.
+                            By default, `func(job)` is called in the worker
+                            thread.
+                delay     : Seconds to wait before a job starts. Jobs that
+                            are submitted during the wait replace it, and
+                            start the wait again, so bursts of requests
+                            become one job.
+        """
+        self.callback = callback
+        self.schedule = schedule or (lambda func, *args: func(*args))
+        self.delay = delay
+        self.condition = threading.Condition()
+        # Job waiting for the thread to pick it up.
+        self.pending = None
+        # Newest job, until it is delivered or cancelled.
+        self.current = None
+        self.jobid = 0
+        # Last finished job, for it's parsed file. Only used by the thread.
+        self.previous = None
+        self.stopped = False
+        self.thread = None
+
+    @property
+    def busy(self):
+        """ True while a job is waiting, running, or being delivered. """
+        return self.current is not None
+
+    def cancel(self):
+        """ Cancel the newest job, if any. """
+        with self.condition:
+            if self.current is not None:
+                self.current.cancel()
+            self.current = self.pending = None
+
+    def deliver(self, job):
+        """ Pass a finished job to the callback, unless it was superseded.
+            This runs on the main thread, when `schedule` is GLib.idle_add.
+            Returns False, so GLib.idle_add doesn't call it again.
+        """
+        with self.condition:
+            if job.cancelled or (job is not self.current):
+                debug(f'Dropping superseded job: {job!r}')
+                return False
+            self.current = None
+        self.callback(job)
+        return False
+
+    def run(self):
+        """ The worker thread's loop, which runs pending jobs until stop()
+            is called.
+        """
+        while True:
+            with self.condition:
+                while not self.stopped:
+                    if self.pending is None:
+                        self.condition.wait()
+                        continue
+                    remaining = self.pending.due - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                if self.stopped:
+                    return None
+                job, self.pending = self.pending, None
+            try:
+                job.run(previous=self.previous)
+            except Cancelled as ex:
+                debug(str(ex))
+                continue
+            if job.gladefile is not None:
+                self.previous = job
+            self.schedule(self.deliver, job)
+
+    def stop(self, timeout=None):
+        """ Cancel any job, and stop the worker thread. The current step
+            of a running job (like parsing) is allowed to finish, up to
+            `timeout` seconds. Jobs can't be submitted after this.
+        """
+        with self.condition:
+            self.stopped = True
+            if self.current is not None:
+                self.current.cancel()
+            self.current = self.pending = None
+            self.condition.notify()
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            thread.join(timeout)
+
+    def submit(
+            self, filepath, dynamic_init=False, lib_mode=False, base=None,
+            edited=None):
+        """ Queue a job to generate code for a glade file, cancelling the
+            job before it. Returns the new GenerateJob.
+            If `base` text is given, the job's `hunks` are the changes from
+            `base` to the new code. If `edited` text is also given, they
+            are merged into `edited` (see merge_hunks()).
+        """
+        with self.condition:
+            if self.stopped:
+                raise RuntimeError('The worker has been stopped.')
+            if self.current is not None:
+                self.current.cancel()
+            self.jobid += 1
+            job = GenerateJob(
+                self.jobid,
+                filepath,
+                dynamic_init=dynamic_init,
+                lib_mode=lib_mode,
+                due=time.monotonic() + self.delay,
+                base=base,
+                edited=edited,
+            )
+            self.current = self.pending = job
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run,
+                    name='glader-worker',
+                    daemon=True,
+                )
+                self.thread.start()
+            self.condition.notify()
+        return job
+
+
+def line_hunks(old, new):
+    """ Return the changes from `old` text to `new` text, as a list of
+        (start, end, lines). Old lines `start` to `end` are replaced with
+        `lines`, which keep their line endings.
+        Hunks are in reverse order, so applying them one at a time never
+        moves the lines of the hunks that are left.
+    """
+    if old == new:
+        return []
+    oldlines = old.splitlines(True)
+    newlines = new.splitlines(True)
+    if not oldlines:
+        return [(0, 0, newlines)]
+    matcher = difflib.SequenceMatcher(None, oldlines, newlines)
+    return [
+        (i1, i2, newlines[j1:j2])
+        for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes())
+        if tag != 'equal'
+    ]
+
+
+def merge_hunks(base, new, edited):
+    """ Return hunks like line_hunks(), that apply the changes from `base`
+        text to `new` text onto `edited` text, which is `base` with the
+        user's changes. Changes that touch lines the user changed are
+        skipped, so the user's edits are never overwritten.
+    """
+    # User edits, in document order.
+    edits = line_hunks(base, edited)[::-1]
+    if not edits:
+        return line_hunks(base, new)
+    merged = []
+    for start, end, lines in line_hunks(base, new):
+        offset = 0
+        conflict = False
+        for editstart, editend, editlines in edits:
+            if (editstart < end and start < editend) or (
+                    editstart == editend == start == end):
+                # Overlapping, or inserted at the same line.
+                conflict = True
+                break
+            if editend > start:
+                # This edit, and the rest, are after the hunk.
+                break
+            # Lines before this hunk were added or removed.
+            offset += len(editlines) - (editend - editstart)
+        if conflict:
+            debug(f'Keeping edited lines near line {start + offset + 1}.')
+            continue
+        merged.append((start + offset, end + offset, lines))
+    return merged
+
+
+def split_hunks(hunks, size):
+    """ Yield hunks from line_hunks(), splitting hunks with more than `size`
+        new lines into several hunks, so each one is a small change.
+        Applying them in order still gives the new text.
+    """
+    for start, end, lines in hunks:
+        yield start, end, lines[:size]
+        for i in range(size, len(lines), size):
+            yield start + i, start + i, lines[i:i + size]
@@ -1,6 +1,7 @@
 # Lines with '# ignore' at the end are not part of the template. # ignore
 # Template placeholders and other globals are set to None so this # ignore
 # can be linted while editing. # ignore
+class_attrs = None  # ignore
 classname = None  # ignore
 Gtk = None  # ignore
 os = None  # ignore
@@ -12,6 +13,7 @@ signaldefs = None  # ignore
 
 class {classname}(Gtk.{widget}):
     """ Main window with all components. """
+    {class_attrs}
 
     def __init__(self):
         Gtk.{widget}.__init__(self)
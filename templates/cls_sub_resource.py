@@ -0,0 +1,37 @@
+# Lines with '# ignore' at the end are not part of the template. # ignore
+# Template placeholders and other globals are set to None so this # ignore
+# can be linted while editing. # ignore
+class_attrs = None  # ignore
+classname = None  # ignore
+Gtk = None  # ignore
+sys = None  # ignore
+objects = None  # ignore
+set_object_def = None  # ignore
+signaldefs = None  # ignore
+
+
+class {classname}(Gtk.{widget}):
+    """ Main window with all components. """
+    {class_attrs}
+
+    def __init__(self):
+        Gtk.{widget}.__init__(self)
+        self.builder = Gtk.Builder()
+        try:
+            self.builder.add_objects_from_resource(
+                '{resource_path}',
+                [
+{objnames}
+                ]
+            )
+        except Exception as ex:
+            print('\\nError building main window!\\n{{}}'.format(ex))
+            sys.exit(1)
+
+        # Get gui objects
+        {objects}
+
+        self.builder.connect_signals(self)
+        {init_end}
+{set_object_def}
+{signal_defs}
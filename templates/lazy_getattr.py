@@ -0,0 +1,20 @@
+# Lines with '# ignore' at the end are not part of the template. # ignore
+# Template placeholders and other globals are set to None so this # ignore
+# can be linted while editing. # ignore
+
+
+def __getattr__(self, name):
+    """ Get an object from the builder when it's first used, and keep it.
+        This is only called for attributes that aren't set yet.
+    """
+    if name in self.builder_names:
+        obj = self.builder.get_object(name)
+        if obj is not None:
+            setattr(self, name, obj)
+            return obj
+    raise AttributeError(
+        '{{!r}} object has no attribute {{!r}}'.format(
+            type(self).__name__,
+            name,
+        )
+    )
@@ -0,0 +1,13 @@
+# Lines with '# ignore' at the end are not part of the template. # ignore
+# Template placeholders and other globals are set to None so this # ignore
+# can be linted while editing. # ignore
+classname = None  # ignore
+
+
+@property
+def {attrname}(self):
+    """ The {classname} window, created when it's first used. """
+    win = self.__dict__.get('_{attrname}', None)
+    if win is None:
+        win = self._{attrname} = {classname}()
+    return win
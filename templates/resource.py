@@ -0,0 +1,25 @@
+# Lines with '# ignore' at the end are not part of the template. # ignore
+# Template placeholders and other globals are set to None so this # ignore
+# can be linted while editing. # ignore
+import os  # ignore
+resource_file = None  # ignore
+from gi.repository import Gio, GLib
+
+
+def load_resource(filename):
+    """ Register a GResource bundle from this file's directory.
+        The bundle is memory-mapped instead of read, and the UI is built
+        from it without looking for, or parsing, the glade file.
+    """
+    filepath = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        filename,
+    )
+    mapped = GLib.MappedFile.new(filepath, False)
+    resource = Gio.Resource.new_from_data(mapped.get_bytes())
+    resource._register()
+    return resource
+
+
+# Registered once, when this module is imported.
+RESOURCE = load_resource('{resource_file}')
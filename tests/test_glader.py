@@ -7,9 +7,24 @@
     -Christopher Welborn 01-24-2017
 """
 
+import ast
+import asyncio
+import contextlib
+import io
 import os
+import pickle
+import queue
+import shutil
+import socket
+import stat
+import subprocess
 import sys
+import tempfile
+import threading
+import timeit
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
 from pygments import highlight
 from pygments.lexers import get_lexer_by_name
@@ -24,6 +39,7 @@ GLADER_PY_FILE = 'glader.py'
 TEST_GLADE_FILE = 'example.glade'
 TEST_GLADE_FILE_EXISTS = False
 SHOW_CODE = os.environ.get('TEST_GLADER_CODE', None) in ('1', 'yes', 'true')
+TIMING = os.environ.get('TEST_GLADER_TIMING', None) in ('1', 'yes', 'true')
 for try_path in ('.', '..', ):
     try_testfilepath = os.path.join(try_path, TEST_GLADE_FILE)
     if os.path.exists(try_testfilepath):
@@ -34,20 +50,87 @@ for try_path in ('.', '..', ):
         GLADER_PY_FILE = try_gladerpy
         GLADER_PATH = os.path.split(GLADER_PY_FILE)[0]
 
+# Glader's own glade file is always available for testing.
+GLADER_GLADE_FILE = os.path.join(GLADER_PATH, 'glader.glade')
+
 if GLADER_PATH not in sys.path:
     sys.path.insert(0, GLADER_PATH)
 try:
-    from glader_util import GladeFile
+    from glader_async import generate_many
+    from glader_batch import do_batch, expand_paths, output_name
+    from glader_cache import GladeCache
+    from glader_gresource import (
+        GRESOURCE_COMPILER,
+        bundle_is_current,
+        bundle_name,
+        compile_gresource,
+        content_bundle_name,
+    )
+    from glader_serve import (
+        GladeServer,
+        ServeClient,
+        ServeError,
+        ServeSocketServer,
+        serve_socket,
+    )
+    from glader_signatures import SignatureDB
+    import glader_templates
+    import glader_util
+    from glader_templates import Template, get_template
+    from glader_timings import Timings, timings
+    from glader_util import (
+        GladeFile,
+        generate,
+        write_content,
+        write_stream,
+    )
+    from glader_watch import PollWatcher, get_watcher
+    from glader_worker import (
+        Cancelled,
+        GenerateJob,
+        GenerateWorker,
+        line_hunks,
+        merge_hunks,
+        split_hunks,
+    )
 except ImportError as ex:
     print('Cannot find glader_util.py!\n{}'.format(ex), file=sys.stderr)
     sys.exit(1)
 
 
+def fake_build_gresource(filepath):
+    """ Stand in for build_gresource(), without glib-compile-resources. """
+    with open(filepath, 'rb') as f:
+        return b'GVariant\0' + f.read()
+
+
 def highlight_code(code):
     """ Highlight some python code for the terminal. """
     return highlight(code, pyg_lexer, pyg_formatter).strip()
 
 
+def synthetic_glade(chains=1, depth=1):
+    """ Return glade xml for a main window holding `chains` chains of nested
+        objects, each `depth` objects deep, with a signal on every object.
+    """
+    parts = [
+        '<interface>',
+        '<object class="GtkWindow" id="winMain">',
+        '<signal name="destroy" handler="winMain_destroy_cb"/>',
+    ]
+    for chain in range(chains):
+        for level in range(depth):
+            objid = f'btn_{chain}_{level}'
+            parts.extend((
+                '<child>',
+                f'<object class="GtkButton" id="{objid}">',
+                f'<signal name="clicked" handler="{objid}_clicked_cb"/>',
+            ))
+        parts.append('</object></child>' * depth)
+    parts.append('</object></interface>')
+    return '\n'.join(parts)
+
+
 class GladerTests(unittest.TestCase):
 
     def exec_code(self, code, filepath=None):
@@ -79,6 +162,158 @@ class GladerTests(unittest.TestCase):
             lines.extend(['Code:', highlight_code(code)])
         return '\n'.join(lines)
 
+    def test_batch(self):
+        """ Batch mode should generate code for every glade file, and
+            report failures in the exit code.
+        """
+        with tempfile.TemporaryDirectory() as dirpath:
+            subdir = os.path.join(dirpath, 'sub')
+            os.mkdir(subdir)
+            good = [
+                os.path.join(dirpath, 'one.glade'),
+                os.path.join(subdir, 'two.glade'),
+            ]
+            for filepath in good:
+                shutil.copy(GLADER_GLADE_FILE, filepath)
+            bad = os.path.join(dirpath, 'bad.glade')
+            with open(bad, 'w') as f:
+                f.write('<interface></interface>')
+            self.assertEqual(
+                expand_paths([dirpath, os.path.join(dirpath, '*.glade')]),
+                [bad, good[0], good[1]],
+            )
+            self.assertEqual(
+                output_name(good[1], '{dir}/{name}_ui.py'),
+                os.path.join(subdir, 'two_ui.py'),
+            )
+            with contextlib.redirect_stdout(io.StringIO()):
+                with contextlib.redirect_stderr(io.StringIO()):
+                    ret = do_batch([dirpath], jobs=2, use_cache=False)
+            self.assertEqual(ret, 1)
+            self.assertFalse(os.path.exists(output_name(bad)))
+            for filepath in good:
+                with open(output_name(filepath), 'r') as f:
+                    content = f.read()
+                self.assertEqual(
+                    content,
+                    GladeFile(filepath).get_content(),
+                )
+            # Workers that fail to start are reported, not raised.
+            with mock.patch(
+                    'glader_batch.load_worker',
+                    side_effect=OSError('Bad template dir.')):
+                for jobs, msg in (
+                        (1, 'Unable to start generating code'),
+                        (2, 'A worker process failed')):
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        with contextlib.redirect_stderr(
+                                io.StringIO()) as stderr:
+                            ret = do_batch(
+                                [bad, good[0]],
+                                jobs=jobs,
+                                use_cache=False,
+                            )
+                    self.assertEqual(ret, 1)
+                    self.assertIn(msg, stderr.getvalue())
+
+    def test_batch_gresource(self):
+        """ Batch mode should always rebuild missing bundles, and --check
+            should report stale bundles by their content, not mtimes.
+        """
+
+        def batch(**kwargs):
+            with contextlib.redirect_stdout(io.StringIO()):
+                with contextlib.redirect_stderr(io.StringIO()):
+                    return do_batch(
+                        [filepath],
+                        jobs=1,
+                        use_cache=False,
+                        gresource=True,
+                        **kwargs
+                    )
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            filepath = os.path.join(dirpath, 'app.glade')
+            shutil.copy(GLADER_GLADE_FILE, filepath)
+            bundle = os.path.join(dirpath, 'app.gresource')
+            with mock.patch(
+                    'glader_gresource.build_gresource',
+                    side_effect=fake_build_gresource), \
+                    mock.patch(
+                        'glader_gresource.compile_gresource',
+                        wraps=compile_gresource) as compiler:
+                self.assertEqual(batch(), 0)
+                self.assertTrue(os.path.exists(bundle))
+                self.assertEqual(batch(check=True), 0)
+                # Unchanged code isn't overwritten, but the bundle is built.
+                os.remove(bundle)
+                self.assertEqual(batch(), 0)
+                self.assertTrue(os.path.exists(bundle))
+                self.assertEqual(compiler.call_count, 2)
+                # Touched, but unchanged, like after a fresh checkout.
+                os.utime(bundle, ns=(0, 0))
+                os.utime(filepath)
+                self.assertEqual(batch(check=True), 0)
+                # Changed, without changing the code or the bundle's mtime.
+                with open(filepath, 'a') as f:
+                    f.write('<!-- changed -->\n')
+                os.utime(filepath, ns=(0, 0))
+                self.assertEqual(batch(check=True), 1)
+
+    def test_cache(self):
+        """ Cached glade info and content should match uncached results. """
+        expected = GladeFile(GLADER_GLADE_FILE)
+        with tempfile.TemporaryDirectory() as cachedir:
+            cache = GladeCache(cachedir=cachedir)
+            for _ in range(2):
+                gf = GladeFile(GLADER_GLADE_FILE, cache=cache)
+                self.assertEqual(repr(gf), repr(expected))
+                for lib_mode in (False, True):
+                    self.assertEqual(
+                        gf.get_content(lib_mode=lib_mode),
+                        expected.get_content(lib_mode=lib_mode),
+                    )
+            self.assertEqual(len(list(cache.iter_files())), 3)
+            # Least recently used files are evicted.
+            cache.max_size = 0
+            cache.evict()
+            self.assertEqual(list(cache.iter_files()), [])
+            self.assertEqual(cache.size, 0)
+            self.assertIsNone(cache.get_model('missing'))
+            # Writes only scan the cache when it grows too large.
+            cache.max_size = 10
+            with mock.patch.object(
+                    cache,
+                    'iter_files',
+                    wraps=cache.iter_files) as iter_files:
+                for key in ('a', 'b'):
+                    cache.set_content(key, '12345')
+                self.assertEqual(iter_files.call_count, 0)
+                self.assertEqual(cache.size, 10)
+                cache.set_content('c', '12345')
+                self.assertEqual(iter_files.call_count, 1)
+            self.assertEqual(cache.size, 10)
+            self.assertEqual(len(list(cache.iter_files())), 2)
+            # Files that weren't removed are still counted.
+            cache.max_size = 0
+            with mock.patch.object(cache, 'remove', return_value=False):
+                cache.evict()
+            self.assertEqual(cache.size, 10)
+
+    def test_compact_model(self):
+        """ Parsed objects should be small, and pickle without changes. """
+        gf = GladeFile(GLADER_GLADE_FILE)
+        nodes = pickle.loads(pickle.dumps(gf.nodes, protocol=-1))
+        copied = GladeFile()
+        copied.filepath = gf.filepath
+        copied.nodes = nodes
+        copied.init_objects()
+        self.assertEqual(copied.get_content(), gf.get_content())
+        for obj in gf.objects:
+            self.assertFalse(hasattr(obj, '__dict__'))
+            for signal in obj.signals:
+                self.assertFalse(hasattr(signal, '__dict__'))
+
     def test_exec_code(self):
         """ Make sure tests.exec_code is working correctly. """
         # Testing a test, to keep my sanity.
@@ -119,6 +354,229 @@ class GladerTests(unittest.TestCase):
                     code
                 ))
 
+    def test_generate(self):
+        """ generate() should give the same code from bytes, str, and file
+            objects as GladeFile does from a file.
+        """
+        with open(GLADER_GLADE_FILE, 'rb') as f:
+            data = f.read()
+        for gladefile in (None, 'ui/glader.glade'):
+            expected = GladeFile(GLADER_GLADE_FILE).copy(
+                filepath=gladefile or 'app.glade',
+            ).get_content(lib_mode=True)
+            for source in (
+                    data,
+                    data.decode('utf-8'),
+                    io.BytesIO(data),
+                    io.StringIO(data.decode('utf-8'))):
+                self.assertEqual(
+                    generate(source, lib_mode=True, gladefile=gladefile),
+                    expected,
+                )
+        sink = io.BytesIO()
+        self.assertIsNone(generate(data, sink=sink))
+        self.assertEqual(
+            sink.getvalue().decode('utf-8'),
+            generate(data),
+        )
+        self.assertEqual(
+            self.socket_received(lambda sock: generate(data, sink=sock)),
+            sink.getvalue(),
+        )
+        with tempfile.TemporaryDirectory() as cachedir:
+            cache = GladeCache(cachedir=cachedir)
+            for _ in range(2):
+                self.assertEqual(
+                    generate(data, dynamic_init=True, cache=cache),
+                    generate(data, dynamic_init=True),
+                )
+        with self.assertRaises(TypeError):
+            generate(1)
+
+    def test_generate_many(self):
+        """ generate_many() should yield code for each file as it finishes,
+            with errors for files that fail, and stop early when closed.
+        """
+        expected = GladeFile(GLADER_GLADE_FILE).get_content(date='01-01-2020')
+
+        async def collect(paths, **kwargs):
+            return [
+                result
+                async for result in generate_many(
+                    paths,
+                    date='01-01-2020',
+                    **{'use_cache': False, **kwargs}
+                )
+            ]
+
+        async def first(paths):
+            results = generate_many(paths, concurrency=1, use_cache=False)
+            async for result in results:
+                await results.aclose()
+                return result
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            missing = os.path.join(dirpath, 'missing.glade')
+            paths = [GLADER_GLADE_FILE, missing, GLADER_GLADE_FILE]
+            for kwargs in (
+                    {'concurrency': 1},
+                    {'concurrency': 2, 'executor': 'process'}):
+                results = asyncio.run(collect(paths, **kwargs))
+                self.assertEqual(len(results), 3)
+                failed = [r for r in results if not r]
+                self.assertEqual([r.filepath for r in failed], [missing])
+                for result in results:
+                    if result:
+                        self.assertEqual(result.content, expected)
+            result = asyncio.run(first(iter(paths * 10)))
+            self.assertEqual(result.filepath, GLADER_GLADE_FILE)
+            # Thread pools get their own cache, not the process pool
+            # worker's global one.
+            with mock.patch('glader_batch.worker_cache', 'not a cache'):
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    for kwargs in ({}, {'executor': executor}):
+                        results = asyncio.run(
+                            collect(paths[:1], use_cache=True, **kwargs)
+                        )
+                        self.assertEqual(results[0].content, expected)
+        with self.assertRaises(ValueError):
+            asyncio.run(collect(paths, executor='nope'))
+
+    def test_gresource(self):
+        """ GResource mode should load the UI from a bundle. """
+        gf = GladeFile(GLADER_GLADE_FILE)
+        for lib_mode in (False, True):
+            content = gf.get_content(
+                lib_mode=lib_mode,
+                gresource='glader.gresource',
+            )
+            compile(content, 'glader_gresource_test', 'exec')
+            self.assertIn("load_resource('glader.gresource')", content)
+            self.assertIn('_from_resource(', content)
+            self.assertIn("'/glader/glader/glader.glade'", content)
+            self.assertNotIn('add_from_file', content)
+        self.assertEqual(
+            bundle_name('ui/app.glade', 'out/app_ui.py'),
+            'out/app_ui.gresource',
+        )
+        self.assertEqual(bundle_name('ui/app.glade', '-'), 'ui/app.gresource')
+        with tempfile.TemporaryDirectory() as dirpath:
+            bundle = os.path.join(dirpath, 'glader.gresource')
+            with mock.patch(
+                    'glader_gresource.build_gresource',
+                    side_effect=fake_build_gresource):
+                self.assertFalse(bundle_is_current(GLADER_GLADE_FILE, bundle))
+                self.assertTrue(compile_gresource(GLADER_GLADE_FILE, bundle))
+                self.assertFalse(compile_gresource(GLADER_GLADE_FILE, bundle))
+                # Bundles are compared by content, not mtime.
+                os.utime(bundle, ns=(0, 0))
+                self.assertTrue(bundle_is_current(GLADER_GLADE_FILE, bundle))
+                with open(bundle, 'ab') as f:
+                    f.write(b'\0')
+                self.assertFalse(bundle_is_current(GLADER_GLADE_FILE, bundle))
+            # Content bundle names change with the content, not the mtime.
+            gladefile = os.path.join(dirpath, 'glader.glade')
+            shutil.copy(GLADER_GLADE_FILE, gladefile)
+            name = content_bundle_name(gladefile, dirpath)
+            self.assertEqual(os.path.dirname(name), dirpath)
+            self.assertRegex(
+                os.path.basename(name),
+                r'^glader-[0-9a-f]{16}\.gresource$',
+            )
+            os.utime(gladefile, ns=(0, 0))
+            self.assertEqual(content_bundle_name(gladefile, dirpath), name)
+            with open(gladefile, 'a') as f:
+                f.write('\n')
+            self.assertNotEqual(content_bundle_name(gladefile, dirpath), name)
+        if not shutil.which(GRESOURCE_COMPILER):
+            self.skipTest(f'{GRESOURCE_COMPILER} is not installed.')
+        with tempfile.TemporaryDirectory() as dirpath:
+            bundle = os.path.join(dirpath, 'glader.gresource')
+            self.assertTrue(compile_gresource(GLADER_GLADE_FILE, bundle))
+            self.assertFalse(compile_gresource(GLADER_GLADE_FILE, bundle))
+            self.assertTrue(bundle_is_current(GLADER_GLADE_FILE, bundle))
+            with open(GLADER_GLADE_FILE, 'rb') as f:
+                gladedata = f.read()
+            with open(bundle, 'rb') as f:
+                self.assertIn(gladedata, f.read())
+
+    def test_line_hunks(self):
+        """ line_hunks() should only include changed lines, and applying the
+            hunks in order should give the new text.
+        """
+        static = GladeFile(GLADER_GLADE_FILE).get_content()
+        dynamic = GladeFile(GLADER_GLADE_FILE, dynamic_init=True).get_content()
+        cases = (
+            ('', static),
+            (static, ''),
+            (static, static),
+            (static, dynamic),
+            ('a\nb\nc', 'a\nB\nc\nd'),
+            ('x\n' + static, static + '\nx'),
+        )
+        for old, new in cases:
+            hunks = line_hunks(old, new)
+            for size in (None, 1, 7):
+                if size:
+                    hunks = list(split_hunks(hunks, size))
+                    self.assertTrue(all(len(h[2]) <= size for h in hunks))
+                lines = old.splitlines(True)
+                for start, end, newlines in hunks:
+                    lines[start:end] = newlines
+                self.assertEqual(''.join(lines), new)
+        self.assertEqual(line_hunks(static, static), [])
+        hunks = line_hunks(static, dynamic)
+        starts = [start for start, end, newlines in hunks]
+        self.assertEqual(starts, sorted(starts, reverse=True))
+        self.assertLess(
+            sum(len(newlines) for start, end, newlines in hunks),
+            len(dynamic.splitlines()) // 2,
+        )
+
+    def test_merge_hunks(self):
+        """ merge_hunks() should apply new code to text the user edited,
+            without overwriting the user's changes.
+        """
+        def apply(text, hunks):
+            lines = text.splitlines(True)
+            for start, end, newlines in hunks:
+                lines[start:end] = newlines
+            return ''.join(lines)
+
+        base = 'a\nb\nc\nd\ne\nf\n'
+        new = 'A\nb\nc\nD\ne\nF\n'
+        # No edits is the same as line_hunks().
+        self.assertEqual(merge_hunks(base, new, base), line_hunks(base, new))
+        # Lines added before a change move it, and edited lines are kept.
+        edited = 'x\ny\na\nb\nc\nd\ne\nmine\n'
+        self.assertEqual(
+            apply(edited, merge_hunks(base, new, edited)),
+            'x\ny\nA\nb\nc\nD\ne\nmine\n',
+        )
+        edited = 'a\nb\nc\nmine\ne\nf\n'
+        self.assertEqual(
+            apply(edited, merge_hunks(base, new, edited)),
+            'A\nb\nc\nmine\ne\nF\n',
+        )
+        # The background worker merges when it is given the edited text.
+        static = GladeFile(GLADER_GLADE_FILE).get_content()
+        edited = static.replace('class App', '# Mine.\nclass App', 1)
+        self.assertNotEqual(edited, static)
+        job = GenerateJob(
+            1,
+            GLADER_GLADE_FILE,
+            dynamic_init=True,
+            base=static,
+            edited=edited,
+        )
+        job.run()
+        merged = apply(edited, job.hunks)
+        self.assertIn('# Mine.\n', merged)
+        self.assertEqual(
+            merged.replace('# Mine.\n', '', 1),
+            job.content,
+        )
+
     @unittest.skipUnless(TEST_GLADE_FILE_EXISTS, 'Missing test glade file.')
     def test_non_dynamic_code_compiles(self):
         """ Glader should generate valid python code in normal mode. """
@@ -184,6 +642,675 @@ class GladerTests(unittest.TestCase):
                 )
             )
 
+    def test_dynamic_init(self):
+        """ Dynamic init should set every object that static init sets,
+            from a table of names instead of builder.get_objects().
+        """
+        static = GladeFile(GLADER_GLADE_FILE).get_content()
+        dynamic = GladeFile(GLADER_GLADE_FILE, dynamic_init=True).get_content()
+        self.assertNotIn('get_objects()', dynamic)
+        static_names = {
+            node.targets[0].attr
+            for node in ast.walk(ast.parse(static))
+            if isinstance(node, ast.Assign) and
+            ast.unparse(node.value).startswith('self.builder.get_object(')
+        }
+        dynamic_names = set()
+        for node in ast.walk(ast.parse(dynamic)):
+            if isinstance(node, ast.Assign) and (
+                    ast.unparse(node.targets[0]) == 'builder_names'):
+                dynamic_names.update(ast.literal_eval(node.value))
+        self.assertTrue(static_names)
+        self.assertEqual(static_names, dynamic_names)
+
+    def test_lazy_init(self):
+        """ Lazy init should name every object that static init sets, and
+            only get objects from the builder when they are first used.
+        """
+        with self.assertRaises(ValueError):
+            GladeFile(GLADER_GLADE_FILE, dynamic_init=True, lazy_init=True)
+        static = GladeFile(GLADER_GLADE_FILE).get_content()
+        code = GladeFile(GLADER_GLADE_FILE, lazy_init=True).get_content()
+        self.assertNotIn('self.builder.get_object(', code.split('def ')[1])
+        static_names = {
+            node.targets[0].attr
+            for node in ast.walk(ast.parse(static))
+            if isinstance(node, ast.Assign) and
+            ast.unparse(node.value).startswith('self.builder.get_object(')
+        }
+        lazy_names = set()
+        for node in ast.walk(ast.parse(code)):
+            if isinstance(node, ast.Assign) and (
+                    ast.unparse(node.targets[0]) == 'builder_names'):
+                lazy_names.update(ast.literal_eval(node.value.args[0]))
+        self.assertTrue(static_names)
+        self.assertEqual(static_names, lazy_names)
+
+        class FakeBuilder(object):
+            def __init__(self):
+                self.names = []
+
+            def get_object(self, name):
+                self.names.append(name)
+                return None if name == 'missing' else f'<{name}>'
+
+        namespace = {}
+        exec(
+            '\n'.join((
+                'class Lazy(object):',
+                '    builder_names = frozenset((\'btnOk\', \'missing\'))',
+                glader_util.template_lazy_getattr,
+            )),
+            namespace,
+        )
+        obj = namespace['Lazy']()
+        obj.builder = FakeBuilder()
+        self.assertEqual(obj.btnOk, '<btnOk>')
+        self.assertEqual(obj.btnOk, '<btnOk>')
+        self.assertEqual(obj.builder.names, ['btnOk'])
+        for name in ('missing', 'other'):
+            self.assertFalse(hasattr(obj, name))
+        self.assertEqual(obj.builder.names, ['btnOk', 'missing'])
+
+    def test_lazy_windows(self):
+        """ Lazy windows should create sibling windows when they are first
+            used, instead of in App.__init__().
+        """
+        with tempfile.TemporaryDirectory() as dirpath:
+            filepath = os.path.join(dirpath, 'windows.glade')
+            with open(filepath, 'w') as f:
+                f.write('\n'.join((
+                    '<interface>',
+                    '<object class="GtkWindow" id="winMain"/>',
+                    '<object class="GtkDialog" id="dlgAbout"/>',
+                    '<object class="GtkWindow" id="winOther"/>',
+                    '</interface>',
+                )))
+            gladefile = GladeFile(filepath, lazy_windows=True)
+        classes = {
+            o.name: ''.join((o.name[0].upper(), o.name[1:]))
+            for o in gladefile.app_win.get_classes()
+        }
+        self.assertTrue(classes)
+        app = next(
+            node
+            for node in ast.parse(gladefile.get_content()).body
+            if isinstance(node, ast.ClassDef) and node.name == 'App'
+        )
+        methods = {
+            node.name: node
+            for node in app.body
+            if isinstance(node, ast.FunctionDef)
+        }
+        init = ast.unparse(methods['__init__'])
+        for attrname, clsname in classes.items():
+            self.assertNotIn(f'{clsname}()', init)
+            self.assertIn(f'{clsname}()', ast.unparse(methods[attrname]))
+
+        namespace = {}
+        exec(
+            '\n'.join((
+                'class DlgTest(object):',
+                '    created = 0',
+                '    def __init__(self):',
+                '        DlgTest.created += 1',
+                'class Lazy(object):',
+                glader_util.template_lazy_window.render(
+                    attrname='dlgTest',
+                    classname='DlgTest',
+                ),
+            )),
+            namespace,
+        )
+        obj = namespace['Lazy']()
+        self.assertEqual(namespace['DlgTest'].created, 0)
+        self.assertIs(obj.dlgTest, obj.dlgTest)
+        self.assertEqual(namespace['DlgTest'].created, 1)
+
+    def test_parse_time_is_linear(self):
+        """ Parse time should not grow with nesting depth, checked with a
+            small file and a generous limit so it always runs quickly.
+        """
+        depth = 60
+        count = depth * 10
+        for streaming in (True, False):
+            shallow = self.parse_time(
+                synthetic_glade(chains=count, depth=1),
+                streaming=streaming,
+            )
+            deep = self.parse_time(
+                synthetic_glade(chains=count // depth, depth=depth),
+                streaming=streaming,
+            )
+            self.assertLess(deep, shallow * 10)
+
+    @unittest.skipUnless(TIMING, 'Set TEST_GLADER_TIMING=1 to run.')
+    def test_parse_time_is_linear_large(self):
+        """ Parse time should grow with object count, not nesting depth.
+            Tight wall clock ratios depend on the machine's load, so this
+            only runs when TEST_GLADER_TIMING is set.
+        """
+        # libxml2 allows 256 levels, and each level here uses 2.
+        depth = 120
+        count = depth * 20
+        for streaming in (True, False):
+            shallow = self.parse_time(
+                synthetic_glade(chains=count, depth=1),
+                streaming=streaming,
+            )
+            deep = self.parse_time(
+                synthetic_glade(chains=count // depth, depth=depth),
+                streaming=streaming,
+            )
+            self.assertLess(deep, shallow * 3)
+            deeper = self.parse_time(
+                synthetic_glade(chains=(count // depth) * 4, depth=depth),
+                streaming=streaming,
+            )
+            self.assertLess(deeper, deep * 4 * 2)
+
+    def test_query_api(self):
+        """ GladeFile index lookups should match the parsed objects. """
+        gf = GladeFile(GLADER_GLADE_FILE)
+        self.assertEqual(gf.names(), sorted(o.name for o in gf.objects))
+        btnsave = gf.get_object('btnSave')
+        self.assertEqual(btnsave.name, 'btnSave')
+        self.assertIsNone(gf.get_object('doesNotExist'))
+        self.assertIn(
+            btnsave,
+            gf.get_objects_by_widget('GtkButton'),
+        )
+        self.assertEqual(
+            gf.get_objects_by_widget('GtkButton'),
+            gf.get_objects_by_widget('Button'),
+        )
+        handler = gf.get_signal('btnSave_clicked_cb')
+        self.assertEqual(handler.widget, 'btnSave')
+        self.assertEqual(handler.name, 'clicked')
+        self.assertIsNone(gf.get_signal('not_a_handler_cb'))
+        ancestors = [o.name for o in gf.get_ancestors('btnSave')]
+        self.assertEqual(ancestors[-1], 'winMain')
+        self.assertTrue(gf.is_ancestor('winMain', 'btnSave'))
+        self.assertFalse(gf.is_ancestor('btnSave', 'winMain'))
+        self.assertIn(btnsave, gf.get_descendants('winMain'))
+        self.assertEqual(gf.get_app_window().name, 'winMain')
+
+    def test_serve(self):
+        """ The server should answer requests like the command line, reuse
+            parsed files, and handle socket and stdio clients.
+        """
+        server = GladeServer(use_cache=False)
+        expected = GladeFile(GLADER_GLADE_FILE).get_content(date='01-01-2020')
+        response = server.handle({
+            'id': 1,
+            'command': 'generate',
+            'filepath': GLADER_GLADE_FILE,
+            'date': '01-01-2020',
+        })
+        self.assertEqual(response['id'], 1)
+        self.assertTrue(response['ok'])
+        self.assertEqual(response['code'], expected)
+        response = server.handle({
+            'command': 'generate',
+            'filepath': GLADER_GLADE_FILE,
+            'gladefile': 'ui/glader.glade',
+        })
+        self.assertIn("gladefile = 'ui/glader.glade'", response['code'])
+        gladefile = server.get_gladefile(GLADER_GLADE_FILE)
+        self.assertIs(server.get_gladefile(GLADER_GLADE_FILE), gladefile)
+        dynamic = server.get_gladefile(GLADER_GLADE_FILE, dynamic_init=True)
+        self.assertIs(dynamic.nodes, gladefile.nodes)
+        for request in (
+                {'command': 'nope', 'filepath': GLADER_GLADE_FILE},
+                {'command': 'generate'},
+                {'command': 'generate', 'filepath': 'x.glade', 'bad': 1},
+                {'command': 'check', 'filepath': GLADER_GLADE_FILE},
+                {
+                    'command': 'generate',
+                    'filepath': GLADER_GLADE_FILE,
+                    'dynamic_init': True,
+                    'lazy_init': True,
+                },
+                {
+                    'command': 'generate',
+                    'filepath': GLADER_GLADE_FILE,
+                    'lib_mode': 'false',
+                },
+                {
+                    'command': 'generate',
+                    'filepath': GLADER_GLADE_FILE,
+                    'date': 20200101,
+                },
+                {'command': 'generate', 'filepath': ['x.glade']},
+                []):
+            response = server.handle(request)
+            self.assertFalse(response['ok'], msg=f'Should fail: {request}')
+            self.assertTrue(response['error'])
+        self.assertIn('Bad JSON', server.handle_line('{'))
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            socketpath = os.path.join(dirpath, 'glader.sock')
+            outputfile = os.path.join(dirpath, 'glader_ui.py')
+            sockserver = ServeSocketServer(socketpath, server)
+            self.assertEqual(stat.S_IMODE(os.stat(socketpath).st_mode), 0o600)
+            thread = threading.Thread(target=sockserver.serve_forever)
+            thread.start()
+            try:
+                with ServeClient(socketpath) as c1:
+                    with ServeClient(socketpath) as c2:
+                        self.assertTrue(c1.check(
+                            GLADER_GLADE_FILE,
+                            outputfile,
+                        ))
+                        self.assertTrue(c2.generate(
+                            GLADER_GLADE_FILE,
+                            outputfile=outputfile,
+                            date='01-01-2020',
+                        ))
+                        self.assertFalse(c1.check(
+                            GLADER_GLADE_FILE,
+                            outputfile,
+                            date='01-01-2020',
+                        ))
+                        self.assertIn(
+                            'winMain',
+                            c2.layout(GLADER_GLADE_FILE),
+                        )
+                        with self.assertRaises(ServeError):
+                            c1.generate(os.path.join(dirpath, 'x.glade'))
+            finally:
+                sockserver.shutdown()
+                sockserver.server_close()
+                thread.join()
+            with open(outputfile) as f:
+                self.assertEqual(f.read(), expected)
+            # Stale bundles are reported by check.
+            request = {
+                'command': 'generate',
+                'filepath': GLADER_GLADE_FILE,
+                'outputfile': outputfile,
+                'overwrite': True,
+                'gresource': True,
+            }
+            with mock.patch(
+                    'glader_gresource.build_gresource',
+                    side_effect=fake_build_gresource):
+                self.assertTrue(server.handle(request)['ok'])
+                request['command'] = 'check'
+                self.assertFalse(server.handle(request)['changed'])
+                bundle = bundle_name(GLADER_GLADE_FILE, outputfile)
+                with open(bundle, 'ab') as f:
+                    f.write(b'\0')
+                self.assertTrue(server.handle(request)['changed'])
+
+        with ServeClient() as client:
+            self.assertEqual(
+                client.generate(GLADER_GLADE_FILE, date='01-01-2020'),
+                expected,
+            )
+
+        # Files that aren't sockets are never replaced.
+        with tempfile.TemporaryDirectory() as dirpath:
+            notes = os.path.join(dirpath, 'notes.txt')
+            with open(notes, 'w') as f:
+                f.write('keep me')
+            with contextlib.redirect_stderr(io.StringIO()) as stderr:
+                self.assertEqual(serve_socket(server, notes), 1)
+                self.assertEqual(serve_socket(server, dirpath), 1)
+            self.assertIn('Not a socket', stderr.getvalue())
+            with open(notes) as f:
+                self.assertEqual(f.read(), 'keep me')
+
+    def test_signature_db(self):
+        """ A saved signature database should match live introspection. """
+        live = SignatureDB(filepath=os.devnull)
+        with tempfile.TemporaryDirectory() as dirpath:
+            filepath = os.path.join(dirpath, 'signatures.json')
+            built = SignatureDB(filepath=filepath)
+            self.assertGreater(built.build(), 0)
+            built.save()
+            db = SignatureDB(filepath=filepath)
+            self.assertTrue(db.load())
+        self.assertTrue(db.complete)
+        self.assertEqual(len(db), len(built))
+        for gtkname, event in (
+                ('Button', 'do_clicked'),
+                ('Window', 'do_key_press_event'),
+                ('Window', 'do_not_a_real_event'),
+                ('NotARealWidget', 'do_clicked')):
+            self.assertEqual(
+                db.get_args(gtkname, event),
+                live.get_args(gtkname, event),
+            )
+
+    def test_startup_imports(self):
+        """ The command line should not import the GUI modules, and cached
+            runs should not import Gtk, even without a signature database.
+        """
+        def imports(args, env=None):
+            proc = subprocess.run(
+                [sys.executable, '-X', 'importtime', GLADER_PY_FILE] + args,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                universal_newlines=True,
+                env=env,
+            )
+            self.assertEqual(proc.returncode, 0, msg=proc.stderr)
+            return {
+                line.rpartition('|')[-1].strip()
+                for line in proc.stderr.splitlines()
+                if line.startswith('import time:')
+            }
+
+        for args in (['-v'], [GLADER_GLADE_FILE, '-', '--no-cache']):
+            imported = imports(args)
+            for modname in ('glader_ui', 'gi.repository.GtkSource'):
+                self.assertNotIn(
+                    modname,
+                    imported,
+                    msg=f'{modname} imported for: {" ".join(args)}',
+                )
+        with tempfile.TemporaryDirectory() as homedir:
+            env = dict(os.environ, HOME=homedir)
+            args = [GLADER_GLADE_FILE, '-']
+            # The first run fills the cache, and introspects Gtk.
+            imports(args, env=env)
+            self.assertNotIn('gi.repository.Gtk', imports(args, env=env))
+
+    def test_streaming_parser_matches_dom(self):
+        """ The streaming parser should generate the same code as the
+            element tree parser.
+        """
+        for dynamic_init in (False, True):
+            gf_dom = GladeFile(
+                GLADER_GLADE_FILE,
+                dynamic_init=dynamic_init,
+                streaming=False,
+            )
+            gf_stream = GladeFile(
+                GLADER_GLADE_FILE,
+                dynamic_init=dynamic_init,
+                streaming=True,
+            )
+            self.assertIsNone(gf_stream.tree)
+            self.assertEqual(repr(gf_dom), repr(gf_stream))
+            for lib_mode in (False, True):
+                self.assertEqual(
+                    gf_dom.get_content(lib_mode=lib_mode),
+                    gf_stream.get_content(lib_mode=lib_mode),
+                )
+
+    def test_templates(self):
+        """ Templates should render in one pass, and user templates should
+            override built-in templates until they change.
+        """
+        template = Template.compile(
+            'x = \'{{}}\'\n    {a}\n{b}\nend {c}\n{d}',
+            strip=True,
+        )
+        self.assertEqual(
+            template.render(a='A', b='', c='C', d=''),
+            'x = \'{}\'\n    A\nend C',
+        )
+        self.assertEqual(
+            template.render(a='', b='B', c=None, d='D'),
+            'x = \'{}\'\nB\nend None\nD',
+        )
+        with tempfile.TemporaryDirectory() as userdir:
+            with mock.patch.object(
+                    glader_templates, 'USER_TEMPLATEDIR', userdir):
+                builtin = get_template('body')
+                self.assertEqual(
+                    os.path.dirname(builtin.filepath),
+                    glader_templates.TEMPLATEDIR,
+                )
+                filepath = os.path.join(userdir, 'body.py')
+                with open(filepath, 'w') as f:
+                    f.write('# ignore\nuser {class_def}\n')
+                self.assertEqual(
+                    get_template('body').render(class_def='1'),
+                    'user 1\n',
+                )
+                self.assertIs(get_template('body'), get_template('body'))
+                # Changed files are compiled again.
+                with open(filepath, 'w') as f:
+                    f.write('changed {class_def}\n')
+                os.utime(filepath, ns=(0, 0))
+                self.assertEqual(
+                    get_template('body').render(class_def='2'),
+                    'changed 2\n',
+                )
+                os.remove(filepath)
+                self.assertEqual(
+                    get_template('body').filepath,
+                    builtin.filepath,
+                )
+
+    def test_timings(self):
+        """ Timings should be collected for each phase of a run. """
+        timings.reset()
+        gf = GladeFile(GLADER_GLADE_FILE)
+        gf.get_content()
+        data = timings.pop()
+        for phase in ('parse', 'objects', 'app_window', 'render'):
+            self.assertIn(phase, data['phases'])
+        self.assertEqual(data['counters']['objects'], len(gf.objects))
+        self.assertGreater(data['counters']['signature_lookups'], 0)
+        self.assertFalse(timings)
+
+        merged = Timings()
+        merged.merge(data)
+        merged.merge(data)
+        self.assertEqual(
+            merged.counters['objects'],
+            data['counters']['objects'] * 2,
+        )
+        self.assertIn('render', merged.format('text'))
+
+    def test_watchers(self):
+        """ Watchers should report changed files, and ignore others. """
+        with tempfile.TemporaryDirectory() as dirpath:
+            watched = os.path.join(dirpath, 'watched.glade')
+            other = os.path.join(dirpath, 'other.py')
+            for filepath in (watched, other):
+                with open(filepath, 'w') as f:
+                    f.write('<interface></interface>')
+            for poll in (True, False):
+                watcher = get_watcher([watched], poll=poll, debounce=0.01)
+                if poll:
+                    self.assertIsInstance(watcher, PollWatcher)
+                    watcher.interval = 0.01
+                with watcher:
+                    self.assertEqual(watcher.wait(timeout=0.05), set())
+                    with open(other, 'a') as f:
+                        f.write('\n')
+                    self.assertEqual(watcher.wait(timeout=0.05), set())
+                    # Replace it, like some editors do.
+                    temppath = f'{watched}.tmp'
+                    with open(temppath, 'w') as f:
+                        f.write('<interface>\n</interface>')
+                    os.replace(temppath, watched)
+                    self.assertEqual(
+                        next(watcher.changes()),
+                        {os.path.abspath(watched)},
+                    )
+
+    def test_worker(self):
+        """ The background worker should only deliver the newest job,
+            cancelled jobs should stop, and parsed files should be reused
+            until they change.
+        """
+        job = GenerateJob(1, GLADER_GLADE_FILE)
+        job.cancel()
+        with self.assertRaises(Cancelled):
+            job.run()
+
+        delivered = []
+        # Stands in for GLib.idle_add, so deliveries run when the test
+        # says so, like they would on the main thread.
+        scheduled = queue.Queue()
+        worker = GenerateWorker(
+            delivered.append,
+            schedule=lambda func, *args: scheduled.put((func, args)),
+        )
+        try:
+            first = worker.submit(GLADER_GLADE_FILE)
+            firstfunc, firstargs = scheduled.get(timeout=30)
+            # A newer request arrives before the first one is delivered.
+            second = worker.submit(GLADER_GLADE_FILE, lib_mode=True)
+            self.assertTrue(first.cancelled)
+            self.assertTrue(worker.busy)
+            secondfunc, secondargs = scheduled.get(timeout=30)
+            self.assertFalse(firstfunc(*firstargs))
+            self.assertEqual(delivered, [])
+            self.assertFalse(secondfunc(*secondargs))
+            self.assertEqual(delivered, [second])
+            self.assertFalse(worker.busy)
+            self.assertIsNone(second.error)
+            self.assertEqual(
+                second.content,
+                GladeFile(GLADER_GLADE_FILE).get_content(lib_mode=True),
+            )
+
+            missing = worker.submit(os.path.join(GLADER_PATH, 'missing'))
+            func, args = scheduled.get(timeout=30)
+            func(*args)
+            self.assertIs(delivered[-1], missing)
+            self.assertIsNotNone(missing.error)
+        finally:
+            worker.stop(timeout=30)
+        with self.assertRaises(RuntimeError):
+            worker.submit(GLADER_GLADE_FILE)
+
+        # Quick requests become one job, and the parsed file is reused
+        # until it changes.
+        delivered = queue.Queue()
+        worker = GenerateWorker(delivered.put, delay=0.2)
+        with tempfile.TemporaryDirectory() as dirpath:
+            filepath = os.path.join(dirpath, 'reuse.glade')
+            shutil.copy(GLADER_GLADE_FILE, filepath)
+            try:
+                jobs = [
+                    worker.submit(filepath, dynamic_init=bool(i % 2))
+                    for i in range(3)
+                ]
+                job = delivered.get(timeout=30)
+                self.assertIs(job, jobs[-1])
+                self.assertFalse(job.reused)
+                self.assertTrue(all(j.stamp is None for j in jobs[:-1]))
+
+                job = worker.submit(
+                    filepath,
+                    dynamic_init=True,
+                    base=jobs[-1].content,
+                )
+                self.assertIs(delivered.get(timeout=30), job)
+                self.assertTrue(job.reused)
+                self.assertEqual(
+                    job.hunks,
+                    line_hunks(jobs[-1].content, job.content),
+                )
+                self.assertTrue(job.gladefile.dynamic_init)
+                self.assertIs(job.gladefile.nodes, jobs[-1].gladefile.nodes)
+                self.assertEqual(
+                    job.content,
+                    GladeFile(filepath, dynamic_init=True).get_content(),
+                )
+
+                with open(filepath, 'a') as f:
+                    f.write('\n')
+                job = worker.submit(filepath)
+                self.assertIs(delivered.get(timeout=30), job)
+                self.assertFalse(job.reused)
+            finally:
+                worker.stop(timeout=30)
+
+    def test_write_content(self):
+        """ Output should be reproducible, and only written when it
+            changes.
+        """
+        gf = GladeFile(GLADER_GLADE_FILE)
+        with mock.patch.dict(os.environ, {'SOURCE_DATE_EPOCH': '0'}):
+            content = gf.get_content()
+        self.assertIn('01-01-1970', content)
+        self.assertEqual(content, gf.get_content(date='01-01-1970'))
+        with tempfile.TemporaryDirectory() as dirpath:
+            outputfile = os.path.join(dirpath, 'glader.py')
+            self.assertTrue(write_content(outputfile, content))
+            self.assertTrue(os.access(outputfile, os.X_OK))
+            os.utime(outputfile, (0, 0))
+            self.assertFalse(write_content(outputfile, content))
+            self.assertEqual(os.stat(outputfile).st_mtime, 0)
+
+            pattern = os.path.join(dirpath, '{name}.py')
+            with contextlib.redirect_stdout(io.StringIO()):
+                with contextlib.redirect_stderr(io.StringIO()):
+                    for date, expected in (('01-01-1970', 0), (None, 1)):
+                        ret = do_batch(
+                            [GLADER_GLADE_FILE],
+                            pattern=pattern,
+                            jobs=1,
+                            use_cache=False,
+                            check=True,
+                            date=date,
+                        )
+                        self.assertEqual(ret, expected)
+            self.assertEqual(os.stat(outputfile).st_mtime, 0)
+
+            # Streamed code matches, and is compared as it is written.
+            chunks = list(gf.iter_content(date='01-01-1970'))
+            self.assertGreater(len(chunks), 1)
+            self.assertEqual(''.join(chunks), content)
+            self.assertFalse(write_content(outputfile, iter(chunks)))
+            self.assertTrue(write_content(outputfile, iter(chunks[:-1])))
+            self.assertTrue(write_content(outputfile, iter(chunks)))
+            stream = io.StringIO()
+            gf.write_stream(stream, date='01-01-1970')
+            self.assertEqual(stream.getvalue(), content)
+            stream = io.BytesIO()
+            write_stream(stream, iter(chunks))
+            self.assertEqual(stream.getvalue(), content.encode('utf-8'))
+            self.assertEqual(
+                self.socket_received(
+                    lambda sock: write_stream(sock, iter(chunks)),
+                ),
+                content.encode('utf-8'),
+            )
+
+    def socket_received(self, send):
+        """ Call `send(sock)` with one end of a socket pair, and return the
+            bytes received on the other end.
+        """
+        sender, receiver = socket.socketpair()
+        received = []
+
+        def receive():
+            with receiver:
+                while True:
+                    data = receiver.recv(65536)
+                    if not data:
+                        break
+                    received.append(data)
+
+        thread = threading.Thread(target=receive)
+        thread.start()
+        with sender:
+            send(sender)
+        thread.join()
+        return b''.join(received)
+
+    def parse_time(self, xml, streaming=True):
+        """ Return the best time for parsing glade xml with GladeFile. """
+        with tempfile.NamedTemporaryFile('w', suffix='.glade') as f:
+            f.write(xml)
+            f.flush()
+            return min(timeit.repeat(
+                lambda: GladeFile(f.name, streaming=streaming),
+                number=1,
+                repeat=3,
+            ))
+
 
 if __name__ == '__main__':
     sys.exit(unittest.main(argv=sys.argv))